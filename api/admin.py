@@ -0,0 +1,32 @@
+import os
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+
+from auth import get_current_user
+from models import UserInDB
+from slow_queries import slow_query_recorder
+
+# Comma-separated auth_ids allowed to use the admin endpoints
+ADMIN_AUTH_IDS = {auth_id.strip() for auth_id in os.environ.get("ADMIN_AUTH_IDS", "").split(",") if auth_id.strip()}
+
+router = APIRouter()
+
+async def get_admin_user(current_user: UserInDB = Depends(get_current_user)) -> UserInDB:
+    if current_user.auth_id not in ADMIN_AUTH_IDS:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin access required"
+        )
+    return current_user
+
+@router.get("/slow-queries")
+async def get_slow_queries(
+    limit: Optional[int] = Query(None, ge=1),
+    admin_user: UserInDB = Depends(get_admin_user)
+):
+    """The most recent MongoDB commands over the slow query threshold, newest first"""
+    return {
+        **slow_query_recorder.stats(),
+        "entries": slow_query_recorder.recent(limit)
+    }
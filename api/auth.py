@@ -1,98 +1,116 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-import httpx
 from jose import jwt
+from typing import Optional
+import base64
+import binascii
+import hashlib
+import hmac
 import os
-from pymongo import MongoClient
-from models import UserCreate, UserInDB, UserResponse
+import secrets
+import time
+from models import UserCreate, UserInDB, UserRelationships, UserResponse
+from jwks import JWKSCache
+from token_cache import token_cache
+from token_verifier import token_verifier
+from usernames import username_cache
+from username_index import username_index
+from events import event_hub
+from repository import FriendshipsRepository, UsersRepository
+from database import get_friendships_repository, get_users_repository
 from datetime import datetime
 from utils.logging import logger, format_struct_log
 import traceback
 
 router = APIRouter()
 security = HTTPBearer()
-
-# MongoDB connection
-MONGODB_URI = os.environ.get("MONGODB_URI")
-client = MongoClient(MONGODB_URI)
-db = client.scorer
-users_collection = db.users
+optional_security = HTTPBearer(auto_error=False)
 
 # Auth0 configuration
 AUTH0_DOMAIN = os.environ.get("AUTH0_DOMAIN")
 AUTH0_AUDIENCE = os.environ.get("AUTH0_AUDIENCE")
 AUTH0_ALGORITHMS = ["RS256"]
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+# Signing keys are cached in-process instead of being downloaded on every request
+jwks_cache = JWKSCache(f"https://{AUTH0_DOMAIN}/.well-known/jwks.json")
+
+# Short-lived tickets for EventSource, which can't send an Authorization header.
+# Set the secret explicitly when running several workers so any of them accepts a ticket
+EVENTS_TICKET_SECRET = os.environ.get("EVENTS_TICKET_SECRET") or secrets.token_hex(32)
+EVENTS_TICKET_TTL = int(os.environ.get("EVENTS_TICKET_TTL", 60))
+
+async def verify_token(token: str) -> dict:
+    """Verify the token signature and claims, returning the decoded payload"""
+    # Verify token
+    unverified_header = jwt.get_unverified_header(token)
+    # logger.debug(f"Token header: {format_struct_log(unverified_header)}")
+
+    # Get Auth0 public key from the JWKS cache
+    rsa_key = await jwks_cache.get_key(unverified_header.get("kid"))
+
+    if not rsa_key:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Unable to find appropriate key"
+        )
+
+    try:
+        # This will raise an exception if the token is invalid.
+        # The RSA work runs inline, or on the verifier pool when AUTH_VERIFY_MODE asks for one
+        payload = await token_verifier.decode(
+            token,
+            rsa_key,
+            algorithms=AUTH0_ALGORITHMS,
+            audience=AUTH0_AUDIENCE,
+            issuer=f"https://{AUTH0_DOMAIN}/"
+        )
+        # logger.debug("Token successfully verified")
+        # logger.debug(f"Payload: {payload}")
+
+    except jwt.ExpiredSignatureError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token has expired"
+        )
+    except jwt.JWTClaimsError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid claims. Please check the audience and issuer."
+        )
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=f"Unable to parse authentication token: {str(e)}"
+        )
+
+    return payload
+
+# The fields of UserInDB, all an authenticated request needs from the user document
+CURRENT_USER_PROJECTION = {"_id": 0, "auth_id": 1, "username": 1, "email": 1, "created_at": 1}
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    users_repository: UsersRepository = Depends(get_users_repository)
+):
     # logger.debug("Authenticating user")
     token = credentials.credentials
     # logger.debug(f"Token received: {token[:20]}...")
     
     try:
-        # Get Auth0 public key
-        jwks_url = f"https://{AUTH0_DOMAIN}/.well-known/jwks.json"
-        # logger.debug(f"Fetching JWKS from: {jwks_url}")
-        # logger.debug(f"Auth0 config - Domain: {AUTH0_DOMAIN}, Audience: {AUTH0_AUDIENCE}")
-        
-        async with httpx.AsyncClient() as client:
-            jwks_response = await client.get(jwks_url)
-            # logger.debug(f"JWKS status code: {jwks_response.status_code}")
-            jwks = jwks_response.json()
-            # logger.debug(f"JWKS response: {format_struct_log(jwks)}")
-
-        # Verify token
-        unverified_header = jwt.get_unverified_header(token)
-        # logger.debug(f"Token header: {format_struct_log(unverified_header)}")
-        
-        rsa_key = {}
-        for key in jwks["keys"]:
-            if key["kid"] == unverified_header["kid"]:
-                rsa_key = {
-                    "kty": key["kty"],
-                    "kid": key["kid"],
-                    "use": key["use"],
-                    "n": key["n"],
-                    "e": key["e"]
-                }
-                break
-
-        if not rsa_key:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Unable to find appropriate key"
-            )
-
-        try:
-            # This will raise an exception if the token is invalid
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=AUTH0_ALGORITHMS,
-                audience=AUTH0_AUDIENCE,
-                issuer=f"https://{AUTH0_DOMAIN}/"
-            )
-            # logger.debug("Token successfully verified")
-            # logger.debug(f"Payload: {payload}")
+        # Repeated tokens are served from the verified-token cache
+        cache_key = token_cache.key_for(token)
+        cached_user = token_cache.get_user(cache_key)
+        if cached_user is not None:
+            return cached_user
 
-        except jwt.ExpiredSignatureError:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token has expired"
-            )
-        except jwt.JWTClaimsError:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid claims. Please check the audience and issuer."
-            )
-        except Exception as e:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail=f"Unable to parse authentication token: {str(e)}"
-            )
+        payload = token_cache.get_claims(cache_key)
+        if payload is None:
+            payload = await verify_token(token)
+            token_cache.put_claims(cache_key, payload)
 
         # Get user from database using auth_id from token
         auth_id = payload['sub']
-        user = users_collection.find_one({"auth_id": auth_id}, {"_id": 0})
+        user = await users_repository.get(auth_id, CURRENT_USER_PROJECTION)
         
         if not user:
             # logger.debug(f"Creating temporary user for auth_id: {auth_id}")
@@ -100,13 +118,10 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             user = {
                 "auth_id": auth_id,
                 "email": payload.get('email', ''),
-                "friends": [],
-                "pending_sent_requests": [],
-                "pending_received_requests": [],
                 "username": None,
                 "created_at": datetime.utcnow()
             }
-            result = users_collection.insert_one(user)
+            user = await users_repository.insert_if_missing(user, CURRENT_USER_PROJECTION)
             # logger.debug(f"Created temporary user: {format_struct_log(user)}")
         
         if not user.get("username"):
@@ -115,7 +130,9 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
                 detail="User not registered"
             )
         
-        return UserInDB(**user)
+        current_user = UserInDB(**user)
+        token_cache.put_user(cache_key, current_user)
+        return current_user
 
     except HTTPException as he:
         logger.warning(f"Authentication failed: {he.detail}")
@@ -128,12 +145,68 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
             detail=f"Invalid authentication credentials: {str(e)}"
         )
 
+async def get_current_relationships(
+    current_user: UserInDB = Depends(get_current_user),
+    friendships_repository: FriendshipsRepository = Depends(get_friendships_repository)
+) -> UserRelationships:
+    """Friends and pending requests of the current user, for the endpoints that need them"""
+    relationships = await friendships_repository.relationships(current_user.auth_id)
+    return UserRelationships(
+        friends=set(relationships["friends"]),
+        sent=set(relationships["sent"]),
+        received=set(relationships["received"])
+    )
+
+def _ticket_signature(payload: str) -> str:
+    return hmac.new(EVENTS_TICKET_SECRET.encode(), payload.encode(), hashlib.sha256).hexdigest()
+
+def issue_stream_ticket(auth_id: str) -> str:
+    """An opaque ticket standing for `auth_id` for the next EVENTS_TICKET_TTL seconds"""
+    payload = f"{auth_id}|{int(time.time()) + EVENTS_TICKET_TTL}"
+    return base64.urlsafe_b64encode(f"{payload}|{_ticket_signature(payload)}".encode()).decode()
+
+def verify_stream_ticket(ticket: str) -> Optional[str]:
+    """The auth_id of a valid, unexpired ticket, None otherwise"""
+    try:
+        # auth_ids like auth0|123 contain the separator, so split from the right
+        auth_id, expires_at, signature = base64.urlsafe_b64decode(ticket.encode()).decode().rsplit("|", 2)
+        expires_at = int(expires_at)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+    if not hmac.compare_digest(signature, _ticket_signature(f"{auth_id}|{expires_at}")):
+        return None
+    if expires_at < time.time():
+        return None
+    return auth_id
+
+async def get_stream_user_id(
+    ticket: Optional[str] = Query(None, description="Ticket from POST /api/matches/events/ticket, for EventSource clients"),
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    users_repository: UsersRepository = Depends(get_users_repository)
+) -> str:
+    """The auth_id of an event stream client, from a stream ticket or a bearer token"""
+    if ticket is not None:
+        auth_id = verify_stream_ticket(ticket)
+        if auth_id is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired stream ticket"
+            )
+        return auth_id
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated"
+        )
+    current_user = await get_current_user(credentials, users_repository)
+    return current_user.auth_id
+
 @router.post("/register", response_model=UserResponse)
-async def register_user(user_data: UserCreate):
+async def register_user(user_data: UserCreate, users_repository: UsersRepository = Depends(get_users_repository)):
     logger.debug(f"Registration attempt for auth_id: {user_data.auth_id}")
         
     # Check if username is already taken
-    existing_username = users_collection.find_one({"username": user_data.username})
+    existing_username = await users_repository.get_by_username(user_data.username)
     if existing_username:
         logger.warning(f"Username '{user_data.username}' is already taken")
         raise HTTPException(
@@ -142,7 +215,7 @@ async def register_user(user_data: UserCreate):
         )
     
     # Check if user already exists with this auth_id
-    existing_user = users_collection.find_one({"auth_id": user_data.auth_id})
+    existing_user = await users_repository.get(user_data.auth_id)
     logger.debug(f"Existing user found: {format_struct_log(existing_user)}")
     
     if existing_user:
@@ -154,17 +227,14 @@ async def register_user(user_data: UserCreate):
         if not existing_user.get("username"):
             logger.info(f"Updating temporary user with username: {user_data.username}")
             now = datetime.utcnow()
-            update_result = users_collection.update_one(
-                {"_id": existing_user["_id"]},
-                {"$set": {
-                    "username": user_data.username,
-                    "created_at": now
-                }}
-            )
-            logger.debug(f"Update result: {update_result.modified_count} documents modified")
+            modified_count = await users_repository.set_username(user_data.auth_id, user_data.username, now)
+            logger.debug(f"Update result: {modified_count} documents modified")
+            token_cache.invalidate_user(user_data.auth_id)
+            username_cache.invalidate(user_data.auth_id)
+            username_index.add(user_data.auth_id, user_data.username)
             
             # Fetch the updated user to verify changes
-            updated_user = users_collection.find_one({"_id": existing_user["_id"]})
+            updated_user = await users_repository.get(user_data.auth_id)
             logger.debug(f"Updated user: {format_struct_log(updated_user)}")
             
             existing_user["username"] = user_data.username
@@ -174,9 +244,6 @@ async def register_user(user_data: UserCreate):
                 auth_id=str(existing_user["auth_id"]),
                 username=existing_user["username"],
                 email=existing_user["email"],
-                friends=existing_user.get("friends", []),
-                pending_sent_requests=existing_user.get("pending_sent_requests", []),
-                pending_received_requests=existing_user.get("pending_received_requests", []),
                 created_at=existing_user["created_at"]
             )
         else:
@@ -192,13 +259,13 @@ async def register_user(user_data: UserCreate):
         "auth_id": user_data.auth_id,
         "username": user_data.username,
         "email": user_data.email,
-        "friends": [],
-        "pending_sent_requests": [],
-        "pending_received_requests": [],
         "created_at": now
     }
     
-    result = users_collection.insert_one(user)
+    await users_repository.insert(user)
+    token_cache.invalidate_user(user_data.auth_id)
+    username_cache.invalidate(user_data.auth_id)
+    username_index.add(user_data.auth_id, user_data.username)
     
     return UserResponse(
         **user
@@ -209,13 +276,17 @@ async def get_user_profile(current_user: UserInDB = Depends(get_current_user)):
     return UserResponse(**current_user.dict()) 
 
 @router.get("/health", response_model=dict)
-async def auth_health_check():
+async def auth_health_check(users_repository: UsersRepository = Depends(get_users_repository)):
     try:
         # Test MongoDB connection
-        db_status = "connected" if users_collection.find_one({}, {"_id": 1}) is not None else "no data"
+        db_status = "connected" if await users_repository.ping() else "no data"
         return {
             "status": "ok",
             "mongodb": db_status,
+            "token_cache": token_cache.stats(),
+            "username_cache": username_cache.stats(),
+            "username_index": username_index.stats(),
+            "events": event_hub.stats(),
             "timestamp": datetime.utcnow().isoformat()
         }
     except Exception as e:
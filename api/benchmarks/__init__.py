@@ -0,0 +1,75 @@
+"""Micro-benchmarks for the hot paths of the API.
+
+Each module is a script run from the api/ directory, e.g.
+`python -m benchmarks.token_verify`. Benchmarks that need MongoDB read
+MONGODB_URI and work in a throwaway `scorer_bench` database.
+"""
+import math
+import os
+import time
+from typing import Awaitable, Callable, Iterable, List
+
+import bson
+from pymongo import AsyncMongoClient
+
+BENCH_DB_NAME = os.environ.get("BENCH_DB_NAME", "scorer_bench")
+
+
+def open_database():
+    """A client on MONGODB_URI and its benchmark database, never the app's own"""
+    client = AsyncMongoClient(os.environ.get("MONGODB_URI", "mongodb://localhost:27017"))
+    return client, client[BENCH_DB_NAME]
+
+
+def bson_size(documents: Iterable[dict]) -> int:
+    """Bytes the documents take on the wire"""
+    return sum(len(bson.encode(document)) for document in documents)
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    """Nearest-rank percentile of `samples`"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def latency_row(samples: List[float]) -> dict:
+    return {
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 2)
+    }
+
+
+async def timed(run: Callable[[], Awaitable], runs: int) -> List[float]:
+    """Wall time in seconds of each of `runs` awaited calls of `run`"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        await run()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+class Timer:
+    """Context manager recording elapsed wall time in seconds"""
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+
+
+def report(title: str, rows: List[dict]):
+    """Print rows of results as an aligned table"""
+    print(f"\n{title}")
+    if not rows:
+        return
+    columns = list(rows[0])
+    widths = [max(len(column), *(len(str(row[column])) for row in rows)) for column in columns]
+    print("  ".join(column.ljust(width) for column, width in zip(columns, widths)))
+    for row in rows:
+        print("  ".join(str(row[column]).ljust(width) for column, width in zip(columns, widths)))
@@ -0,0 +1,84 @@
+"""Compare the leaderboard engines on generated match histories.
+
+Usage: python -m benchmarks.leaderboard [--matches 10000 1000000] [--users N] [--friends N] [--runs N]
+
+For every history size the matches collection of the benchmark database is
+refilled and the rollups rebuilt, then each engine computes the same
+friends' leaderboard:
+
+- per-document: the old loop, every whole match document pulled into Python
+- pipeline: leaderboard_pipeline, only the ranked rows come back
+- rollups: sum of the precomputed user_stats rollups
+"""
+import argparse
+import asyncio
+
+from benchmarks import Timer, bson_size, latency_row, open_database, report, timed
+from indexes import ensure_indexes
+from leaderboard import leaderboard_pipeline
+from repository import MatchesRepository, StatsRepository
+from rollups import rebuild, sum_rollups
+from tests.support import generate_matches, per_document_leaderboard
+
+INSERT_BATCH = 10000
+
+
+async def seed(db, count: int, users):
+    await db.matches.drop()
+    await db.user_stats.drop()
+    await ensure_indexes(db)
+    with Timer() as timer:
+        for batch, start in enumerate(range(0, count, INSERT_BATCH)):
+            await db.matches.insert_many(generate_matches(min(INSERT_BATCH, count - start), users, seed=batch))
+        await rebuild(db)
+    print(f"Seeded {count} matches and rebuilt rollups in {timer.elapsed:.1f}s")
+
+
+async def main(args):
+    client, db = open_database()
+    users = [f"user{i}" for i in range(args.users)]
+    friends = users[:args.friends]
+    matches_repository, stats_repository = MatchesRepository(db), StatsRepository(db)
+    transferred = {}
+
+    async def per_document():
+        cursor = db.matches.find({"players.user_id": {"$in": friends}, "is_validated": True}, {"_id": 0})
+        matches = await cursor.to_list(None)
+        transferred["per-document"] = bson_size(matches)
+        return per_document_leaderboard(matches, friends)
+
+    async def pipeline():
+        rows = await matches_repository.aggregate(leaderboard_pipeline(friends))
+        transferred["pipeline"] = bson_size(rows)
+        return rows
+
+    async def rollups():
+        rows = await stats_repository.find_for_users(friends)
+        transferred["rollups"] = bson_size(rows)
+        return sum_rollups(rows)
+
+    rows = []
+    try:
+        for count in args.matches:
+            await seed(db, count, users)
+            for name, run in (("per-document", per_document), ("pipeline", pipeline), ("rollups", rollups)):
+                samples = await timed(run, args.runs)
+                rows.append({
+                    "matches": count,
+                    "engine": name,
+                    **latency_row(samples),
+                    "transfer_kb": round(transferred[name] / 1024, 1)
+                })
+    finally:
+        await client.drop_database(db.name)
+        await client.close()
+    report(f"Leaderboard of {args.friends} friends among {args.users} users, {args.runs} runs", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--matches", type=int, nargs="+", default=[10000, 1000000])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--friends", type=int, default=50)
+    parser.add_argument("--runs", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
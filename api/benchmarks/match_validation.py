@@ -0,0 +1,107 @@
+"""Compare the old read/check/write match validation with the single conditional update.
+
+Usage: python -m benchmarks.match_validation [--matches N] [--users N]
+
+Every player of each generated match validates it twice at the same time,
+the way double-submitted requests arrive, through:
+
+- read-check-write: the old sequence, get, check, $push, get again,
+  set is_validated and claim the stats
+- conditional update: MatchesRepository.validate, one find_one_and_update
+
+Reports the latency of a single validation and of each match's burst, and
+how many validations ended up stored more than once.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime
+
+from benchmarks import Timer, latency_row, open_database, report
+from indexes import ensure_indexes
+from repository import MatchesRepository, StatsRepository
+from rollups import record_match, record_validated_match
+from tests.support import generate_matches
+
+
+async def read_check_write(matches_repository: MatchesRepository, stats_repository: StatsRepository, match_id: str, user_id: str) -> bool:
+    match = await matches_repository.get(match_id)
+    if not match or not any(player["user_id"] == user_id for player in match["players"]):
+        return False
+    if any(validation["user_id"] == user_id for validation in match["validations"]):
+        return False
+    await matches_repository.push_validation(match_id, {"user_id": user_id, "timestamp": datetime.now()})
+    updated_match = await matches_repository.get(match_id)
+    if len(updated_match["validations"]) >= len(updated_match["players"]) / 2:
+        await matches_repository.collection.update_one({"match_id": match_id}, {"$set": {"is_validated": True}})
+        await record_validated_match(match_id, matches_repository, stats_repository)
+    return True
+
+
+async def conditional_update(matches_repository: MatchesRepository, stats_repository: StatsRepository, match_id: str, user_id: str) -> bool:
+    previous_match = await matches_repository.validate(match_id, {"user_id": user_id, "timestamp": datetime.now()})
+    if previous_match is None:
+        # The endpoint reads the match once more to pick the error status
+        await matches_repository.get(match_id)
+        return False
+    validations_count = len(previous_match.get("validations", [])) + 1
+    is_validated = previous_match.get("is_validated") or validations_count >= len(previous_match["players"]) / 2
+    if is_validated and not previous_match.get("stats_applied"):
+        await record_match(previous_match, stats_repository)
+    return True
+
+
+async def main(args):
+    client, db = open_database()
+    matches_repository, stats_repository = MatchesRepository(db), StatsRepository(db)
+    users = [f"user{i}" for i in range(args.users)]
+
+    async def timed_validation(validate, match_id: str, user_id: str, samples: list):
+        started = time.perf_counter()
+        await validate(matches_repository, stats_repository, match_id, user_id)
+        samples.append(time.perf_counter() - started)
+
+    rows = []
+    try:
+        for name, validate in (("read-check-write", read_check_write), ("conditional update", conditional_update)):
+            await db.matches.drop()
+            await db.user_stats.drop()
+            await ensure_indexes(db)
+            matches = generate_matches(args.matches, users, validated_share=0)
+            await db.matches.insert_many(matches)
+
+            samples, bursts = [], []
+            with Timer() as timer:
+                for match in matches:
+                    started = time.perf_counter()
+                    await asyncio.gather(*(
+                        timed_validation(validate, match["match_id"], player["user_id"], samples)
+                        for player in match["players"] for _ in range(2)
+                    ))
+                    bursts.append(time.perf_counter() - started)
+
+            duplicates = 0
+            async for match in db.matches.find({}, {"_id": 0, "validations.user_id": 1}):
+                user_ids = [validation["user_id"] for validation in match["validations"]]
+                duplicates += len(user_ids) - len(set(user_ids))
+            single, burst = latency_row(samples), latency_row(bursts)
+            rows.append({
+                "path": name,
+                "validation_p50_ms": single["p50_ms"],
+                "validation_p99_ms": single["p99_ms"],
+                "burst_p50_ms": burst["p50_ms"],
+                "burst_p99_ms": burst["p99_ms"],
+                "total_s": round(timer.elapsed, 2),
+                "duplicates": duplicates
+            })
+    finally:
+        await client.drop_database(db.name)
+        await client.close()
+    report(f"Two concurrent validations per player of {args.matches} matches", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--matches", type=int, default=200)
+    parser.add_argument("--users", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
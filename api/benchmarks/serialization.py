@@ -0,0 +1,83 @@
+"""Compare the pydantic response path of the list endpoints with the orjson one.
+
+Usage: python -m benchmarks.serialization [--sizes 50 200 500] [--runs N]
+
+Runs without MongoDB, on generated documents enriched with usernames the way
+/my-matches and /friends/list return them:
+
+- pydantic: a model per row, then FastAPI's response_model validation,
+  jsonable_encoder and the stdlib JSON encoder
+- orjson: shape_many and ORJSONResponse
+
+Reports the median encode time and the peak memory allocated per response.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import tracemalloc
+from typing import List
+
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from benchmarks import report
+from models import MatchResponse, UserResponse
+from responses import shape_many
+from tests.support import enriched_matches, generate_users
+
+
+LOOP = asyncio.new_event_loop()
+RESPONSE_FIELDS = {model: create_response_field(name="response", type_=List[model]) for model in (MatchResponse, UserResponse)}
+
+
+def pydantic_path(model, documents: List[dict]) -> bytes:
+    """What a route returning models with response_model=List[model] did per request"""
+    items = [model(**document) for document in documents]
+    content = LOOP.run_until_complete(serialize_response(field=RESPONSE_FIELDS[model], response_content=items))
+    return JSONResponse(content).body
+
+
+def orjson_path(model, documents: List[dict]) -> bytes:
+    return ORJSONResponse(shape_many(model, documents)).body
+
+
+def measure(encode, model, documents: List[dict], runs: int) -> dict:
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        body = encode(model, documents)
+        samples.append(time.perf_counter() - started)
+    # Allocations are traced in a separate run, tracing slows every allocation down
+    tracemalloc.start()
+    encode(model, documents)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "median_ms": round(statistics.median(samples) * 1000, 2),
+        "peak_kb": round(peak / 1024, 1),
+        "body_kb": round(len(body) / 1024, 1)
+    }
+
+
+def main(args):
+    rows = []
+    for model, generate in ((MatchResponse, enriched_matches), (UserResponse, generate_users)):
+        for size in args.sizes:
+            documents = generate(size)
+            for name, encode in (("pydantic", pydantic_path), ("orjson", orjson_path)):
+                rows.append({
+                    "model": model.__name__,
+                    "rows": size,
+                    "path": name,
+                    **measure(encode, model, documents, args.runs)
+                })
+    report(f"List response encoding, median of {args.runs} runs", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[50, 200, 500])
+    parser.add_argument("--runs", type=int, default=50)
+    main(parser.parse_args())
@@ -0,0 +1,93 @@
+"""Compare per-request friend-of-friend aggregation with the precomputed suggestions.
+
+Usage: python -m benchmarks.suggestions [--users 100000] [--friends 20] [--runs N]
+
+A random friend graph is written to the friendships collection of the
+benchmark database (both edges of every friendship) and the suggestions are
+rebuilt, then the top five candidates of sampled users are computed by:
+
+- aggregation: the old $match/$group/$sort over the friends' edges
+- precomputed: SuggestionsRepository.find_for_user, one indexed read
+"""
+import argparse
+import asyncio
+import itertools
+import random
+
+from benchmarks import Timer, latency_row, open_database, report, timed
+from indexes import ensure_indexes
+from repository import FriendshipsRepository, SuggestionsRepository
+from suggestions import rebuild
+
+INSERT_BATCH = 10000
+
+
+def friend_pairs(users: int, friends: int, seed: int = 0):
+    """About `friends` random friends per user, each pair once"""
+    rng = random.Random(seed)
+    pairs = set()
+    for user in range(users):
+        for other in rng.sample(range(users), friends // 2 + 1):
+            if other != user:
+                pairs.add((min(user, other), max(user, other)))
+    return pairs
+
+
+async def seed(db, users: int, friends: int):
+    await db.friendships.drop()
+    await db.friend_suggestions.drop()
+    await ensure_indexes(db)
+    with Timer() as timer:
+        edges = []
+        for user, other in friend_pairs(users, friends):
+            edges.append({"user_id": f"user{user}", "other_id": f"user{other}", "state": "friends"})
+            edges.append({"user_id": f"user{other}", "other_id": f"user{user}", "state": "friends"})
+            if len(edges) >= INSERT_BATCH:
+                await db.friendships.insert_many(edges)
+                edges = []
+        if edges:
+            await db.friendships.insert_many(edges)
+        await rebuild(db)
+    print(f"Seeded {users} users and rebuilt suggestions in {timer.elapsed:.1f}s")
+
+
+async def main(args):
+    client, db = open_database()
+    friendships_repository, suggestions_repository = FriendshipsRepository(db), SuggestionsRepository(db)
+    # Both engines answer for the same sampled users, in the same order
+    sampled = random.Random(1).choices([f"user{i}" for i in range(args.users)], k=args.runs)
+    next_user = {"aggregation": itertools.cycle(sampled), "precomputed": itertools.cycle(sampled)}
+
+    async def aggregation():
+        user_id = next(next_user["aggregation"])
+        friend_ids = await friendships_repository.ids(user_id, "friends")
+        cursor = await db.friendships.aggregate([
+            {"$match": {"user_id": {"$in": friend_ids}, "state": "friends", "other_id": {"$ne": user_id}}},
+            {"$group": {"_id": "$other_id", "count": {"$sum": 1}}},
+            {"$sort": {"count": -1}},
+            {"$limit": 5}
+        ])
+        return await cursor.to_list(None)
+
+    async def precomputed():
+        user_id = next(next_user["precomputed"])
+        friend_ids = await friendships_repository.ids(user_id, "friends")
+        return await suggestions_repository.find_for_user(user_id, {user_id, *friend_ids}, limit=5)
+
+    rows = []
+    try:
+        await seed(db, args.users, args.friends)
+        for name, run in (("aggregation", aggregation), ("precomputed", precomputed)):
+            rows.append({"engine": name, **latency_row(await timed(run, args.runs))})
+    finally:
+        await client.drop_database(db.name)
+        await client.close()
+    report(f"Top 5 suggestions among {args.users} users with ~{args.friends} friends each, {args.runs} runs", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--friends", type=int, default=20)
+    parser.add_argument("--runs", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
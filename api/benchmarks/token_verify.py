@@ -0,0 +1,94 @@
+"""Compare inline and pooled RS256 token verification.
+
+Usage: python -m benchmarks.token_verify [--tokens N] [--clients 50 200] [--workers N]
+
+Every client verifies tokens back to back through `TokenVerifier.decode`,
+the same call `verify_token` makes, and the script reports tokens/sec and
+the p50/p99 latency a request waits for its verification.
+"""
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from benchmarks import Timer, percentile, report
+from token_verifier import VERIFY_MODES, TokenVerifier
+
+AUDIENCE = "https://scorer.bench/api"
+ISSUER = "https://scorer-bench.auth0.com/"
+KID = "bench-key"
+
+
+def signing_material():
+    """A fresh RS256 key pair as (private PEM, public JWK)"""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption()
+    )
+    public_jwk = jwk.construct(private_pem, algorithm="RS256").public_key().to_dict()
+    public_jwk.update({"kid": KID, "use": "sig"})
+    return private_pem, public_jwk
+
+
+def make_tokens(private_pem: bytes, count: int):
+    expires = datetime.utcnow() + timedelta(hours=1)
+    return [
+        jwt.encode(
+            {"sub": f"auth0|bench{i}", "aud": AUDIENCE, "iss": ISSUER, "exp": expires},
+            private_pem,
+            algorithm="RS256",
+            headers={"kid": KID}
+        )
+        for i in range(count)
+    ]
+
+
+async def run(verifier: TokenVerifier, tokens, rsa_key: dict, clients: int):
+    latencies = []
+    queue = iter(tokens)
+
+    async def client():
+        for token in queue:
+            started = time.perf_counter()
+            # Yield like a request does before verifying, so inline latency
+            # includes the time spent waiting behind other clients' verification
+            await asyncio.sleep(0)
+            await verifier.decode(token, rsa_key, ["RS256"], AUDIENCE, ISSUER)
+            latencies.append(time.perf_counter() - started)
+
+    with Timer() as timer:
+        await asyncio.gather(*(client() for _ in range(clients)))
+    return {
+        "tokens/s": round(len(tokens) / timer.elapsed),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+
+async def main(args):
+    private_pem, rsa_key = signing_material()
+    tokens = make_tokens(private_pem, args.tokens)
+    rows = []
+    for mode in VERIFY_MODES:
+        verifier = TokenVerifier(mode, args.workers)
+        verifier.start()
+        # Warm up the pool and the per-process parsed key
+        await run(verifier, tokens[:args.workers * 4], rsa_key, args.workers)
+        for clients in args.clients:
+            rows.append({"mode": mode, "clients": clients, **await run(verifier, tokens, rsa_key, clients)})
+        verifier.shutdown()
+    report(f"RS256 verification, {args.tokens} tokens, {args.workers} workers", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=5000)
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 200])
+    parser.add_argument("--workers", type=int, default=4)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,86 @@
+"""Compare the old regex username search with the indexed prefix range.
+
+Usage: python -m benchmarks.user_search [--users 1000000] [--runs N]
+
+The users collection of the benchmark database is filled with generated
+usernames and indexed, then /friends/search's query runs for sampled
+prefixes of one to four characters:
+
+- regex: the old case-insensitive {"$regex": "^q", "$options": "i"} find
+- prefix range: UsersRepository.search_by_username on username_key
+"""
+import argparse
+import asyncio
+import itertools
+import random
+import string
+
+from benchmarks import Timer, latency_row, open_database, report, timed
+from indexes import ensure_indexes
+from repository import UsersRepository
+from utils.search import username_key
+
+INSERT_BATCH = 10000
+ALPHABET = string.ascii_letters + string.digits + "_"
+
+
+def generate_usernames(count: int, seed: int = 0):
+    rng = random.Random(seed)
+    for index in range(count):
+        yield "".join(rng.choices(ALPHABET, k=rng.randint(4, 12))) + str(index)
+
+
+async def seed(db, users: int):
+    await db.users.drop()
+    await db.friendships.drop()
+    await ensure_indexes(db)
+    with Timer() as timer:
+        batch = []
+        for index, username in enumerate(generate_usernames(users)):
+            batch.append({
+                "auth_id": f"user{index}",
+                "username": username,
+                "username_key": username_key(username),
+                "email": f"user{index}@scorer.test"
+            })
+            if len(batch) >= INSERT_BATCH:
+                await db.users.insert_many(batch)
+                batch = []
+        if batch:
+            await db.users.insert_many(batch)
+    print(f"Seeded {users} users in {timer.elapsed:.1f}s")
+
+
+async def main(args):
+    client, db = open_database()
+    users_repository = UsersRepository(db)
+    rng = random.Random(1)
+
+    async def regex(query: str):
+        search_query = {"username": {"$regex": f"^{query}", "$options": "i"}, "auth_id": {"$ne": "user0"}}
+        return await db.users.find(search_query, {"_id": 0}).limit(10).to_list(None)
+
+    async def prefix_range(query: str):
+        return await users_repository.search_by_username(query, "user0", limit=10)
+
+    rows = []
+    try:
+        await seed(db, args.users)
+        for length in (1, 2, 3, 4):
+            # Both engines search the same prefixes, in the same order
+            queries = ["".join(rng.choices(ALPHABET, k=length)) for _ in range(args.runs)]
+            for name, search in (("regex", regex), ("prefix range", prefix_range)):
+                next_query = itertools.cycle(queries)
+                samples = await timed(lambda: search(next(next_query)), args.runs)
+                rows.append({"prefix": length, "engine": name, **latency_row(samples)})
+    finally:
+        await client.drop_database(db.name)
+        await client.close()
+    report(f"Username search among {args.users} users, {args.runs} queries per prefix length", rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=1000000)
+    parser.add_argument("--runs", type=int, default=100)
+    asyncio.run(main(parser.parse_args()))
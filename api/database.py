@@ -0,0 +1,119 @@
+import os
+from typing import Optional
+
+from pymongo import AsyncMongoClient
+
+from metrics import command_metrics
+from slow_queries import slow_query_recorder
+from repository import FriendshipsRepository, InboxRepository, MatchesRepository, StatsRepository, SuggestionsRepository, UsersRepository
+from utils.logging import logger
+
+# MongoDB connection and pool configuration
+MONGODB_URI = os.environ.get("MONGODB_URI")
+MONGODB_DB_NAME = os.environ.get("MONGODB_DB_NAME", "scorer")
+MONGODB_MAX_POOL_SIZE = int(os.environ.get("MONGODB_MAX_POOL_SIZE", 50))
+MONGODB_MIN_POOL_SIZE = int(os.environ.get("MONGODB_MIN_POOL_SIZE", 0))
+MONGODB_MAX_IDLE_TIME_MS = int(os.environ.get("MONGODB_MAX_IDLE_TIME_MS", 300000))
+MONGODB_CONNECT_TIMEOUT_MS = int(os.environ.get("MONGODB_CONNECT_TIMEOUT_MS", 5000))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGODB_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGODB_SOCKET_TIMEOUT_MS = int(os.environ.get("MONGODB_SOCKET_TIMEOUT_MS", 0))
+MONGODB_COMPRESSORS = os.environ.get("MONGODB_COMPRESSORS", "zstd,zlib")
+MONGODB_WRITE_CONCERN = os.environ.get("MONGODB_WRITE_CONCERN", "majority")
+
+
+class Database:
+    """The single MongoDB client of this worker and the repositories built on it"""
+
+    client: Optional[AsyncMongoClient] = None
+    db = None
+    users: Optional[UsersRepository] = None
+    matches: Optional[MatchesRepository] = None
+    stats: Optional[StatsRepository] = None
+    friendships: Optional[FriendshipsRepository] = None
+    inbox: Optional[InboxRepository] = None
+    suggestions: Optional[SuggestionsRepository] = None
+
+
+def client_options() -> dict:
+    write_concern = MONGODB_WRITE_CONCERN
+    options = {
+        "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+        "minPoolSize": MONGODB_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGODB_MAX_IDLE_TIME_MS,
+        "connectTimeoutMS": MONGODB_CONNECT_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        "w": int(write_concern) if write_concern.isdigit() else write_concern,
+    }
+    if MONGODB_SOCKET_TIMEOUT_MS:
+        options["socketTimeoutMS"] = MONGODB_SOCKET_TIMEOUT_MS
+    if MONGODB_COMPRESSORS:
+        options["compressors"] = MONGODB_COMPRESSORS
+    return options
+
+
+async def connect():
+    """Create the shared client, called once from the app startup"""
+    if Database.client is not None:
+        return
+    options = client_options()
+    # Command monitoring attributes every command to the request that issued it
+    Database.client = AsyncMongoClient(MONGODB_URI, event_listeners=[command_metrics, slow_query_recorder], **options)
+    # Slow commands are explained with the same client
+    slow_query_recorder.start(Database.client)
+    Database.db = Database.client[MONGODB_DB_NAME]
+    Database.users = UsersRepository(Database.db)
+    Database.matches = MatchesRepository(Database.db)
+    Database.stats = StatsRepository(Database.db)
+    Database.friendships = FriendshipsRepository(Database.db)
+    Database.inbox = InboxRepository(Database.db)
+    Database.suggestions = SuggestionsRepository(Database.db)
+    logger.info(f"MongoDB client ready: {', '.join(f'{key}={value}' for key, value in options.items())}")
+
+
+async def close():
+    if Database.client is not None:
+        await Database.client.close()
+    Database.client = None
+    Database.db = None
+    Database.users = None
+    Database.matches = None
+    Database.stats = None
+    Database.friendships = None
+    Database.inbox = None
+    Database.suggestions = None
+
+
+def get_database():
+    if Database.db is None:
+        raise RuntimeError("Database is not connected, call database.connect() first")
+    return Database.db
+
+
+def get_users_repository() -> UsersRepository:
+    get_database()
+    return Database.users
+
+
+def get_matches_repository() -> MatchesRepository:
+    get_database()
+    return Database.matches
+
+
+def get_stats_repository() -> StatsRepository:
+    get_database()
+    return Database.stats
+
+
+def get_friendships_repository() -> FriendshipsRepository:
+    get_database()
+    return Database.friendships
+
+
+def get_inbox_repository() -> InboxRepository:
+    get_database()
+    return Database.inbox
+
+
+def get_suggestions_repository() -> SuggestionsRepository:
+    get_database()
+    return Database.suggestions
@@ -0,0 +1,145 @@
+"""Push notifications of match events over Server-Sent Events.
+
+The hub fans events out to the SSE connections of their recipients in this
+worker. With EVENTS_SOURCE=local (the default) the match endpoints publish
+to it directly, which is enough for a single worker. With
+EVENTS_SOURCE=change_stream every worker derives the events from a MongoDB
+change stream on the matches collection instead, so a client connected to
+any worker hears about writes made on all of them. Change streams need a
+replica set, a local single-node one is enough for development.
+"""
+import asyncio
+import os
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from utils.logging import logger
+
+# Match events configuration
+EVENTS_SOURCE = os.environ.get("EVENTS_SOURCE", "local")
+EVENTS_QUEUE_SIZE = int(os.environ.get("EVENTS_QUEUE_SIZE", 100))
+EVENTS_HEARTBEAT_INTERVAL = float(os.environ.get("EVENTS_HEARTBEAT_INTERVAL", 15))
+EVENTS_RETRY_DELAY = float(os.environ.get("EVENTS_RETRY_DELAY", 5))
+
+VALIDATION_NEEDED = "validation_needed"
+MATCH_VALIDATED = "match_validated"
+
+
+def _summary(match: dict) -> dict:
+    return {
+        "match_id": match["match_id"],
+        "created_by": match["created_by"],
+        "date": match.get("date"),
+        "format": match.get("format")
+    }
+
+
+def validation_needed_events(match: dict) -> List[Tuple[List[str], dict]]:
+    """A new match needs the validation of its players, except whoever already validated it"""
+    validated = {validation.get("user_id") for validation in match.get("validations") or []}
+    recipients = [
+        player["user_id"] for player in match["players"]
+        if player["user_id"] != match["created_by"] and player["user_id"] not in validated
+    ]
+    return [(recipients, {"type": VALIDATION_NEEDED, **_summary(match)})]
+
+
+def match_validated_events(match: dict) -> List[Tuple[List[str], dict]]:
+    recipients = {player["user_id"] for player in match["players"]} | {match["created_by"]}
+    return [(list(recipients), {"type": MATCH_VALIDATED, **_summary(match)})]
+
+
+class EventHub:
+    """In-process pub/sub of match events, keyed by recipient auth_id.
+
+    Every SSE connection owns a bounded queue. A slow client loses its
+    oldest events rather than holding memory, and only needs to refetch
+    its list on the next event it does receive.
+    """
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = {}
+        self.published = 0
+        self.dropped = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def publish(self, recipients: Iterable[str], event: dict):
+        for user_id in recipients:
+            for queue in self._subscribers.get(user_id, ()):
+                if queue.full():
+                    queue.get_nowait()
+                    self.dropped += 1
+                queue.put_nowait(event)
+                self.published += 1
+
+    def publish_all(self, events: List[Tuple[List[str], dict]]):
+        for recipients, event in events:
+            self.publish(recipients, event)
+
+    def stats(self) -> dict:
+        return {
+            "source": EVENTS_SOURCE,
+            "connections": sum(len(queues) for queues in self._subscribers.values()),
+            "published": self.published,
+            "dropped": self.dropped
+        }
+
+    async def _watch(self, db):
+        """Publish the events of every worker's writes from the matches change stream"""
+        pipeline = [{"$match": {"$or": [
+            {"operationType": "insert"},
+            {"operationType": "update", "updateDescription.updatedFields.is_validated": True}
+        ]}}]
+        resume_after = None
+        while True:
+            try:
+                async with await db.matches.watch(pipeline, full_document="updateLookup", resume_after=resume_after) as stream:
+                    logger.info("Watching the matches change stream for events")
+                    async for change in stream:
+                        resume_after = stream.resume_token
+                        match = change.get("fullDocument")
+                        if not match:
+                            continue
+                        if change["operationType"] == "insert":
+                            self.publish_all(validation_needed_events(match))
+                        else:
+                            self.publish_all(match_validated_events(match))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Matches change stream failed, retrying in {EVENTS_RETRY_DELAY}s: {str(e)}")
+                await asyncio.sleep(EVENTS_RETRY_DELAY)
+
+    def start(self, db):
+        if EVENTS_SOURCE == "change_stream" and self._task is None:
+            self._task = asyncio.create_task(self._watch(db))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+event_hub = EventHub()
+
+
+def publish_events(events: List[Tuple[List[str], dict]]):
+    """Publish events of a write made by this worker, unless the change stream reports them"""
+    if EVENTS_SOURCE == "local":
+        event_hub.publish_all(events)
@@ -1,115 +1,109 @@
+from typing import Literal
+
 from fastapi import APIRouter, Depends, HTTPException, status
-from pymongo import MongoClient
-import os
-from models import UserInDB, UserResponse, FriendRequest
-from auth import get_current_user
+from models import UserInDB, UserRelationships, UserResponse, FriendRequest
+from auth import get_current_relationships, get_current_user
+from repository import FriendshipsRepository, SuggestionsRepository, UsersRepository
+from database import get_friendships_repository, get_suggestions_repository, get_users_repository
+from suggestions import record_friendship, record_unfriending
+from usernames import resolve_usernames
+from username_index import username_index
+from responses import fast_response, shape_many
 from utils.logging import logger, format_struct_log
 
 router = APIRouter()
 
-# MongoDB connection
-MONGODB_URI = os.environ.get("MONGODB_URI")
-client = MongoClient(MONGODB_URI)
-db = client.scorer
-users_collection = db.users
-
 @router.post("/request")
-async def send_friend_request(request: FriendRequest, current_user: UserInDB = Depends(get_current_user)):
+async def send_friend_request(
+    request: FriendRequest,
+    current_user: UserInDB = Depends(get_current_user),
+    users_repository: UsersRepository = Depends(get_users_repository),
+    friendships_repository: FriendshipsRepository = Depends(get_friendships_repository)
+):
     # Get friend auth_id from request
     friend_auth_id = request.user_id
     
     # Check if user exists
-    friend = users_collection.find_one({"auth_id": friend_auth_id}, {"_id": 0})
+    friend = await users_repository.get(friend_auth_id)
     if not friend:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
+    state = await friendships_repository.state_between(current_user.auth_id, friend_auth_id)
+    
     # Check if already friends
-    if friend_auth_id in current_user.friends:
+    if state == "friends":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Already friends with this user"
         )
     
     # Check if request already sent
-    if friend_auth_id in current_user.pending_sent_requests:
+    if state == "sent":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Friend request already sent"
         )
     
     # Check if request already received
-    if friend_auth_id in current_user.pending_received_requests:
+    if state == "received":
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="User has already sent you a friend request"
         )
     
     # Send the request
-    users_collection.update_one(
-        {"auth_id": current_user.auth_id},
-        {"$push": {"pending_sent_requests": friend_auth_id}}
-    )
-    
-    users_collection.update_one(
-        {"auth_id": friend_auth_id},
-        {"$push": {"pending_received_requests": current_user.auth_id}}
-    )
+    await friendships_repository.send_request(current_user.auth_id, friend_auth_id)
     
     return {"message": "Friend request sent"}
 
 @router.post("/accept")
-async def accept_friend_request(request: FriendRequest, current_user: UserInDB = Depends(get_current_user)):
+async def accept_friend_request(
+    request: FriendRequest,
+    current_user: UserInDB = Depends(get_current_user),
+    friendships_repository: FriendshipsRepository = Depends(get_friendships_repository),
+    suggestions_repository: SuggestionsRepository = Depends(get_suggestions_repository)
+):
     friend_auth_id = request.user_id
     
-    # Check if request exists
-    if friend_auth_id not in current_user.pending_received_requests:
+    # Accept the request, only if it exists
+    accepted = await friendships_repository.accept_request(current_user.auth_id, friend_auth_id)
+    if not accepted:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="No pending request from this user"
         )
     
-    # Accept the request
-    users_collection.update_one(
-        {"auth_id": current_user.auth_id},
-        {
-            "$pull": {"pending_received_requests": friend_auth_id},
-            "$push": {"friends": friend_auth_id}
-        }
-    )
-    
-    users_collection.update_one(
-        {"auth_id": friend_auth_id},
-        {
-            "$pull": {"pending_sent_requests": current_user.auth_id},
-            "$push": {"friends": current_user.auth_id}
-        }
-    )
+    # Their friends now have them as a mutual friend
+    await record_friendship(current_user.auth_id, friend_auth_id, friendships_repository, suggestions_repository)
     
     return {"message": "Friend request accepted"}
 
 @router.get("/list", response_model=list[UserResponse])
-async def get_friends_list(current_user: UserInDB = Depends(get_current_user)):
-    friends = users_collection.find({"auth_id": {"$in": current_user.friends}}, {"_id": 0})
+async def get_friends_list(
+    current_user: UserInDB = Depends(get_current_user),
+    users_repository: UsersRepository = Depends(get_users_repository),
+    friendships_repository: FriendshipsRepository = Depends(get_friendships_repository)
+):
+    friend_ids = await friendships_repository.ids(current_user.auth_id, "friends")
+    friends = await users_repository.get_many(friend_ids, {"_id": 0, "auth_id": 1, "username": 1, "created_at": 1})
     
-    user_responses = []
     for user in friends:
-        user_response = {
-            "auth_id": user["auth_id"],
-            "username": user["username"],
-            "is_friend": True,
-            "is_pending_friend": False,
-            "is_pending_request": False,
-            "created_at": user["created_at"]
-        }
-        user_responses.append(UserResponse(**user_response))
-    return user_responses
+        user["is_friend"] = True
+        user["is_pending_friend"] = False
+        user["is_pending_request"] = False
+    return fast_response(shape_many(UserResponse, friends))
 
 @router.get("/requests/received", response_model=list[UserResponse])
-async def get_received_requests(current_user: UserInDB = Depends(get_current_user)):
-    requests = users_collection.find({"auth_id": {"$in": current_user.pending_received_requests}}, {"_id": 0})
+async def get_received_requests(
+    current_user: UserInDB = Depends(get_current_user),
+    users_repository: UsersRepository = Depends(get_users_repository),
+    friendships_repository: FriendshipsRepository = Depends(get_friendships_repository)
+):
+    requester_ids = await friendships_repository.ids(current_user.auth_id, "received")
+    requests = await users_repository.get_many(requester_ids)
     user_responses = []
     for user in requests:
         user_response = {
@@ -124,8 +118,13 @@ async def get_received_requests(current_user: UserInDB = Depends(get_current_use
     return user_responses
 
 @router.get("/requests/sent", response_model=list[UserResponse])
-async def get_sent_requests(current_user: UserInDB = Depends(get_current_user)):
-    requests = users_collection.find({"auth_id": {"$in": current_user.pending_sent_requests}}, {"_id": 0})
+async def get_sent_requests(
+    current_user: UserInDB = Depends(get_current_user),
+    users_repository: UsersRepository = Depends(get_users_repository),
+    friendships_repository: FriendshipsRepository = Depends(get_friendships_repository)
+):
+    requested_ids = await friendships_repository.ids(current_user.auth_id, "sent")
+    requests = await users_repository.get_many(requested_ids)
     user_responses = []
     for user in requests:
         user_response = {
@@ -140,23 +139,35 @@ async def get_sent_requests(current_user: UserInDB = Depends(get_current_user)):
     return user_responses
 
 @router.get("/search")
-async def search_users(query: str, current_user: UserInDB = Depends(get_current_user)):
-    search_query = {
-        "username": {"$regex": f"^{query}", "$options": "i"},
-        "auth_id": {"$ne": current_user.auth_id},
-    }
-    
-    users = list(users_collection.find(search_query, {"_id": 0}).limit(10))
+async def search_users(
+    query: str,
+    mode: Literal["prefix", "fuzzy"] = "prefix",
+    current_user: UserInDB = Depends(get_current_user),
+    users_repository: UsersRepository = Depends(get_users_repository)
+):
+    users = None
+    if mode == "fuzzy":
+        # Typo-tolerant match in memory, None while loading or over budget
+        matches = await username_index.search(query, limit=10, exclude=[current_user.auth_id])
+        if matches is not None:
+            users = await users_repository.get_many_with_friend_state(
+                [auth_id for auth_id, _ in matches],
+                current_user.auth_id
+            )
+    if users is None:
+        # Friend state comes with each user from the same query
+        users = await users_repository.search_by_username(query, current_user.auth_id, limit=10)
     
     user_responses = []
     for user in users:
         user_auth_id = user["auth_id"]
+        friend_state = user.get("friend_state")
         user_response = {
             "auth_id": user_auth_id,
             "username": user["username"],
-            "is_friend": user_auth_id in current_user.friends,
-            "is_pending_friend": user_auth_id in current_user.pending_sent_requests,
-            "is_pending_request": user_auth_id in current_user.pending_received_requests,
+            "is_friend": friend_state == "friends",
+            "is_pending_friend": friend_state == "sent",
+            "is_pending_request": friend_state == "received",
             "created_at": user["created_at"]
         }
         user_responses.append(UserResponse(**user_response))
@@ -164,40 +175,45 @@ async def search_users(query: str, current_user: UserInDB = Depends(get_current_
     return user_responses
 
 @router.delete("/remove/{friend_id}")
-async def remove_friend(friend_id: str, current_user: UserInDB = Depends(get_current_user)):
-    # Check if they are actually friends
-    if friend_id not in current_user.friends:
+async def remove_friend(
+    friend_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    friendships_repository: FriendshipsRepository = Depends(get_friendships_repository),
+    suggestions_repository: SuggestionsRepository = Depends(get_suggestions_repository)
+):
+    # Remove the friendship edges of both users, only if they are actually friends
+    removed = await friendships_repository.remove_friend(current_user.auth_id, friend_id)
+    if not removed:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="This user is not in your friends list"
         )
     
-    # Remove from both users' friends lists
-    users_collection.update_one(
-        {"auth_id": current_user.auth_id},
-        {"$pull": {"friends": friend_id}}
-    )
-    
-    users_collection.update_one(
-        {"auth_id": friend_id},
-        {"$pull": {"friends": current_user.auth_id}}
-    )
+    # Only the request that deleted the edges updates the mutual friend counts
+    await record_unfriending(current_user.auth_id, friend_id, suggestions_repository)
     
     return {"message": "Friend removed successfully"} 
 
 @router.get("/suggestions")
-async def get_friend_suggestions(current_user: UserInDB = Depends(get_current_user)):
-    # Get friends of friends which are not already friends, show friends with most mutual friends first
-    suggested_friends = list(users_collection.aggregate([
-        {"$match": {"auth_id": {"$in": current_user.friends}}},
-        {"$unwind": "$friends"},
-        {"$match": {"friends": {"$ne": current_user.auth_id}}},
-        {"$group": {"_id": "$friends", "count": {"$sum": 1}}},
-        {"$sort": {"count": -1}},
-        {"$limit": 5},
-        {"$lookup": {"from": "users", "localField": "_id", "foreignField": "auth_id", "as": "user"}},
-        {"$unwind": "$user"},
-        {"$project": {"_id": 0, "auth_id": "$user.auth_id", "username": "$user.username", "mutual_friends": "$count"}}
-    ]))
+async def get_friend_suggestions(
+    current_user: UserInDB = Depends(get_current_user),
+    relationships: UserRelationships = Depends(get_current_relationships),
+    users_repository: UsersRepository = Depends(get_users_repository),
+    suggestions_repository: SuggestionsRepository = Depends(get_suggestions_repository)
+):
+    # Leave out friends and anyone with a pending request either way
+    exclude = {current_user.auth_id} | relationships.friends | relationships.sent | relationships.received
+    candidates = await suggestions_repository.find_for_user(current_user.auth_id, exclude, limit=5)
+    
+    usernames = await resolve_usernames([candidate["candidate_id"] for candidate in candidates], users_repository)
+    suggested_friends = [
+        {
+            "auth_id": candidate["candidate_id"],
+            "username": usernames[candidate["candidate_id"]],
+            "mutual_friends": candidate["mutual_friends"]
+        }
+        for candidate in candidates
+        if candidate["candidate_id"] in usernames
+    ]
 
     return suggested_friends
\ No newline at end of file
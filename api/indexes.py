@@ -0,0 +1,157 @@
+"""Index bootstrap and verification for the scorer collections.
+
+Usage: python indexes.py [ensure|report|check]
+"""
+import asyncio
+import os
+import sys
+from typing import Dict, List
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import PyMongoError
+
+import database
+from utils.logging import logger
+from utils.plans import plan_stages
+
+MONGODB_ENSURE_INDEXES = os.environ.get("MONGODB_ENSURE_INDEXES", "true").lower() == "true"
+
+# Indexes required by the hot queries, per collection
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("auth_id", ASCENDING)], name="auth_id_unique", unique=True),
+        IndexModel([("username", ASCENDING)], name="username"),
+        # Case-insensitive prefix search scans a range of this key
+        IndexModel([("username_key", ASCENDING)], name="username_key"),
+    ],
+    "matches": [
+        IndexModel([("match_id", ASCENDING)], name="match_id_unique", unique=True),
+        IndexModel([("players.user_id", ASCENDING), ("is_validated", ASCENDING), ("played_at", DESCENDING)], name="players_validated_played_at"),
+        # Keyset pagination of /my-matches walks these in (played_at, match_id) order
+        IndexModel([("players.user_id", ASCENDING), ("played_at", DESCENDING), ("match_id", DESCENDING)], name="players_played_at_match"),
+        IndexModel([("created_by", ASCENDING), ("played_at", DESCENDING), ("match_id", DESCENDING)], name="created_by_played_at_match"),
+    ],
+    "friendships": [
+        IndexModel([("user_id", ASCENDING), ("other_id", ASCENDING)], name="user_other_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("state", ASCENDING), ("other_id", ASCENDING)], name="user_state_other"),
+    ],
+    "friend_suggestions": [
+        IndexModel([("user_id", ASCENDING), ("candidate_id", ASCENDING)], name="user_candidate_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("mutual_friends", DESCENDING), ("candidate_id", ASCENDING)], name="user_mutual_friends"),
+        # Unfriending finds the suggestions that went through the friendship from either side
+        IndexModel([("user_id", ASCENDING), ("via", ASCENDING)], name="user_via"),
+        IndexModel([("candidate_id", ASCENDING), ("via", ASCENDING)], name="candidate_via"),
+    ],
+    "validation_inbox": [
+        IndexModel([("user_id", ASCENDING), ("match_id", ASCENDING)], name="user_match_unique", unique=True),
+        IndexModel([("user_id", ASCENDING), ("played_at", DESCENDING), ("match_id", DESCENDING)], name="user_played_at_match"),
+    ],
+    "user_stats": [
+        IndexModel([("user_id", ASCENDING), ("year", ASCENDING), ("format", ASCENDING)], name="user_year_format_unique", unique=True),
+    ],
+}
+
+# Representative shapes of the hot queries, checked against their plans
+HOT_QUERIES = [
+    ("current user lookup", "users", {"auth_id": "?"}, None),
+    ("username search", "users", {"username_key": {"$gte": "?", "$lt": "@"}}, [("username_key", ASCENDING)]),
+    ("match by id", "matches", {"match_id": "?"}, None),
+    ("friend set", "friendships", {"user_id": "?", "state": "friends"}, None),
+    ("friend suggestions", "friend_suggestions", {"user_id": "?"}, [("mutual_friends", DESCENDING), ("candidate_id", ASCENDING)]),
+    ("stats", "user_stats", {"user_id": "?"}, None),
+    ("leaderboard", "user_stats", {"user_id": {"$in": ["?"]}, "year": "?"}, None),
+    ("pending validation", "validation_inbox", {"user_id": "?"}, [("played_at", DESCENDING), ("match_id", DESCENDING)]),
+    ("my matches", "matches", {"$or": [{"created_by": "?"}, {"players.user_id": "?"}]}, [("played_at", DESCENDING), ("match_id", DESCENDING)]),
+    ("my matches next page", "matches", {"$or": [
+        {field: "?", **branch}
+        for field in ("created_by", "players.user_id")
+        for branch in ({"played_at": {"$lt": "?"}}, {"played_at": "?", "match_id": {"$lt": "?"}}, {"played_at": None})
+    ]}, [("played_at", DESCENDING), ("match_id", DESCENDING)]),
+]
+
+
+async def ensure_indexes(db) -> List[str]:
+    """Create every declared index. Existing indexes are left untouched.
+
+    Each index is created on its own, so one that fails (a conflicting
+    definition, duplicates blocking a unique index) is logged and the rest
+    are still built. Returns the names of the indexes that failed.
+    """
+    failures = []
+    for collection_name, models in INDEXES.items():
+        for model in models:
+            name = model.document["name"]
+            try:
+                await db[collection_name].create_indexes([model])
+            except PyMongoError as e:
+                logger.error(f"Failed to create index {collection_name}.{name}: {e}")
+                failures.append(f"{collection_name}.{name}")
+            else:
+                logger.debug(f"Index {collection_name}.{name} is in place")
+    return failures
+
+
+async def report_indexes(db) -> dict:
+    """Declared indexes that are missing and existing indexes that were never used"""
+    report = {"missing": [], "unused": []}
+    for collection_name, models in INDEXES.items():
+        collection = db[collection_name]
+        existing = {}
+        async for index in await collection.list_indexes():
+            existing[tuple(index["key"].items())] = index["name"]
+
+        for model in models:
+            key = tuple(model.document["key"].items())
+            if key not in existing:
+                report["missing"].append(f"{collection_name}.{model.document['name']}")
+
+        async for stats in await collection.aggregate([{"$indexStats": {}}]):
+            if stats["name"] != "_id_" and stats["accesses"]["ops"] == 0:
+                report["unused"].append(f"{collection_name}.{stats['name']}")
+    return report
+
+
+async def check_query_plans(db) -> List[str]:
+    """Names of the hot queries whose winning plan falls back to a COLLSCAN"""
+    failures = []
+    for name, collection_name, query, sort in HOT_QUERIES:
+        cursor = db[collection_name].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        explain = await cursor.explain()
+        winning_plan = explain["queryPlanner"]["winningPlan"]
+        if "COLLSCAN" in plan_stages(winning_plan):
+            failures.append(name)
+    return failures
+
+
+async def main(command: str) -> int:
+    await database.connect()
+    db = database.get_database()
+    try:
+        if command == "ensure":
+            failures = await ensure_indexes(db)
+            if failures:
+                logger.error(f"Indexes that could not be created: {', '.join(failures)}")
+                return 1
+            logger.info("Indexes are in place")
+        elif command == "report":
+            report = await report_indexes(db)
+            logger.info(f"Missing indexes: {', '.join(report['missing']) or 'none'}")
+            logger.info(f"Unused indexes: {', '.join(report['unused']) or 'none'}")
+        elif command == "check":
+            failures = await check_query_plans(db)
+            if failures:
+                logger.error(f"Hot queries using COLLSCAN: {', '.join(failures)}")
+                return 1
+            logger.info("All hot queries use an index")
+        else:
+            logger.error(f"Unknown command '{command}', expected ensure, report or check")
+            return 2
+    finally:
+        await database.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "ensure")))
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import time
+from typing import Dict, Optional
+
+import httpx
+
+from utils.logging import logger
+
+# JWKS cache configuration
+JWKS_CACHE_TTL = int(os.environ.get("JWKS_CACHE_TTL", 3600))
+JWKS_MIN_REFRESH_INTERVAL = int(os.environ.get("JWKS_MIN_REFRESH_INTERVAL", 30))
+JWKS_FETCH_TIMEOUT = float(os.environ.get("JWKS_FETCH_TIMEOUT", 5))
+JWKS_CACHE_FILE = os.environ.get("JWKS_CACHE_FILE")
+
+
+class JWKSCache:
+    """In-process cache of the Auth0 signing keys, indexed by kid.
+
+    Keys are loaded once and refreshed in the background every half TTL.
+    A token with an unknown kid triggers an on-demand refresh, at most once
+    every `min_refresh_interval` seconds so bad tokens can't flood Auth0.
+    """
+
+    def __init__(
+        self,
+        jwks_url: str,
+        ttl: int = JWKS_CACHE_TTL,
+        min_refresh_interval: int = JWKS_MIN_REFRESH_INTERVAL,
+        cache_file: Optional[str] = JWKS_CACHE_FILE,
+    ):
+        self.jwks_url = jwks_url
+        self.ttl = ttl
+        self.min_refresh_interval = min_refresh_interval
+        self.cache_file = cache_file
+        self.keys: Dict[str, dict] = {}
+        self.fetched_at = 0.0
+        self.last_attempt = 0.0
+        self.refresh_count = 0
+        self.kid_hits = 0
+        self.kid_misses = 0
+        self.refresh_failures = 0
+        # Created lazily so the lock binds to the running event loop
+        self._lock: Optional[asyncio.Lock] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+
+        if cache_file:
+            self.load_file(cache_file)
+
+    def load_file(self, path: str) -> bool:
+        """Warm-start the cache from a JWKS document on disk"""
+        try:
+            with open(path) as f:
+                jwks = json.load(f)
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Could not load JWKS cache file {path}: {str(e)}")
+            return False
+
+        self._store(jwks)
+        # Treat the file as being as old as its last write so the TTL still applies
+        self.fetched_at = os.path.getmtime(path)
+        logger.info(f"Loaded {len(self.keys)} JWKS keys from {path}")
+        return True
+
+    def _store(self, jwks: dict):
+        keys = {}
+        for key in jwks.get("keys", []):
+            if "kid" not in key:
+                continue
+            keys[key["kid"]] = {
+                "kty": key["kty"],
+                "kid": key["kid"],
+                "use": key.get("use", "sig"),
+                "n": key["n"],
+                "e": key["e"]
+            }
+        self.keys = keys
+
+    def _write_file(self, jwks: dict):
+        tmp_path = f"{self.cache_file}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(jwks, f)
+            os.replace(tmp_path, self.cache_file)
+        except Exception as e:
+            logger.warning(f"Could not write JWKS cache file {self.cache_file}: {str(e)}")
+
+    @property
+    def age(self) -> float:
+        return time.time() - self.fetched_at if self.fetched_at else float("inf")
+
+    def is_stale(self) -> bool:
+        return not self.keys or self.age > self.ttl
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Download the JWKS document, returning True if the keys were updated"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        requested_at = time.time()
+        async with self._lock:
+            # Another coroutine refreshed while we were waiting for the lock
+            if self.fetched_at >= requested_at:
+                return True
+            if not force and not self.is_stale():
+                return True
+            if time.time() - self.last_attempt < self.min_refresh_interval:
+                return False
+
+            self.last_attempt = time.time()
+            try:
+                async with httpx.AsyncClient(timeout=JWKS_FETCH_TIMEOUT) as client:
+                    response = await client.get(self.jwks_url)
+                    response.raise_for_status()
+                    jwks = response.json()
+            except Exception as e:
+                self.refresh_failures += 1
+                logger.warning(f"JWKS refresh failed, keeping {len(self.keys)} cached keys: {str(e)}")
+                return False
+
+            self._store(jwks)
+            self.fetched_at = time.time()
+            self.refresh_count += 1
+            if self.cache_file:
+                self._write_file(jwks)
+            logger.debug(f"JWKS refreshed with {len(self.keys)} keys")
+            return True
+
+    async def get_key(self, kid: str) -> Optional[dict]:
+        if self.is_stale():
+            await self.refresh()
+
+        key = self.keys.get(kid)
+        if key is None:
+            # Unknown kid, Auth0 may have rotated its signing key
+            self.kid_misses += 1
+            if await self.refresh(force=True):
+                key = self.keys.get(kid)
+        else:
+            self.kid_hits += 1
+        return key
+
+    def stats(self) -> dict:
+        return {
+            "keys": len(self.keys),
+            "age_seconds": round(self.age, 1) if self.fetched_at else None,
+            "refreshes": self.refresh_count,
+            # Exported with a scorer_jwks_kid_hit_ratio gauge
+            "kid_hits": self.kid_hits,
+            "kid_misses": self.kid_misses,
+            "refresh_failures": self.refresh_failures
+        }
+
+    async def _refresh_loop(self):
+        interval = max(self.ttl / 2, self.min_refresh_interval)
+        while True:
+            await asyncio.sleep(interval)
+            await self.refresh(force=True)
+
+    async def start(self):
+        """Load the keys if needed and start the background refresh"""
+        if self.is_stale():
+            await self.refresh()
+        if self._refresh_task is None:
+            self._refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._refresh_task is not None:
+            self._refresh_task.cancel()
+            try:
+                await self._refresh_task
+            except asyncio.CancelledError:
+                pass
+            self._refresh_task = None
@@ -0,0 +1,36 @@
+"""Leaderboard computed by MongoDB straight from the validated matches.
+
+The whole computation runs in one aggregation pipeline and only the final
+ranked rows come back over the wire. It is used when LEADERBOARD_SOURCE is
+`matches`, and as the reference the rollups can be compared against.
+"""
+import os
+from typing import List, Optional
+
+from rollups import COUNTERS, counter_accumulators
+from utils.dates import year_range
+
+# rollups: read the incrementally maintained user_stats, matches: aggregate raw matches
+LEADERBOARD_SOURCE = os.environ.get("LEADERBOARD_SOURCE", "rollups")
+
+
+def leaderboard_pipeline(user_ids: List[str], year: Optional[int] = None) -> List[dict]:
+    match_query = {
+        "players.user_id": {"$in": user_ids},
+        "is_validated": True
+    }
+    if year:
+        start, end = year_range(year)
+        match_query["played_at"] = {"$gte": start, "$lt": end}
+
+    return [
+        # Served by the players_validated_played_at index
+        {"$match": match_query},
+        {"$project": {"_id": 0, "players": 1, "winning_team": 1, "format": 1}},
+        {"$unwind": "$players"},
+        # Drop players outside the friend set before grouping
+        {"$match": {"players.user_id": {"$in": user_ids}}},
+        {"$group": {"_id": "$players.user_id", **counter_accumulators()}},
+        {"$sort": {"points": -1, "wins": -1, "goals": -1, "_id": 1}},
+        {"$project": {"_id": 0, "user_id": "$_id", **{counter: 1 for counter in COUNTERS}}}
+    ]
@@ -1,9 +1,19 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
-from auth import router as auth_router
+from fastapi.responses import JSONResponse, PlainTextResponse
+from auth import router as auth_router, jwks_cache
 from friends import router as friends_router
 from matches import router as matches_router
+from admin import router as admin_router
+from token_verifier import token_verifier
+from username_index import username_index
+from events import event_hub
+from token_cache import token_cache
+from usernames import username_cache
+import metrics
+from slow_queries import slow_query_recorder
+import database
+from indexes import MONGODB_ENSURE_INDEXES, ensure_indexes
 from utils.logging import logger, format_struct_log
 import traceback
 import uvicorn
@@ -12,6 +22,31 @@ import os
 
 app = FastAPI(title="Scorer API")
 
+@app.on_event("startup")
+async def startup():
+    # One pooled MongoDB client per worker, shared by every router
+    await database.connect()
+    if MONGODB_ENSURE_INDEXES:
+        try:
+            await ensure_indexes(database.get_database())
+        except Exception as e:
+            logger.error(f"Index bootstrap failed: {str(e)}")
+    # Warm the Auth0 signing keys before the first request needs them
+    await jwks_cache.start()
+    token_verifier.start()
+    # Fuzzy username search loads in the background, prefix search covers until then
+    username_index.start(database.get_users_repository())
+    # Only watches the matches change stream with EVENTS_SOURCE=change_stream
+    event_hub.start(database.get_database())
+
+@app.on_event("shutdown")
+async def shutdown():
+    await jwks_cache.stop()
+    await username_index.stop()
+    await event_hub.stop()
+    token_verifier.shutdown()
+    await database.close()
+
 # @app.middleware("http")
 # async def log_requests(request: Request, call_next):
 #     """Log request and response details"""
@@ -76,15 +111,31 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so the latency covers the whole stack
+app.add_middleware(metrics.MetricsMiddleware)
+
+metrics.register_gauges("jwks", jwks_cache.stats)
+metrics.register_gauges("token_cache", token_cache.stats)
+metrics.register_gauges("username_cache", username_cache.stats)
+metrics.register_gauges("username_index", username_index.stats)
+metrics.register_gauges("events", event_hub.stats)
+metrics.register_gauges("slow_queries", slow_query_recorder.stats)
+
 # Include routers
 app.include_router(auth_router, prefix="/api/auth", tags=["Authentication"])
 app.include_router(friends_router, prefix="/api/friends", tags=["Friends"])
 app.include_router(matches_router, prefix="/api/matches", tags=["Matches"])
+app.include_router(admin_router, prefix="/api/admin", tags=["Admin"])
 
 @app.get("/api/health")
 async def health_check():
     return {"status": "ok"}
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus text exposition of the request, MongoDB and cache metrics"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
     uvicorn.run("main:app", host="0.0.0.0", port=port)
\ No newline at end of file
@@ -0,0 +1,98 @@
+"""Streaming export of a user's full match history.
+
+Matches are read off a cursor `MATCH_EXPORT_BATCH_SIZE` at a time, enriched
+with usernames one batch at a time and encoded as they go, so memory stays
+flat whatever the length of the history.
+"""
+import csv
+import io
+import os
+from typing import AsyncIterator, List
+
+import orjson
+import zstandard
+
+from repository import MatchesRepository, UsersRepository
+from usernames import enrich_matches
+
+# Match export configuration
+MATCH_EXPORT_BATCH_SIZE = int(os.environ.get("MATCH_EXPORT_BATCH_SIZE", 200))
+MATCH_EXPORT_ZSTD_LEVEL = int(os.environ.get("MATCH_EXPORT_ZSTD_LEVEL", 3))
+
+EXPORT_FIELDS = [
+    "match_id", "date", "time", "played_at", "location", "format", "winning_team",
+    "created_by", "creator_username", "is_validated", "players", "validations", "created_at"
+]
+
+# Columns of the CSV export; players and validations are JSON encoded
+CSV_COLUMNS = EXPORT_FIELDS
+
+EXPORT_PROJECTION = {"_id": 0, **{field: 1 for field in EXPORT_FIELDS if field != "creator_username"}}
+
+
+async def _batches(cursor, batch_size: int) -> AsyncIterator[List[dict]]:
+    batch = []
+    async for match in cursor:
+        batch.append(match)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _ndjson(matches: List[dict]) -> bytes:
+    return b"".join(
+        orjson.dumps({field: match.get(field) for field in EXPORT_FIELDS}) + b"\n"
+        for match in matches
+    )
+
+
+def _csv(matches: List[dict], header: bool) -> bytes:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(CSV_COLUMNS)
+    for match in matches:
+        row = []
+        for field in CSV_COLUMNS:
+            value = match.get(field)
+            if field in ("players", "validations"):
+                # Same encoding as the NDJSON export, timestamps in ISO 8601
+                value = orjson.dumps(value).decode()
+            elif hasattr(value, "isoformat"):
+                value = value.isoformat()
+            row.append("" if value is None else value)
+        writer.writerow(row)
+    return buffer.getvalue().encode("utf-8")
+
+
+async def export_matches(
+    user_id: str,
+    file_format: str,
+    compress: bool,
+    matches_repository: MatchesRepository,
+    users_repository: UsersRepository,
+    batch_size: int = MATCH_EXPORT_BATCH_SIZE
+) -> AsyncIterator[bytes]:
+    """Encoded chunks of the export, one per batch of matches"""
+    compressor = zstandard.ZstdCompressor(level=MATCH_EXPORT_ZSTD_LEVEL).compressobj() if compress else None
+    cursor = matches_repository.iter_for_user(user_id, batch_size, EXPORT_PROJECTION)
+    first = True
+    try:
+        async for batch in _batches(cursor, batch_size):
+            await enrich_matches(batch, users_repository)
+            chunk = _csv(batch, header=first) if file_format == "csv" else _ndjson(batch)
+            first = False
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if file_format == "csv" and first:
+            chunk = _csv([], header=True)
+            yield compressor.compress(chunk) if compressor is not None else chunk
+        if compressor is not None:
+            yield compressor.flush()
+    finally:
+        # The client may disconnect mid-stream, release the server-side cursor
+        await cursor.close()
@@ -0,0 +1,152 @@
+"""Bulk import of matches from a streamed JSON-lines or CSV upload.
+
+Rows are validated with the same rules as POST /matches/ and inserted in
+chunks with insert_many, so memory stays bounded by the chunk size whatever
+the size of the upload. Invalid rows are reported and skipped.
+
+CSV uploads need a header with the MatchCreate fields; `players` holds the
+JSON list of players. Rows can't span several lines, and lines longer than
+`MATCH_IMPORT_MAX_LINE_BYTES` are rejected without being buffered.
+"""
+import csv
+import json
+import os
+import time
+import uuid
+from typing import AsyncIterator, List, Optional, Tuple
+
+from events import publish_events, validation_needed_events
+from models import MatchCreate, MatchInDB
+from repository import InboxRepository, MatchesRepository
+from utils.dates import parse_played_at
+
+# Match import configuration
+MATCH_IMPORT_CHUNK_SIZE = int(os.environ.get("MATCH_IMPORT_CHUNK_SIZE", 500))
+MATCH_IMPORT_MAX_ROWS = int(os.environ.get("MATCH_IMPORT_MAX_ROWS", 20000))
+MATCH_IMPORT_MAX_LINE_BYTES = int(os.environ.get("MATCH_IMPORT_MAX_LINE_BYTES", 65536))
+# Errors beyond this are counted but not listed
+MATCH_IMPORT_MAX_REPORTED_ERRORS = 1000
+
+
+async def read_lines(
+    chunks: AsyncIterator[bytes],
+    max_line_bytes: int = MATCH_IMPORT_MAX_LINE_BYTES
+) -> AsyncIterator[Optional[bytes]]:
+    """Raw lines of a streamed body as they arrive.
+
+    A line longer than `max_line_bytes` is yielded once as None and the rest
+    of it is dropped as it streams in, so the buffer never grows past the limit.
+    """
+    buffer = b""
+    # Inside an overlong line, waiting for its end
+    skipping = False
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if skipping:
+                skipping = False
+                continue
+            yield line if len(line) <= max_line_bytes else None
+        if len(buffer) > max_line_bytes:
+            if not skipping:
+                yield None
+                skipping = True
+            buffer = b""
+    if buffer and not skipping:
+        yield buffer
+
+
+async def read_rows(lines: AsyncIterator[Optional[bytes]], file_format: str) -> AsyncIterator[Tuple[int, object]]:
+    """(line number, row) of every non-empty line; a row is a dict or the exception raised parsing it"""
+    header = None
+    line_number = 0
+    async for raw_line in lines:
+        line_number += 1
+        try:
+            if raw_line is None:
+                raise ValueError(f"Line longer than {MATCH_IMPORT_MAX_LINE_BYTES} bytes")
+            line = raw_line.decode("utf-8").rstrip("\r")
+            if not line.strip():
+                continue
+            if file_format == "csv":
+                values = next(csv.reader([line], strict=True))
+                if header is None:
+                    header = [name.strip() for name in values]
+                    continue
+                row = dict(zip(header, values))
+                row["players"] = json.loads(row.get("players") or "[]")
+            else:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError("Expected a JSON object")
+        except (ValueError, UnicodeDecodeError, csv.Error) as e:
+            yield line_number, e
+            continue
+        yield line_number, row
+
+
+def build_match(row: dict, created_by: str) -> dict:
+    """The document POST /matches/ would store for this row, ValueError if invalid"""
+    match = MatchCreate(**row)
+    new_match = MatchInDB(
+        **match.dict(),
+        created_by=created_by,
+        match_id=str(uuid.uuid4()),
+        played_at=parse_played_at(match.date, match.time)
+    )
+    return new_match.dict(by_alias=True)
+
+
+async def import_matches(
+    chunks: AsyncIterator[bytes],
+    file_format: str,
+    created_by: str,
+    matches_repository: MatchesRepository,
+    inbox_repository: InboxRepository
+) -> dict:
+    started_at = time.monotonic()
+    report = {"received": 0, "imported": 0, "failed": 0, "errors": []}
+
+    def add_error(line_number: int, error: str):
+        report["failed"] += 1
+        if len(report["errors"]) < MATCH_IMPORT_MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line_number, "error": error})
+
+    chunk: List[Tuple[int, dict]] = []
+
+    async def flush():
+        failures = dict(await matches_repository.insert_many([match for _, match in chunk]))
+        imported = []
+        for position, (line_number, match) in enumerate(chunk):
+            if position in failures:
+                add_error(line_number, failures[position])
+            else:
+                imported.append(match)
+                publish_events(validation_needed_events(match))
+        await inbox_repository.add(imported)
+        report["imported"] += len(imported)
+        chunk.clear()
+
+    async for line_number, row in read_rows(read_lines(chunks), file_format):
+        if report["received"] >= MATCH_IMPORT_MAX_ROWS:
+            add_error(line_number, f"Import limited to {MATCH_IMPORT_MAX_ROWS} rows, the rest was ignored")
+            break
+        report["received"] += 1
+        if isinstance(row, Exception):
+            add_error(line_number, f"Unreadable row: {str(row)}")
+            continue
+        try:
+            chunk.append((line_number, build_match(row, created_by)))
+        except (ValueError, TypeError) as e:
+            add_error(line_number, str(e))
+            continue
+        if len(chunk) >= MATCH_IMPORT_CHUNK_SIZE:
+            await flush()
+    if chunk:
+        await flush()
+
+    elapsed = time.monotonic() - started_at
+    report["elapsed_ms"] = round(elapsed * 1000, 1)
+    report["rows_per_second"] = round(report["received"] / elapsed, 1) if elapsed else None
+    return report
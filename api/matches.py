@@ -1,23 +1,37 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from pymongo import MongoClient
-import os
-from datetime import datetime
-from typing import List, Optional
-from models import MatchCreate, MatchInDB, MatchResponse, MatchValidation, UserInDB
-from auth import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from datetime import datetime, timedelta
+from typing import List, Literal, Optional, Union
+from models import BatchValidationRequest, MatchCreate, MatchFormat, MatchInDB, MatchPage, MatchResponse, MatchValidation, PlayerJoin, PlayerStats, UserInDB
+from auth import EVENTS_TICKET_TTL, get_current_user, get_stream_user_id, issue_stream_ticket
+from repository import FriendshipsRepository, InboxRepository, MatchesRepository, StatsRepository, UsersRepository
+from database import get_friendships_repository, get_inbox_repository, get_matches_repository, get_stats_repository, get_users_repository
+from usernames import enrich_matches, resolve_usernames
+from rollups import COUNTERS, empty_totals, record_match, record_player, record_validated_match, record_validated_matches, sum_rollups
+from leaderboard import LEADERBOARD_SOURCE, leaderboard_pipeline
+from match_import import import_matches
+from match_export import export_matches
+from events import EVENTS_HEARTBEAT_INTERVAL, event_hub, match_validated_events, publish_events, validation_needed_events
+from responses import fast_response, shape_many
+from utils.pagination import decode_cursor, encode_cursor
+from utils.dates import parse_date, parse_played_at
+import asyncio
+import json
+import time
 import uuid
 
 router = APIRouter()
 
-# MongoDB connection
-MONGODB_URI = os.environ.get("MONGODB_URI")
-client = MongoClient(MONGODB_URI)
-db = client.scorer
-matches_collection = db.matches
-users_collection = db.users
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
 
 @router.post("/", response_model=MatchResponse)
-async def create_match(match: MatchCreate, current_user: UserInDB = Depends(get_current_user)):
+async def create_match(
+    match: MatchCreate,
+    current_user: UserInDB = Depends(get_current_user),
+    matches_repository: MatchesRepository = Depends(get_matches_repository),
+    inbox_repository: InboxRepository = Depends(get_inbox_repository)
+):
     """Create a new match with the current user as creator"""
     match_data = match.dict()
     
@@ -25,145 +39,297 @@ async def create_match(match: MatchCreate, current_user: UserInDB = Depends(get_
     new_match = MatchInDB(
         **match_data,
         created_by=current_user.auth_id,
-        match_id=str(uuid.uuid4())
+        match_id=str(uuid.uuid4()),
+        played_at=parse_played_at(match.date, match.time)
     )
     
     # Insert into database
-    matches_collection.insert_one(new_match.dict(by_alias=True))
+    match_document = new_match.dict(by_alias=True)
+    await matches_repository.insert(match_document)
+    await inbox_repository.add([match_document])
+    publish_events(validation_needed_events(match_document))
     
     return MatchResponse(**new_match.dict())
 
-@router.post("/{match_id}/validate")
-async def validate_match(match_id: str, current_user: UserInDB = Depends(get_current_user)):
-    # Find match
-    match = matches_collection.find_one({"match_id": match_id}, {"_id": 0})
-    
-    if not match:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Match not found"
-        )
+@router.post("/validate-batch")
+async def validate_matches_batch(
+    batch: BatchValidationRequest,
+    current_user: UserInDB = Depends(get_current_user),
+    matches_repository: MatchesRepository = Depends(get_matches_repository),
+    stats_repository: StatsRepository = Depends(get_stats_repository),
+    inbox_repository: InboxRepository = Depends(get_inbox_repository)
+):
+    """Validate several matches at once, with the rules of /{match_id}/validate"""
+    started_at = time.monotonic()
+    match_ids = list(dict.fromkeys(batch.match_ids))
+    # MongoDB stores milliseconds, truncate so the stored validation can be recognized below
+    now = datetime.now()
+    validation = {
+        "user_id": current_user.auth_id,
+        "timestamp": now.replace(microsecond=now.microsecond // 1000 * 1000)
+    }
     
-    # Check if user participated in match
-    user_participated = any(player["user_id"] == current_user.auth_id for player in match["players"])
+    # The same conditional update as a single validation, for every match in one bulk write
+    validated = await matches_repository.validate_many(match_ids, validation)
     
-    if not user_participated:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Only participants can validate matches"
-        )
+    # The update results, read back: the matches holding this request's
+    # validation are the ones it applied to
+    matches = await matches_repository.get_many(
+        match_ids,
+        {"_id": 0, "match_id": 1, "players.user_id": 1, "validations": 1}
+    )
+    matches_by_id = {match["match_id"]: match for match in matches}
+    statuses = {}
+    for match_id in match_ids:
+        match = matches_by_id.get(match_id)
+        if match is None:
+            statuses[match_id] = "not_found"
+        elif not any(player["user_id"] == current_user.auth_id for player in match["players"]):
+            statuses[match_id] = "not_a_participant"
+        elif validation in match.get("validations", []):
+            statuses[match_id] = "validated"
+        else:
+            statuses[match_id] = "already_validated"
+    
+    await inbox_repository.remove(
+        current_user.auth_id,
+        [match_id for match_id in match_ids if statuses[match_id] in ("validated", "already_validated")]
+    )
     
-    # Check if user already validated
-    if any(validation["user_id"] == current_user.auth_id for validation in match["validations"]):
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You have already validated this match"
-        )
+    # Count the matches this batch validated in the rollups, once per match
+    applied = [match_id for match_id in match_ids if statuses[match_id] == "validated"]
+    for match in await record_validated_matches(applied, matches_repository, stats_repository):
+        publish_events(match_validated_events(match))
     
-    # Add validation
+    elapsed = time.monotonic() - started_at
+    return {
+        "validated": validated,
+        "results": [{"match_id": match_id, "status": statuses[match_id]} for match_id in match_ids],
+        "elapsed_ms": round(elapsed * 1000, 1)
+    }
+
+@router.post("/import")
+async def import_matches_file(
+    request: Request,
+    file_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    current_user: UserInDB = Depends(get_current_user),
+    matches_repository: MatchesRepository = Depends(get_matches_repository),
+    inbox_repository: InboxRepository = Depends(get_inbox_repository)
+):
+    """Import matches created by the current user from a JSON-lines or CSV request body.
+
+    The body is read as a stream and inserted in chunks. The response lists
+    the rows that were rejected along with the import throughput.
+    """
+    return await import_matches(request.stream(), file_format, current_user.auth_id, matches_repository, inbox_repository)
+
+@router.get("/export")
+async def export_user_matches(
+    file_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    compress: bool = False,
+    current_user: UserInDB = Depends(get_current_user),
+    users_repository: UsersRepository = Depends(get_users_repository),
+    matches_repository: MatchesRepository = Depends(get_matches_repository)
+):
+    """Stream every match of the current user with username information, optionally zstd compressed"""
+    media_type = "text/csv" if file_format == "csv" else "application/x-ndjson"
+    filename = f"matches.{file_format}"
+    if compress:
+        media_type = "application/zstd"
+        filename += ".zst"
+    
+    return StreamingResponse(
+        export_matches(current_user.auth_id, file_format, compress, matches_repository, users_repository),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.post("/events/ticket")
+async def match_events_ticket(current_user: UserInDB = Depends(get_current_user)):
+    """A short-lived ticket for opening /events with EventSource.
+
+    EventSource can't send an Authorization header, so browser clients get
+    a ticket with their bearer token and open `/events?ticket=...`. Get a
+    new ticket before reconnecting once it has expired.
+    """
+    return {"ticket": issue_stream_ticket(current_user.auth_id), "expires_in": EVENTS_TICKET_TTL}
+
+@router.get("/events")
+async def match_events(
+    request: Request,
+    auth_id: str = Depends(get_stream_user_id)
+):
+    """Server-Sent Events stream of the current user's match events.
+
+    Sends `validation_needed` when a match needs the user's validation and
+    `match_validated` when one of their matches becomes validated. Clients
+    fetch /pending-validation once on connect and then react to events
+    instead of polling. Authenticates with a bearer token (fetch-based
+    clients) or a `ticket` from /events/ticket (EventSource).
+    """
+    async def stream():
+        # Subscribed only once the response is streaming, and always released
+        queue = event_hub.subscribe(auth_id)
+        try:
+            yield ": connected\n\n"
+            while not await request.is_disconnected():
+                try:
+                    event = await asyncio.wait_for(queue.get(), EVENTS_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    # Keeps proxies from closing an idle connection
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+        finally:
+            event_hub.unsubscribe(auth_id, queue)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/{match_id}/validate")
+async def validate_match(
+    match_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    matches_repository: MatchesRepository = Depends(get_matches_repository),
+    stats_repository: StatsRepository = Depends(get_stats_repository),
+    inbox_repository: InboxRepository = Depends(get_inbox_repository)
+):
     validation = {
         "user_id": current_user.auth_id,
         "timestamp": datetime.now()
     }
     
-    matches_collection.update_one(
-        {"match_id": match_id},
-        {"$push": {"validations": validation}}
-    )
-    
-    # Check if match has enough validations to be marked as validated
-    updated_match = matches_collection.find_one({"match_id": match_id}, {"_id": 0})
+    # A single conditional update checks participation, rejects duplicate
+    # validations, appends this one and recomputes is_validated atomically
+    previous_match = await matches_repository.validate(match_id, validation)
     
-    if len(updated_match["validations"]) >= len(updated_match["players"]) / 2:
-        matches_collection.update_one(
-            {"match_id": match_id},
-            {"$set": {"is_validated": True}}
+    if previous_match is None:
+        # The update didn't apply, find out why
+        match = await matches_repository.get(match_id)
+        
+        if not match:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Match not found"
+            )
+        
+        if not any(player["user_id"] == current_user.auth_id for player in match["players"]):
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Only participants can validate matches"
+            )
+        
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="You have already validated this match"
         )
     
+    await inbox_repository.remove(current_user.auth_id, [match_id])
+    
+    # If this validation flipped the match to validated, count it in the rollups
+    validations_count = len(previous_match.get("validations", [])) + 1
+    is_validated = previous_match.get("is_validated") or validations_count >= len(previous_match["players"]) / 2
+    if is_validated and not previous_match.get("stats_applied"):
+        await record_match(previous_match, stats_repository)
+        publish_events(match_validated_events(previous_match))
+    
     return {"message": "Match validated successfully"}
 
-@router.get("/my-matches", response_model=List[MatchResponse])
-async def get_user_matches(current_user: UserInDB = Depends(get_current_user)):
-    """Get all matches for the current user with username information"""
-    
-    # Find matches where user is a player
-    matches = list(matches_collection.find({
-        "$or": [
-            {"created_by": current_user.auth_id},
-            {"players.user_id": current_user.auth_id}
-        ]
-    }, {"_id": 0}).sort("date", -1))
+@router.get("/my-matches", response_model=Union[List[MatchResponse], MatchPage])
+async def get_user_matches(
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    date_from: Optional[str] = Query(None, alias="from"),
+    date_to: Optional[str] = Query(None, alias="to"),
+    match_format: Optional[MatchFormat] = Query(None, alias="format"),
+    current_user: UserInDB = Depends(get_current_user),
+    users_repository: UsersRepository = Depends(get_users_repository),
+    matches_repository: MatchesRepository = Depends(get_matches_repository)
+):
+    """Get matches for the current user with username information.
+
+    Without `limit` or `cursor` the full history is returned as a plain list,
+    as current clients expect. Otherwise a page is returned together with the
+    cursor of the next one.
+    """
+    paginated = limit is not None or cursor is not None
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        if after is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+    
+    # Date filters are inclusive days, run as a range on played_at
+    played_from = parse_date(date_from) if date_from else None
+    played_to = parse_date(date_to) if date_to else None
+    if (date_from and played_from is None) or (date_to and played_to is None):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid date filter"
+        )
+    page_size = limit or DEFAULT_PAGE_SIZE
+    
+    # Find matches where user is a player, one extra row tells us if there is a next page
+    matches = await matches_repository.find_for_user(
+        current_user.auth_id,
+        limit=page_size + 1 if paginated else None,
+        after=after,
+        played_from=played_from,
+        played_before=played_to + timedelta(days=1) if played_to else None,
+        match_format=match_format
+    )
     
-    # Enrich matches with username information
-    for match in matches:
-        # Get all unique user IDs from the match
-        user_ids = [match["created_by"]] + [p["user_id"] for p in match["players"]]
-        user_ids = list(set(user_ids))  # Remove duplicates
-        
-        # Get user details for all users in the match
-        users = {
-            user["auth_id"]: user["username"] 
-            for user in users_collection.find({"auth_id": {"$in": user_ids}}, {"_id": 0, "auth_id": 1, "username": 1})
-        }
-        
-        # Add creator_username to match
-        match["creator_username"] = users.get(match["created_by"], "Unknown")
-        
-        # Add username to each player
-        for player in match["players"]:
-            player["username"] = users.get(player["user_id"], "Unknown")
+    next_cursor = None
+    if paginated and len(matches) > page_size:
+        matches = matches[:page_size]
+        next_cursor = encode_cursor(matches[-1].get("played_at"), matches[-1]["match_id"])
+    
+    # Enrich matches with username information in a single lookup
+    await enrich_matches(matches, users_repository)
     
-    return [MatchResponse(**match) for match in matches]
+    items = shape_many(MatchResponse, matches)
+    if not paginated:
+        return fast_response(items)
+    return fast_response({"items": items, "next_cursor": next_cursor})
 
 @router.get("/pending-validation", response_model=List[MatchResponse])
-async def get_pending_validation_matches(current_user: UserInDB = Depends(get_current_user)):
+async def get_pending_validation_matches(
+    current_user: UserInDB = Depends(get_current_user),
+    users_repository: UsersRepository = Depends(get_users_repository),
+    inbox_repository: InboxRepository = Depends(get_inbox_repository)
+):
     """Get matches pending validation with username information"""
     
-    # Get IDs of all friends
-    friend_ids = current_user.friends
+    # Matches the current user played in and hasn't validated yet, from their inbox
+    matches = await inbox_repository.pending_matches(current_user.auth_id)
     
-    # Find matches created by friends that current user hasn't validated yet
-    matches = list(matches_collection.find({
-        "created_by": {"$in": friend_ids},
-        "validations.user_id": {"$ne": current_user.auth_id}
-    }, {"_id": 0}))
+    # Enrich matches with username information in a single lookup
+    await enrich_matches(matches, users_repository)
     
-    # Enrich matches with username information
-    for match in matches:
-        # Get all unique user IDs from the match
-        user_ids = [match["created_by"]] + [p["user_id"] for p in match["players"]]
-        user_ids = list(set(user_ids))  # Remove duplicates
-        
-        # Get user details for all users in the match
-        users = {
-            user["auth_id"]: user["username"] 
-            for user in users_collection.find({"auth_id": {"$in": user_ids}}, {"_id": 0, "auth_id": 1, "username": 1})
-        }
-        
-        # Add creator_username to match
-        match["creator_username"] = users.get(match["created_by"], "Unknown")
-        
-        # Add username to each player
-        for player in match["players"]:
-            player["username"] = users.get(player["user_id"], "Unknown")
-    
-    return [MatchResponse(**match) for match in matches]
+    return fast_response(shape_many(MatchResponse, matches))
 
 @router.get("/stats")
-async def get_user_stats(current_user: UserInDB = Depends(get_current_user)):
-    # Find all validated matches where user is a player
-    matches = matches_collection.find({
-        "players.user_id": current_user.auth_id,
-        "is_validated": True
-    }, {"_id": 0})
+async def get_user_stats(
+    current_user: UserInDB = Depends(get_current_user),
+    stats_repository: StatsRepository = Depends(get_stats_repository)
+):
+    # Read the user's rollups instead of scanning every validated match
+    rollups = await stats_repository.find_for_users([current_user.auth_id])
+    totals = sum_rollups(rollups).get(current_user.auth_id, empty_totals())
     
     stats = {
-        "total_matches": 0,
-        "wins": 0,
-        "losses": 0,
-        "draws": 0,
-        "goals": 0,
-        "assists": 0,
+        "total_matches": totals["matches_played"],
+        "wins": totals["wins"],
+        "losses": totals["losses"],
+        "draws": totals["draws"],
+        "goals": totals["goals"],
+        "assists": totals["assists"],
         "by_format": {
             "F5": 0,
             "F6": 0,
@@ -175,116 +341,51 @@ async def get_user_stats(current_user: UserInDB = Depends(get_current_user)):
         }
     }
     
-    for match in matches:
-        stats["total_matches"] += 1
-        stats["by_format"][match["format"]] += 1
-        
-        # Find user's team and stats
-        user_team = None
-        for player in match["players"]:
-            if str(player["user_id"]) == str(current_user.auth_id):
-                user_team = player["team"]
-                stats["goals"] += player["goals"]
-                stats["assists"] += player["assists"]
-                break
-        
-        if user_team:
-            if match["winning_team"] == user_team:
-                stats["wins"] += 1
-            elif match["winning_team"] == "draw":
-                stats["draws"] += 1
-            else:
-                stats["losses"] += 1
-    
-    return stats
+    for rollup in rollups:
+        stats["by_format"][rollup["format"]] += rollup.get("matches_played", 0)
+    
+    return fast_response(stats)
 
 @router.get("/leaderboard")
-async def get_leaderboard(year: Optional[str] = None, current_user: UserInDB = Depends(get_current_user)):
+async def get_leaderboard(
+    year: Optional[int] = Query(None, ge=1900, le=2100),
+    current_user: UserInDB = Depends(get_current_user),
+    users_repository: UsersRepository = Depends(get_users_repository),
+    matches_repository: MatchesRepository = Depends(get_matches_repository),
+    stats_repository: StatsRepository = Depends(get_stats_repository),
+    friendships_repository: FriendshipsRepository = Depends(get_friendships_repository)
+):
     try:
         # Get all friends plus current user
-        friend_ids = current_user.friends + [current_user.auth_id]
+        friend_ids = await friendships_repository.ids(current_user.auth_id, "friends") + [current_user.auth_id]
         
-        # Get all users with these auth_ids
-        users = list(users_collection.find({"auth_id": {"$in": friend_ids}}, {"_id": 0}))
+        if LEADERBOARD_SOURCE == "matches":
+            # Ranked rows computed by MongoDB from the raw matches
+            rows = await matches_repository.aggregate(leaderboard_pipeline(friend_ids, year))
+        else:
+            # Rollups of these users, optionally for a single year
+            rollups = await stats_repository.find_for_users(friend_ids, year)
+            rows = [
+                {"user_id": user_id, **user_totals}
+                for user_id, user_totals in sum_rollups(rollups).items()
+            ]
+            # Sort leaderboard by points, then wins, then goals
+            rows.sort(key=lambda x: (x["points"], x["wins"], x["goals"]), reverse=True)
         
-        # Map of auth_id to username for quick lookup
-        username_map = {user["auth_id"]: user["username"] for user in users}
+        usernames = await resolve_usernames([row["user_id"] for row in rows], users_repository)
         
-        # Initialize leaderboard with users (even those with no matches)
+        # Users with no matches have no rows and are left out
         leaderboard = [
             {
-                "user_id": user["auth_id"],
-                "username": user["username"],
-                "matches_played": 0,
-                "wins": 0,
-                "draws": 0,
-                "losses": 0,
-                "goals": 0,
-                "assists": 0,
-                "points": 0
+                "user_id": row["user_id"],
+                "username": usernames[row["user_id"]],
+                **{counter: row[counter] for counter in COUNTERS}
             }
-            for user in users
+            for row in rows
+            if row["user_id"] in usernames and row["matches_played"] > 0
         ]
         
-        # Create a map for quick access to user stats
-        user_stats_map = {entry["user_id"]: entry for entry in leaderboard}
-        
-        # Get all validated matches involving these users
-        match_query = {
-            "players.user_id": {"$in": friend_ids},
-            "is_validated": True
-        }
-        
-        # Add year filter if provided
-        if year:
-            match_query["date"] = {"$regex": f"^{year}"}
-        
-        matches = matches_collection.find(match_query, {"_id": 0})
-        
-        for match in matches:
-            # Process each player in the match
-            for player in match["players"]:
-                player_id = player["user_id"]
-                
-                # Skip if player is not in our list of users
-                if player_id not in user_stats_map:
-                    continue
-                
-                user_stats = user_stats_map[player_id]
-                user_stats["matches_played"] += 1
-                user_stats["goals"] += player["goals"]
-                user_stats["assists"] += player["assists"]
-                
-                # Determine win/draw/loss based on team and winning_team
-                if match["winning_team"] == player["team"]:
-                    user_stats["wins"] += 1
-                elif match["winning_team"] == "draw":
-                    user_stats["draws"] += 1
-                else:
-                    user_stats["losses"] += 1
-                
-                # Calculate points based on our formula
-                # 3 points for win, 0 for draw/loss
-                win_points = user_stats["wins"] * 3
-                
-                # Points for goals based on match format
-                goal_points = 0
-                if match["format"] in ["F8", "F9", "F10", "F11"]:
-                    # 1 point per goal for F8 and above
-                    goal_points += player["goals"]
-                else:
-                    # 1 point per 2 goals for F7 and below
-                    goal_points += player["goals"] // 2
-                
-                user_stats["points"] = win_points + goal_points
-        
-        # Sort leaderboard by points, then wins, then goals
-        leaderboard.sort(key=lambda x: (x["points"], x["wins"], x["goals"]), reverse=True)
-        
-        # Remove users with no matches
-        leaderboard = [user for user in leaderboard if user["matches_played"] > 0]
-        
-        return leaderboard
+        return fast_response(leaderboard)
     except Exception as e:
         print(f"Error in get_leaderboard: {str(e)}")
         raise HTTPException(
@@ -293,8 +394,12 @@ async def get_leaderboard(year: Optional[str] = None, current_user: UserInDB = D
         )
 
 @router.get("/{match_id}", response_model=MatchResponse)
-async def get_match(match_id: str, current_user: UserInDB = Depends(get_current_user)):
-    match = matches_collection.find_one({"match_id": match_id}, {"_id": 0})
+async def get_match(
+    match_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    matches_repository: MatchesRepository = Depends(get_matches_repository)
+):
+    match = await matches_repository.get(match_id)
     
     if not match:
         raise HTTPException(
@@ -307,78 +412,65 @@ async def get_match(match_id: str, current_user: UserInDB = Depends(get_current_
 @router.post("/{match_id}/players", response_model=MatchResponse)
 async def add_player_to_match(
     match_id: str,
-    player_data: dict,
-    current_user: UserInDB = Depends(get_current_user)
+    player_data: PlayerJoin,
+    current_user: UserInDB = Depends(get_current_user),
+    matches_repository: MatchesRepository = Depends(get_matches_repository),
+    stats_repository: StatsRepository = Depends(get_stats_repository),
+    inbox_repository: InboxRepository = Depends(get_inbox_repository)
 ):
     """Add a player to an existing match with their stats"""
     
-    # Verify the match exists
-    match = matches_collection.find_one({"match_id": match_id}, {"_id": 0})
-    if not match:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Match not found"
-        )
-    
-    # Check if user is already in the match
-    existing_player = any(p["user_id"] == current_user.auth_id for p in match["players"])
-    if existing_player:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="You are already part of this match"
-        )
+    # Create player stats object, validated before it can reach the rollups
+    player_stats = PlayerStats(user_id=current_user.auth_id, **player_data.dict()).dict()
     
-    # Create player stats object
-    player_stats = {
+    # Automatic validation from this user
+    validation = {
         "user_id": current_user.auth_id,
-        "team": player_data.get("team", "A"),
-        "goals": player_data.get("goals", 0),
-        "assists": player_data.get("assists", 0),
+        "timestamp": datetime.now()
     }
     
-    # Add the player to the match
-    result = matches_collection.update_one(
-        {"match_id": match_id},
-        {"$push": {"players": player_stats}}
-    )
-    
-    if result.modified_count == 0:
+    # Add the player and their validation, and validate the match once it has
+    # at least 2 players, all in one conditional update
+    updated_match = await matches_repository.add_player(match_id, player_stats, validation)
+    
+    if updated_match is None:
+        # The update didn't apply, find out why
+        match = await matches_repository.get(match_id)
+        if not match:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Match not found"
+            )
+        
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Failed to add player to match"
+            detail="You are already part of this match"
         )
     
-    # No need to update score anymore, as we're using winning_team
+    # Players who still have to validate keep their inbox entries, the
+    # new player validated on joining and gets none
+    await inbox_repository.add([updated_match])
     
-    # Add automatic validation from this user
-    validation = {
-        "user_id": current_user.auth_id,
-        "timestamp": datetime.now()
-    }
+    # Keep the stats rollups in step. If the match was already counted when
+    # we joined, only this player is missing from them
+    if updated_match.get("stats_applied"):
+        await record_player(updated_match, player_stats, stats_repository)
+    elif updated_match["is_validated"]:
+        if await record_validated_match(match_id, matches_repository, stats_repository):
+            publish_events(match_validated_events(updated_match))
     
-    matches_collection.update_one(
-        {"match_id": match_id},
-        {"$push": {"validations": validation}}
-    )
-    
-    # Check if we should auto-validate the match
-    # If there are at least 2 players in the match, automatically validate it
-    updated_match = matches_collection.find_one({"match_id": match_id}, {"_id": 0})
-    if len(updated_match["players"]) >= 2:
-        matches_collection.update_one(
-            {"match_id": match_id},
-            {"$set": {"is_validated": True}}
-        )
-    
-    # Return the updated match
-    final_match = matches_collection.find_one({"match_id": match_id}, {"_id": 0})
-    return MatchResponse(**final_match)
+    return MatchResponse(**updated_match)
 
 @router.post("/{match_id}/skip-validation")
-async def skip_match_validation(match_id: str, current_user: UserInDB = Depends(get_current_user)):
+async def skip_match_validation(
+    match_id: str,
+    current_user: UserInDB = Depends(get_current_user),
+    matches_repository: MatchesRepository = Depends(get_matches_repository),
+    inbox_repository: InboxRepository = Depends(get_inbox_repository)
+):
     """Skip validation for a match - for when a user was added but didn't actually play"""
     # Find match
-    match = matches_collection.find_one({"match_id": match_id}, {"_id": 0})
+    match = await matches_repository.get(match_id)
     
     if not match:
         raise HTTPException(
@@ -394,9 +486,7 @@ async def skip_match_validation(match_id: str, current_user: UserInDB = Depends(
     }
     
     # Add the validation entry
-    matches_collection.update_one(
-        {"match_id": match_id},
-        {"$push": {"validations": validation}}
-    )
+    await matches_repository.push_validation(match_id, validation)
+    await inbox_repository.remove(current_user.auth_id, [match_id])
     
     return {"message": "Match validation skipped successfully"} 
\ No newline at end of file
@@ -0,0 +1,222 @@
+"""Request and MongoDB command metrics in the Prometheus text format.
+
+MetricsMiddleware times every HTTP request and labels it with the path of
+the route that handled it. CommandMetrics is registered on the MongoDB
+client and attributes each command to the request that issued it through a
+context variable, so every route also reports how many commands it runs.
+Gauges of the in-process caches are read from their `stats()` when scraped.
+"""
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COMMAND_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label tuple"""
+
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # labels -> [count per bucket..., count above the last bucket, sum]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in self._series.items():
+            base = _labels(self.label_names, labels)
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + (repr(float(bound)),))} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_labels(self.label_names + ('le',), labels + ('+Inf',))} {cumulative}")
+            lines.append(f"{self.name}_sum{base} {series[-1]}")
+            lines.append(f"{self.name}_count{base} {cumulative}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Sequence[str]):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = tuple(label_names)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, labels: tuple, value: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_labels(self.label_names, labels)} {value}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+request_duration = Histogram(
+    "scorer_http_request_duration_seconds", "HTTP request latency by route", ("method", "route"), LATENCY_BUCKETS
+)
+requests_total = Counter("scorer_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+request_commands = Histogram(
+    "scorer_mongo_commands_per_request", "MongoDB commands issued per HTTP request", ("route",), COMMAND_COUNT_BUCKETS
+)
+request_command_seconds = Counter(
+    "scorer_mongo_request_command_seconds_total", "Time spent in MongoDB commands by route", ("route",)
+)
+command_duration = Histogram(
+    "scorer_mongo_command_duration_seconds", "MongoDB command latency by command", ("command",), LATENCY_BUCKETS
+)
+command_failures = Counter("scorer_mongo_command_failures_total", "Failed MongoDB commands by command", ("command",))
+
+METRICS = [request_duration, requests_total, request_commands, request_command_seconds, command_duration, command_failures]
+
+
+class RequestStats:
+    """MongoDB usage of one HTTP request"""
+
+    __slots__ = ("scope", "commands", "command_seconds")
+
+    def __init__(self, scope: dict):
+        self.scope = scope
+        self.commands = 0
+        self.command_seconds = 0.0
+
+
+current_request: ContextVar[Optional[RequestStats]] = ContextVar("current_request", default=None)
+
+# Route path of every endpoint function, e.g. get_match -> /api/matches/{match_id}
+_route_paths: Dict[Callable, str] = {}
+
+
+def route_path(scope: dict) -> str:
+    """Path template of the route that handled the request, so ids don't explode the label set"""
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    path = _route_paths.get(endpoint)
+    if path is None:
+        for route in getattr(scope.get("app"), "routes", ()):
+            if getattr(route, "endpoint", None) is not None:
+                _route_paths[route.endpoint] = route.path
+        path = _route_paths.setdefault(endpoint, getattr(endpoint, "__name__", "unknown"))
+    return path
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency, status and MongoDB usage per route"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(scope)
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started_at
+            current_request.reset(token)
+            route = route_path(scope)
+            method = scope["method"]
+            request_duration.observe((method, route), elapsed)
+            requests_total.inc((method, route, str(status_code)))
+            request_commands.observe((route,), stats.commands)
+            if stats.command_seconds:
+                request_command_seconds.inc((route,), stats.command_seconds)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Counts and times MongoDB commands, globally and for the request that issued them"""
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event)
+
+    def failed(self, event):
+        command_failures.inc((event.command_name,))
+        self._record(event)
+
+    def _record(self, event):
+        seconds = event.duration_micros / 1e6
+        command_duration.observe((event.command_name,), seconds)
+        stats = current_request.get()
+        if stats is not None:
+            stats.commands += 1
+            stats.command_seconds += seconds
+
+
+command_metrics = CommandMetrics()
+
+# name -> stats() of an in-process component, exported as gauges
+_gauge_sources: List[Tuple[str, Callable[[], dict]]] = []
+
+
+def register_gauges(name: str, stats: Callable[[], dict]):
+    """Export the numeric values of `stats()` as scorer_<name>_<key> gauges, plus hit ratios"""
+    _gauge_sources.append((name, stats))
+
+
+def _gauge_lines(name: str, values: dict) -> List[str]:
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, bool):
+            value = int(value)
+        if not isinstance(value, (int, float)):
+            continue
+        metric = f"scorer_{name}_{key}"
+        lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+        # hits/misses and user_hits/user_misses pairs also get a ratio
+        if key.endswith("hits"):
+            misses = values.get(key[:-4] + "misses")
+            if isinstance(misses, (int, float)) and value + misses:
+                ratio_metric = f"scorer_{name}_{key[:-4]}hit_ratio"
+                lines += [f"# TYPE {ratio_metric} gauge", f"{ratio_metric} {value / (value + misses):.6f}"]
+    return lines
+
+
+def render() -> str:
+    lines = []
+    for metric in METRICS:
+        lines += metric.render()
+    for name, stats in _gauge_sources:
+        lines += _gauge_lines(name, stats())
+    return "\n".join(lines) + "\n"
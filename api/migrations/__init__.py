@@ -0,0 +1,64 @@
+"""Online, resumable data migrations.
+
+Each migration walks a collection in _id order in small batches and records
+the last processed _id in the `migrations` collection, so it can be stopped
+and restarted at any time without redoing work or holding long locks.
+"""
+import asyncio
+from datetime import datetime
+from typing import Awaitable, Callable, List, Optional
+
+from utils.logging import logger
+
+
+async def run_backfill(
+    db,
+    name: str,
+    collection_name: str,
+    query: dict,
+    apply_batch: Callable[[List[dict]], Awaitable[int]],
+    batch_size: int = 500,
+    pause: float = 0.1,
+    projection: Optional[dict] = None,
+    restart: bool = False
+) -> int:
+    """Run `apply_batch` over every document matching `query`, resuming where the last run stopped"""
+    state = db.migrations
+    collection = db[collection_name]
+
+    if restart:
+        await state.delete_one({"_id": name})
+    progress = await state.find_one({"_id": name}) or {}
+    if progress.get("completed_at"):
+        logger.info(f"Migration {name} already completed at {progress['completed_at']}")
+        return 0
+
+    last_id = progress.get("last_id")
+    processed = progress.get("processed", 0)
+    while True:
+        batch_query = dict(query)
+        if last_id is not None:
+            batch_query["_id"] = {"$gt": last_id}
+        batch = await collection.find(batch_query, projection).sort("_id", 1).limit(batch_size).to_list(None)
+        if not batch:
+            break
+
+        processed += await apply_batch(batch)
+        last_id = batch[-1]["_id"]
+        await state.update_one(
+            {"_id": name},
+            {"$set": {"last_id": last_id, "processed": processed, "updated_at": datetime.utcnow()}},
+            upsert=True
+        )
+        logger.info(f"Migration {name}: {processed} documents processed")
+        # Leave room for production traffic between batches
+        if pause:
+            await asyncio.sleep(pause)
+
+    await state.update_one(
+        {"_id": name},
+        {"$set": {"completed_at": datetime.utcnow(), "processed": processed}},
+        upsert=True
+    )
+    logger.info(f"Migration {name} completed, {processed} documents processed")
+    return processed
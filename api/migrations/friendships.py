@@ -0,0 +1,88 @@
+"""Convert the friend arrays on user documents into friendship edges.
+
+Each user contributes the edges of their own side, so a friendship or a
+pending request ends up as one edge per user once both have been processed.
+
+Run it right after deploying the edge-based friend endpoints, which no
+longer update the arrays. Edges they wrote since take precedence over the
+arrays, and the friendships they removed were pulled from the arrays too,
+so running it late or twice never brings them back. The friend suggestions
+are rebuilt from the edges once the backfill is done.
+
+Usage: python -m migrations.friendships [--batch-size N] [--pause SECONDS] [--restart] [--unset-arrays]
+"""
+import argparse
+import asyncio
+from typing import List
+
+from pymongo import UpdateOne
+
+import database
+from migrations import run_backfill
+from repository import FRIENDSHIP_STATES, LEGACY_FRIEND_ARRAYS
+from suggestions import rebuild
+from utils.logging import logger
+
+# User document array -> state of the user's edge
+ARRAY_STATES = dict(zip(LEGACY_FRIEND_ARRAYS, FRIENDSHIP_STATES))
+
+
+async def backfill_friendships(db, batch_size: int = 500, pause: float = 0.1, restart: bool = False) -> int:
+    async def apply_batch(users: List[dict]) -> int:
+        operations = []
+        for user in users:
+            for array, state in ARRAY_STATES.items():
+                for other_id in user.get(array) or []:
+                    # Edges written by the live endpoints since the deploy win
+                    operations.append(UpdateOne(
+                        {"user_id": user["auth_id"], "other_id": other_id},
+                        {"$setOnInsert": {"state": state, "created_at": user.get("created_at")}},
+                        upsert=True
+                    ))
+        if not operations:
+            return 0
+        result = await db.friendships.bulk_write(operations, ordered=False)
+        return result.upserted_count
+
+    return await run_backfill(
+        db,
+        "users_friendships",
+        "users",
+        {"$or": [{array: {"$exists": True, "$ne": []}} for array in ARRAY_STATES]},
+        apply_batch,
+        batch_size=batch_size,
+        pause=pause,
+        projection={"_id": 1, "auth_id": 1, "created_at": 1, **{array: 1 for array in ARRAY_STATES}},
+        restart=restart
+    )
+
+
+async def unset_arrays(db) -> int:
+    """Drop the converted arrays, once no deployed code reads them anymore"""
+    result = await db.users.update_many(
+        {"$or": [{array: {"$exists": True}} for array in ARRAY_STATES]},
+        {"$unset": {array: "" for array in ARRAY_STATES}}
+    )
+    logger.info(f"Friend arrays removed from {result.modified_count} users")
+    return result.modified_count
+
+
+async def main(args):
+    await database.connect()
+    try:
+        db = database.get_database()
+        if await backfill_friendships(db, args.batch_size, args.pause, args.restart):
+            await rebuild(db)
+        if args.unset_arrays:
+            await unset_arrays(db)
+    finally:
+        await database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.1)
+    parser.add_argument("--restart", action="store_true", help="Ignore the recorded progress")
+    parser.add_argument("--unset-arrays", action="store_true", help="Remove the arrays from the user documents afterwards")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,60 @@
+"""Backfill the normalized played_at datetime on existing matches.
+
+Usage: python -m migrations.played_at [--batch-size N] [--pause SECONDS] [--restart]
+"""
+import argparse
+import asyncio
+from typing import List
+
+from pymongo import UpdateOne
+
+import database
+from migrations import run_backfill
+from utils.dates import parse_played_at
+from utils.logging import logger
+
+
+async def backfill_played_at(db, batch_size: int = 500, pause: float = 0.1, restart: bool = False) -> int:
+    async def apply_batch(matches: List[dict]) -> int:
+        operations = []
+        for match in matches:
+            played_at = parse_played_at(match.get("date", ""), match.get("time"))
+            if played_at is None:
+                logger.warning(f"Match {match.get('match_id')} has an unparseable date: {match.get('date')!r}")
+            # Guarded so a concurrent write of played_at is never overwritten
+            operations.append(UpdateOne(
+                {"_id": match["_id"], "played_at": {"$exists": False}},
+                {"$set": {"played_at": played_at}}
+            ))
+        if not operations:
+            return 0
+        result = await db.matches.bulk_write(operations, ordered=False)
+        return result.modified_count
+
+    return await run_backfill(
+        db,
+        "matches_played_at",
+        "matches",
+        {"played_at": {"$exists": False}},
+        apply_batch,
+        batch_size=batch_size,
+        pause=pause,
+        projection={"_id": 1, "match_id": 1, "date": 1, "time": 1},
+        restart=restart
+    )
+
+
+async def main(args):
+    await database.connect()
+    try:
+        await backfill_played_at(database.get_database(), args.batch_size, args.pause, args.restart)
+    finally:
+        await database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.1)
+    parser.add_argument("--restart", action="store_true", help="Ignore the recorded progress")
+    asyncio.run(main(parser.parse_args()))
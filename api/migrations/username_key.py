@@ -0,0 +1,57 @@
+"""Backfill the normalized username_key used by the username search.
+
+Usage: python -m migrations.username_key [--batch-size N] [--pause SECONDS] [--restart]
+"""
+import argparse
+import asyncio
+from typing import List
+
+from pymongo import UpdateOne
+
+import database
+from migrations import run_backfill
+from utils.search import username_key
+
+
+async def backfill_username_key(db, batch_size: int = 500, pause: float = 0.1, restart: bool = False) -> int:
+    async def apply_batch(users: List[dict]) -> int:
+        operations = [
+            # Guarded so a username changed since the read is never overwritten
+            UpdateOne(
+                {"_id": user["_id"], "username": user["username"]},
+                {"$set": {"username_key": username_key(user["username"])}}
+            )
+            for user in users
+        ]
+        if not operations:
+            return 0
+        result = await db.users.bulk_write(operations, ordered=False)
+        return result.modified_count
+
+    return await run_backfill(
+        db,
+        "users_username_key",
+        "users",
+        {"username": {"$type": "string"}, "username_key": {"$exists": False}},
+        apply_batch,
+        batch_size=batch_size,
+        pause=pause,
+        projection={"_id": 1, "username": 1},
+        restart=restart
+    )
+
+
+async def main(args):
+    await database.connect()
+    try:
+        await backfill_username_key(database.get_database(), args.batch_size, args.pause, args.restart)
+    finally:
+        await database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.1)
+    parser.add_argument("--restart", action="store_true", help="Ignore the recorded progress")
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,48 @@
+"""Fill the validation inbox from the existing matches.
+
+Usage: python -m migrations.validation_inbox [--batch-size N] [--pause SECONDS] [--restart]
+"""
+import argparse
+import asyncio
+from typing import List
+
+import database
+from migrations import run_backfill
+from repository import InboxRepository
+
+
+async def backfill_validation_inbox(db, batch_size: int = 500, pause: float = 0.1, restart: bool = False) -> int:
+    inbox_repository = InboxRepository(db)
+
+    async def apply_batch(matches: List[dict]) -> int:
+        # Upserts with $setOnInsert, so entries written live are left as they are
+        await inbox_repository.add(matches)
+        return len(matches)
+
+    return await run_backfill(
+        db,
+        "matches_validation_inbox",
+        "matches",
+        {},
+        apply_batch,
+        batch_size=batch_size,
+        pause=pause,
+        projection={"_id": 1, "match_id": 1, "created_by": 1, "played_at": 1, "players.user_id": 1, "validations.user_id": 1},
+        restart=restart
+    )
+
+
+async def main(args):
+    await database.connect()
+    try:
+        await backfill_validation_inbox(database.get_database(), args.batch_size, args.pause, args.restart)
+    finally:
+        await database.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--pause", type=float, default=0.1)
+    parser.add_argument("--restart", action="store_true", help="Ignore the recorded progress")
+    asyncio.run(main(parser.parse_args()))
@@ -1,6 +1,6 @@
 from datetime import datetime
-from typing import List, Optional, Dict, Literal, Any
-from pydantic import BaseModel, Field, EmailStr
+from typing import List, Optional, Dict, Literal, Any, Set
+from pydantic import BaseModel, Field, EmailStr, conint
 import uuid
 
 
@@ -21,16 +21,17 @@ class UserInDB(BaseModel):
     auth_id: str
     username: str
     email: str
-    friends: List[str] = Field(default_factory=list)
-    pending_sent_requests: List[str] = Field(default_factory=list)
-    pending_received_requests: List[str] = Field(default_factory=list)
     created_at: datetime = Field(default_factory=datetime.utcnow)
-    mutual_friends: int = Field(default=0)
 
     class Config:
         populate_by_name = True
         arbitrary_types_allowed = True
 
+class UserRelationships(BaseModel):
+    friends: Set[str] = Field(default_factory=set)
+    sent: Set[str] = Field(default_factory=set)
+    received: Set[str] = Field(default_factory=set)
+
 class UserResponse(BaseModel):
     auth_id: str
     username: str
@@ -49,15 +50,23 @@ class PlayerStats(BaseModel):
     goals: int = 0
     assists: int = 0
 
+class PlayerJoin(BaseModel):
+    """Stats submitted when joining a match, the user comes from the token"""
+    team: Literal["A", "B"] = "A"
+    goals: conint(strict=True, ge=0) = 0
+    assists: conint(strict=True, ge=0) = 0
+
 class MatchValidation(BaseModel):
     user_id: str
     timestamp: datetime = Field(default_factory=datetime.now)
 
+MatchFormat = Literal["F5", "F6", "F7", "F8", "F9", "F10", "F11"]
+
 class MatchBase(BaseModel):
     date: str
     location: str
     time: str
-    format: Literal["F5", "F6", "F7", "F8", "F9", "F10", "F11"]
+    format: MatchFormat
     
     class Config:
         populate_by_name = True
@@ -70,6 +79,7 @@ class MatchCreate(MatchBase):
 class MatchInDB(MatchBase):
     match_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     created_by: str
+    played_at: Optional[datetime] = None
     players: List[PlayerStats]
     winning_team: Literal["A", "B", "draw"]
     validations: List[MatchValidation] = []
@@ -79,12 +89,20 @@ class MatchInDB(MatchBase):
 class MatchResponse(MatchBase):
     match_id: str
     created_by: str
+    played_at: Optional[datetime] = None
     players: List[Dict]
     winning_team: Literal["A", "B", "draw"]
     validations: List[Dict]
     is_validated: bool
     created_at: datetime
 
+class MatchPage(BaseModel):
+    items: List[MatchResponse]
+    next_cursor: Optional[str] = None
+
+class BatchValidationRequest(BaseModel):
+    match_ids: List[str] = Field(..., min_items=1, max_items=100)
+
 class FriendRequest(BaseModel):
     user_id: str
 
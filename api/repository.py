@@ -0,0 +1,577 @@
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from pymongo import ASCENDING, DESCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from utils.search import prefix_range, username_key
+
+FRIENDSHIP_STATES = ("friends", "sent", "received")
+# Friend arrays on user documents, read once by migrations/friendships.py
+LEGACY_FRIEND_ARRAYS = ("friends", "pending_sent_requests", "pending_received_requests")
+
+
+def _friend_state_stages(user_id: str) -> List[dict]:
+    """Stages adding `friend_state`, the state of user_id's edge towards each user"""
+    return [
+        {"$lookup": {
+            "from": "friendships",
+            "localField": "auth_id",
+            "foreignField": "other_id",
+            "pipeline": [
+                {"$match": {"user_id": user_id}},
+                {"$project": {"_id": 0, "state": 1}}
+            ],
+            "as": "friendship"
+        }},
+        {"$set": {"friend_state": {"$first": "$friendship.state"}}},
+        {"$project": {"_id": 0, "friendship": 0}}
+    ]
+
+
+class UsersRepository:
+    """Async access to the users collection"""
+
+    def __init__(self, db):
+        self.collection = db.users
+
+    async def ping(self) -> bool:
+        return await self.collection.find_one({}, {"_id": 1}) is not None
+
+    async def get(self, auth_id: str, projection: Optional[dict] = None) -> Optional[dict]:
+        return await self.collection.find_one({"auth_id": auth_id}, projection or {"_id": 0})
+
+    async def get_by_username(self, username: str) -> Optional[dict]:
+        return await self.collection.find_one({"username": username}, {"_id": 0})
+
+    async def get_many(self, auth_ids: List[str], projection: Optional[dict] = None) -> List[dict]:
+        cursor = self.collection.find({"auth_id": {"$in": list(auth_ids)}}, projection or {"_id": 0})
+        return await cursor.to_list(None)
+
+    async def insert(self, user: dict):
+        if user.get("username"):
+            user["username_key"] = username_key(user["username"])
+        await self.collection.insert_one(user)
+
+    async def insert_if_missing(self, user: dict, projection: Optional[dict] = None) -> dict:
+        """Insert `user` unless its auth_id already exists, returning the stored document.
+
+        An upsert with $setOnInsert, so concurrent first logins of the same
+        user all get the one document instead of a DuplicateKeyError.
+        """
+        if user.get("username"):
+            user["username_key"] = username_key(user["username"])
+        fields = {key: value for key, value in user.items() if key != "auth_id"}
+        return await self.collection.find_one_and_update(
+            {"auth_id": user["auth_id"]},
+            {"$setOnInsert": fields},
+            projection=projection or {"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def set_username(self, auth_id: str, username: str, created_at) -> int:
+        result = await self.collection.update_one(
+            {"auth_id": auth_id},
+            {"$set": {
+                "username": username,
+                "username_key": username_key(username),
+                "created_at": created_at
+            }}
+        )
+        return result.modified_count
+
+    async def search_by_username(self, query: str, user_id: str, limit: int = 10) -> List[dict]:
+        """Users whose username starts with `query`, ignoring case, other than `user_id`.
+
+        The prefix is matched as a range on the normalized username_key, so it
+        is a bounded index scan and the input needs no escaping. Each user
+        comes with the caller's `friend_state` towards them, if any.
+        """
+        lower, upper = prefix_range(username_key(query))
+        key_range = {"$gte": lower}
+        if upper is not None:
+            key_range["$lt"] = upper
+        cursor = await self.collection.aggregate([
+            {"$match": {"username_key": key_range, "auth_id": {"$ne": user_id}}},
+            {"$sort": {"username_key": 1}},
+            {"$limit": limit},
+            *_friend_state_stages(user_id)
+        ])
+        return await cursor.to_list(None)
+
+    async def get_many_with_friend_state(self, auth_ids: List[str], user_id: str) -> List[dict]:
+        """Users in the order of `auth_ids`, each with the friend_state of `user_id` towards them"""
+        cursor = await self.collection.aggregate([
+            {"$match": {"auth_id": {"$in": list(auth_ids)}}},
+            *_friend_state_stages(user_id)
+        ])
+        users = {user["auth_id"]: user async for user in cursor}
+        return [users[auth_id] for auth_id in auth_ids if auth_id in users]
+
+    async def iter_registered(self, since: Optional[datetime] = None):
+        """auth_id and username of every registered user, optionally only since a date"""
+        query = {"username": {"$type": "string"}}
+        if since:
+            query["created_at"] = {"$gte": since}
+        cursor = self.collection.find(query, {"_id": 0, "auth_id": 1, "username": 1}).batch_size(5000)
+        async for user in cursor:
+            yield user
+
+
+class MatchesRepository:
+    """Async access to the matches collection"""
+
+    def __init__(self, db):
+        self.collection = db.matches
+
+    async def get(self, match_id: str) -> Optional[dict]:
+        return await self.collection.find_one({"match_id": match_id}, {"_id": 0})
+
+    async def insert(self, match: dict):
+        await self.collection.insert_one(match)
+
+    async def insert_many(self, matches: List[dict]) -> List[Tuple[int, str]]:
+        """Insert a chunk of matches, returning (position, error) for the ones that failed"""
+        try:
+            await self.collection.insert_many(matches, ordered=False)
+        except BulkWriteError as e:
+            return [(error["index"], error["errmsg"]) for error in e.details.get("writeErrors", [])]
+        return []
+
+    async def add_player(self, match_id: str, player: dict, validation: dict) -> Optional[dict]:
+        """Add a player with their automatic validation in one conditional update.
+
+        The filter guarantees the user isn't already a player, so concurrent
+        joins can't add them twice. Any match with two or more players is
+        validated. Returns the updated match, or None if the filter didn't match.
+        """
+        return await self.collection.find_one_and_update(
+            {"match_id": match_id, "players.user_id": {"$ne": player["user_id"]}},
+            [
+                {"$set": {
+                    "players": {"$concatArrays": ["$players", [{"$literal": player}]]},
+                    "validations": {"$concatArrays": [
+                        {"$ifNull": ["$validations", []]},
+                        [{"$literal": validation}]
+                    ]}
+                }},
+                {"$set": {"is_validated": {"$or": [
+                    {"$eq": ["$is_validated", True]},
+                    {"$gte": [{"$size": "$players"}, 2]}
+                ]}}}
+            ],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def push_validation(self, match_id: str, validation: dict):
+        await self.collection.update_one(
+            {"match_id": match_id},
+            {"$push": {"validations": validation}}
+        )
+
+    async def validate(self, match_id: str, validation: dict) -> Optional[dict]:
+        """Append a participant's validation and recompute is_validated in one update.
+
+        The filter only matches if the user played in the match and hasn't
+        validated it yet, so concurrent validations can't double up. A match
+        that becomes validated is flagged stats_applied in the same update.
+        Returns the match as it was before the update, or None if the filter
+        didn't match.
+        """
+        return await self.collection.find_one_and_update(
+            self._validation_filter(match_id, validation["user_id"]),
+            self._validation_pipeline(validation) + [
+                {"$set": {"stats_applied": {"$or": [{"$eq": ["$stats_applied", True]}, "$is_validated"]}}}
+            ],
+            projection={"_id": 0},
+            return_document=ReturnDocument.BEFORE
+        )
+
+    async def validate_many(self, match_ids: List[str], validation: dict) -> int:
+        """Apply the same participant validation to several matches with one bulk write.
+
+        Uses the conditional update of `validate`, but leaves stats_applied
+        alone: matches it validates are counted afterwards with `claim_stats_many`.
+        Returns the number of matches updated.
+        """
+        if not match_ids:
+            return 0
+        pipeline = self._validation_pipeline(validation)
+        operations = [
+            UpdateOne(self._validation_filter(match_id, validation["user_id"]), pipeline)
+            for match_id in match_ids
+        ]
+        result = await self.collection.bulk_write(operations, ordered=False)
+        return result.modified_count
+
+    @staticmethod
+    def _validation_filter(match_id: str, user_id: str) -> dict:
+        return {"match_id": match_id, "players.user_id": user_id, "validations.user_id": {"$ne": user_id}}
+
+    @staticmethod
+    def _validation_pipeline(validation: dict) -> List[dict]:
+        enough_validations = {"$gte": [{"$size": "$validations"}, {"$divide": [{"$size": "$players"}, 2]}]}
+        return [
+            {"$set": {"validations": {"$concatArrays": [
+                {"$ifNull": ["$validations", []]},
+                [{"$literal": validation}]
+            ]}}},
+            {"$set": {"is_validated": {"$or": [{"$eq": ["$is_validated", True]}, enough_validations]}}}
+        ]
+
+    async def get_many(self, match_ids: List[str], projection: Optional[dict] = None) -> List[dict]:
+        cursor = self.collection.find({"match_id": {"$in": list(match_ids)}}, projection or {"_id": 0})
+        return await cursor.to_list(None)
+
+    async def aggregate(self, pipeline: List[dict]) -> List[dict]:
+        cursor = await self.collection.aggregate(pipeline)
+        return await cursor.to_list(None)
+
+    async def claim_stats(self, match_id: str) -> Optional[dict]:
+        """Mark a validated match as counted in the stats rollups.
+
+        Only the first caller gets the match back, so its players are added
+        to the rollups exactly once.
+        """
+        return await self.collection.find_one_and_update(
+            {"match_id": match_id, "is_validated": True, "stats_applied": {"$ne": True}},
+            {"$set": {"stats_applied": True}},
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER
+        )
+
+    async def claim_stats_many(self, match_ids: List[str]) -> List[dict]:
+        """Mark the validated matches among `match_ids` as counted, in one update.
+
+        Each claimed match is tagged with this call's claim id, so concurrent
+        callers only get back the matches their own update flagged.
+        """
+        if not match_ids:
+            return []
+        claim_id = str(uuid.uuid4())
+        result = await self.collection.update_many(
+            {"match_id": {"$in": list(match_ids)}, "is_validated": True, "stats_applied": {"$ne": True}},
+            {"$set": {"stats_applied": True, "stats_claim": claim_id}}
+        )
+        if not result.modified_count:
+            return []
+        cursor = self.collection.find(
+            {"match_id": {"$in": list(match_ids)}, "stats_claim": claim_id},
+            {"_id": 0, "stats_claim": 0}
+        )
+        return await cursor.to_list(None)
+
+    async def find_for_user(
+        self,
+        user_id: str,
+        limit: Optional[int] = None,
+        after: Optional[Tuple[Optional[datetime], str]] = None,
+        played_from: Optional[datetime] = None,
+        played_before: Optional[datetime] = None,
+        match_format: Optional[str] = None
+    ) -> List[dict]:
+        """Matches the user created or played in, newest first.
+
+        Ordered by (played_at, match_id) so `after` can resume a page from the
+        last row of the previous one as a bounded index range scan. Matches
+        without a played_at sort last.
+        """
+        query = self._for_user_query(user_id, after, played_from, played_before, match_format)
+        cursor = self.collection.find(query, {"_id": 0}).sort([("played_at", DESCENDING), ("match_id", DESCENDING)])
+        if limit:
+            cursor = cursor.limit(limit)
+        return await cursor.to_list(None)
+
+    def iter_for_user(self, user_id: str, batch_size: int, projection: Optional[dict] = None):
+        """Cursor over every match of the user in `find_for_user` order, fetched `batch_size` at a time"""
+        query = self._for_user_query(user_id)
+        return self.collection.find(query, projection or {"_id": 0}).sort(
+            [("played_at", DESCENDING), ("match_id", DESCENDING)]
+        ).batch_size(batch_size)
+
+    @staticmethod
+    def _played_at_branches(
+        after: Optional[Tuple[Optional[datetime], str]],
+        played_from: Optional[datetime],
+        played_before: Optional[datetime]
+    ) -> List[dict]:
+        """played_at/match_id conditions of a page, one per keyset branch, with the date range folded in"""
+        played_range = {}
+        if played_from:
+            played_range["$gte"] = played_from
+        if played_before:
+            played_range["$lt"] = played_before
+
+        if after is None:
+            return [{"played_at": played_range}] if played_range else [{}]
+
+        after_played_at, after_match_id = after
+        if after_played_at is None:
+            # Past the dated matches, only undated ones remain and they can't be in a date range
+            return [] if played_range else [{"played_at": None, "match_id": {"$lt": after_match_id}}]
+
+        earlier = dict(played_range)
+        earlier["$lt"] = min(after_played_at, played_before) if played_before else after_played_at
+        branches = [{"played_at": earlier}]
+        if (not played_from or after_played_at >= played_from) and (not played_before or after_played_at < played_before):
+            branches.append({"played_at": after_played_at, "match_id": {"$lt": after_match_id}})
+        if not played_range:
+            branches.append({"played_at": None})
+        return branches
+
+    @classmethod
+    def _for_user_query(
+        cls,
+        user_id: str,
+        after: Optional[Tuple[Optional[datetime], str]] = None,
+        played_from: Optional[datetime] = None,
+        played_before: Optional[datetime] = None,
+        match_format: Optional[str] = None
+    ) -> dict:
+        """One $or branch per (user field, keyset branch).
+
+        Every branch is a plain conjunction led by an equality on created_by
+        or players.user_id, so each one is a tight range scan of its
+        (user, played_at, match_id) index and the planner merges them in
+        sort order. A top-level $and of two $or clauses doesn't get bounds
+        that tight.
+        """
+        extra = {"format": match_format} if match_format else {}
+        branches = [
+            {field: user_id, **played_at, **extra}
+            for field in ("created_by", "players.user_id")
+            for played_at in cls._played_at_branches(after, played_from, played_before)
+        ]
+        if not branches:
+            # Nothing can follow the cursor within the date range
+            return {"match_id": {"$in": []}}
+        return {"$or": branches}
+
+class InboxRepository:
+    """Async access to the per-user validation inbox.
+
+    One entry per (user_id, match_id) for every match the user played in,
+    didn't create and hasn't validated or skipped yet. Entries are written
+    when matches are created or joined and removed when the user validates.
+    """
+
+    def __init__(self, db):
+        self.collection = db.validation_inbox
+
+    @staticmethod
+    def entries(match: dict) -> List[dict]:
+        """Inbox entries a match needs in its current state"""
+        validated = {validation.get("user_id") for validation in match.get("validations") or []}
+        return [
+            {
+                "user_id": player["user_id"],
+                "match_id": match["match_id"],
+                "created_by": match["created_by"],
+                "played_at": match.get("played_at")
+            }
+            for player in match["players"]
+            if player["user_id"] != match["created_by"] and player["user_id"] not in validated
+        ]
+
+    async def add(self, matches: List[dict]):
+        """Fan the matches out to the inboxes of the players who still have to validate them"""
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"user_id": entry["user_id"], "match_id": entry["match_id"]},
+                {"$setOnInsert": {**entry, "created_at": now}},
+                upsert=True
+            )
+            for match in matches
+            for entry in self.entries(match)
+        ]
+        if operations:
+            await self.collection.bulk_write(operations, ordered=False)
+
+    async def remove(self, user_id: str, match_ids: List[str]):
+        if match_ids:
+            await self.collection.delete_many({"user_id": user_id, "match_id": {"$in": list(match_ids)}})
+
+    async def pending_matches(self, user_id: str) -> List[dict]:
+        """Matches in the user's inbox, newest first"""
+        cursor = await self.collection.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$sort": {"played_at": -1, "match_id": -1}},
+            {"$lookup": {
+                "from": "matches",
+                "localField": "match_id",
+                "foreignField": "match_id",
+                "pipeline": [{"$project": {"_id": 0, "stats_applied": 0}}],
+                "as": "match"
+            }},
+            {"$unwind": "$match"},
+            {"$replaceRoot": {"newRoot": "$match"}},
+            # An entry may briefly outlive a validation written concurrently
+            {"$match": {"validations.user_id": {"$ne": user_id}}}
+        ])
+        return await cursor.to_list(None)
+
+
+class StatsRepository:
+    """Async access to the per-user stats rollups, keyed by (user_id, year, format)"""
+
+    def __init__(self, db):
+        self.collection = db.user_stats
+
+    async def increment(self, rows: List[dict]):
+        """Add each row's counters to its (user_id, year, format) rollup"""
+        if not rows:
+            return
+        operations = [
+            UpdateOne(
+                {"user_id": row["user_id"], "year": row["year"], "format": row["format"]},
+                {"$inc": row["counters"]},
+                upsert=True
+            )
+            for row in rows
+        ]
+        await self.collection.bulk_write(operations, ordered=False)
+
+    async def find_for_users(self, user_ids: List[str], year: Optional[int] = None) -> List[dict]:
+        query = {"user_id": {"$in": list(user_ids)}}
+        if year:
+            query["year"] = str(year)
+        return await self.collection.find(query, {"_id": 0}).to_list(None)
+
+
+class FriendshipsRepository:
+    """Async access to the friendship edges.
+
+    Every relationship is stored as one edge per side: (user_id, other_id, state)
+    where state is "friends", "sent" (user_id asked other_id) or "received".
+    """
+
+    def __init__(self, db):
+        self.collection = db.friendships
+        self.users = db.users
+
+    async def relationships(self, user_id: str) -> Dict[str, List[str]]:
+        """Ids of the user's friends and pending requests, grouped by state"""
+        relationships = {state: [] for state in FRIENDSHIP_STATES}
+        async for edge in self.collection.find({"user_id": user_id}, {"_id": 0, "other_id": 1, "state": 1}):
+            relationships[edge["state"]].append(edge["other_id"])
+        return relationships
+
+    async def ids(self, user_id: str, state: str) -> List[str]:
+        cursor = self.collection.find({"user_id": user_id, "state": state}, {"_id": 0, "other_id": 1})
+        return [edge["other_id"] async for edge in cursor]
+
+    async def state_between(self, user_id: str, other_id: str) -> Optional[str]:
+        edge = await self.collection.find_one({"user_id": user_id, "other_id": other_id}, {"_id": 0, "state": 1})
+        return edge["state"] if edge else None
+
+    async def send_request(self, user_id: str, other_id: str):
+        now = datetime.utcnow()
+        await self.collection.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "other_id": other_id},
+                {"$setOnInsert": {"state": "sent", "created_at": now}},
+                upsert=True
+            ),
+            UpdateOne(
+                {"user_id": other_id, "other_id": user_id},
+                {"$setOnInsert": {"state": "received", "created_at": now}},
+                upsert=True
+            )
+        ], ordered=False)
+
+    async def accept_request(self, user_id: str, other_id: str) -> bool:
+        """Turn a request other_id sent to user_id into a friendship"""
+        now = datetime.utcnow()
+        result = await self.collection.bulk_write([
+            UpdateOne(
+                {"user_id": user_id, "other_id": other_id, "state": "received"},
+                {"$set": {"state": "friends", "created_at": now}}
+            ),
+            UpdateOne(
+                {"user_id": other_id, "other_id": user_id, "state": "sent"},
+                {"$set": {"state": "friends", "created_at": now}}
+            )
+        ], ordered=False)
+        return result.modified_count > 0
+
+    async def remove_friend(self, user_id: str, other_id: str) -> bool:
+        """Delete both friendship edges, only the caller that removes them gets True.
+
+        The pair is also pulled from the legacy friend arrays of users the
+        backfill may not have unset yet, so rerunning it can't bring the
+        friendship back.
+        """
+        result = await self.collection.delete_many({
+            "$or": [
+                {"user_id": user_id, "other_id": other_id, "state": "friends"},
+                {"user_id": other_id, "other_id": user_id, "state": "friends"}
+            ]
+        })
+        if result.deleted_count == 0:
+            return False
+        for auth_id, friend_id in ((user_id, other_id), (other_id, user_id)):
+            await self.users.update_one(
+                {"auth_id": auth_id, "$or": [{array: friend_id} for array in LEGACY_FRIEND_ARRAYS]},
+                {"$pull": {array: friend_id for array in LEGACY_FRIEND_ARRAYS}}
+            )
+        return True
+
+
+class SuggestionsRepository:
+    """Async access to the precomputed friend suggestions.
+
+    One document per (user_id, candidate_id) holding `via`, the friends they
+    have in common, and its size as `mutual_friends`. Mutual friends are added
+    and removed as set members, so two requests recording the same path
+    through a friend count it once. Candidates who are already friends are
+    kept and filtered out when reading, so the documents only depend on the
+    friend graph.
+    """
+
+    def __init__(self, db):
+        self.collection = db.friend_suggestions
+
+    async def add_paths(self, rows: List[dict]):
+        """Add each row's `via` friend to the mutual friends of its (user_id, candidate_id)"""
+        if not rows:
+            return
+        operations = [
+            UpdateOne(
+                {"user_id": row["user_id"], "candidate_id": row["candidate_id"]},
+                [
+                    {"$set": {"via": {"$setUnion": [{"$ifNull": ["$via", []]}, [row["via"]]]}}},
+                    {"$set": {"mutual_friends": {"$size": "$via"}}}
+                ],
+                upsert=True
+            )
+            for row in rows
+        ]
+        await self.collection.bulk_write(operations, ordered=False)
+
+    async def remove_paths(self, user_id: str, other_id: str):
+        """Remove every mutual friendship that went through the friendship of user_id and other_id"""
+        paths = [
+            {field: left, "via": right}
+            for left, right in ((user_id, other_id), (other_id, user_id))
+            for field in ("user_id", "candidate_id")
+        ]
+        await self.collection.update_many({"$or": paths}, [
+            {"$set": {"via": {"$setDifference": ["$via", [user_id, other_id]]}}},
+            {"$set": {"mutual_friends": {"$size": "$via"}}}
+        ])
+        await self.collection.delete_many({
+            "$or": [{field: {"$in": [user_id, other_id]}} for field in ("user_id", "candidate_id")],
+            "mutual_friends": {"$lte": 0}
+        })
+
+    async def find_for_user(self, user_id: str, exclude: List[str], limit: int = 5) -> List[dict]:
+        """Best candidates for the user, most mutual friends first"""
+        cursor = self.collection.find(
+            {"user_id": user_id, "candidate_id": {"$nin": list(exclude)}},
+            {"_id": 0, "candidate_id": 1, "mutual_friends": 1}
+        ).sort([("mutual_friends", DESCENDING), ("candidate_id", ASCENDING)]).limit(limit)
+        return await cursor.to_list(None)
@@ -0,0 +1,28 @@
+"""Fast JSON path for the list endpoints.
+
+Documents read from MongoDB were validated when they were written, so list
+endpoints shape them into plain dicts holding the fields of their response
+model and encode them with orjson. This skips building a pydantic model per
+row, re-validating it through `response_model` and the stdlib JSON encoder.
+`response_model` still documents the schema.
+"""
+import os
+from typing import Any, Iterable, List, Type
+
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel
+
+FAST_JSON_RESPONSES = os.environ.get("FAST_JSON_RESPONSES", "true").lower() == "true"
+
+
+def shape_many(model: Type[BaseModel], documents: Iterable[dict]) -> List[dict]:
+    """Each document restricted to the fields of `model`, missing ones set to their default"""
+    fields = [(name, field.default) for name, field in model.__fields__.items()]
+    return [{name: document.get(name, default) for name, default in fields} for document in documents]
+
+
+def fast_response(content: Any) -> Any:
+    """Encode `content` with orjson, or hand it to FastAPI's validation and encoding when disabled"""
+    if FAST_JSON_RESPONSES:
+        return ORJSONResponse(content)
+    return content
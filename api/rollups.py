@@ -0,0 +1,231 @@
+"""Per-user stats rollups keyed by (user_id, year, format).
+
+Rollups are updated when a match becomes validated, so /stats and
+/leaderboard read a handful of rollup documents per user instead of
+re-scanning every validated match.
+
+Usage: python rollups.py [rebuild|check]
+"""
+import asyncio
+import sys
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+import database
+from repository import MatchesRepository, StatsRepository
+from utils.logging import logger
+
+COUNTERS = ["matches_played", "wins", "draws", "losses", "goals", "assists", "points"]
+
+# 1 point per goal for F8 and above, 1 point per 2 goals for F7 and below
+GOAL_POINT_FORMATS = ["F8", "F9", "F10", "F11"]
+
+
+def match_year(match: dict) -> str:
+    # Matches not yet backfilled with played_at fall back to the date prefix
+    if match.get("played_at"):
+        return str(match["played_at"].year)
+    return match["date"][:4]
+
+
+def player_counters(match: dict, player: dict) -> Dict[str, int]:
+    """What a single validated match adds to one player's rollup"""
+    won = match["winning_team"] == player["team"]
+    drew = not won and match["winning_team"] == "draw"
+    goals = player.get("goals", 0)
+    goal_points = goals if match["format"] in GOAL_POINT_FORMATS else goals // 2
+    return {
+        "matches_played": 1,
+        "wins": int(won),
+        "draws": int(drew),
+        "losses": int(not won and not drew),
+        "goals": goals,
+        "assists": player.get("assists", 0),
+        # 3 points for a win, plus the goal points of this match
+        "points": 3 * int(won) + goal_points
+    }
+
+
+def rollup_rows(match: dict, players: Iterable[dict]) -> List[dict]:
+    return [
+        {
+            "user_id": player["user_id"],
+            "year": match_year(match),
+            "format": match["format"],
+            "counters": player_counters(match, player)
+        }
+        for player in players
+    ]
+
+
+async def record_match(match: dict, stats_repository: StatsRepository):
+    """Add every player of a match that was just flagged stats_applied"""
+    await stats_repository.increment(rollup_rows(match, match["players"]))
+
+
+async def record_validated_match(match_id: str, matches_repository: MatchesRepository, stats_repository: StatsRepository) -> Optional[dict]:
+    """Add every player of a validated match to the rollups, once per match.
+
+    Returns the match if this call counted it, None if it was already counted.
+    """
+    match = await matches_repository.claim_stats(match_id)
+    if match:
+        await record_match(match, stats_repository)
+    return match
+
+
+async def record_validated_matches(match_ids: List[str], matches_repository: MatchesRepository, stats_repository: StatsRepository) -> List[dict]:
+    """Batch version of `record_validated_match`: one claim, one rollup write.
+
+    Returns the matches this call counted.
+    """
+    matches = await matches_repository.claim_stats_many(match_ids)
+    rows = [row for match in matches for row in rollup_rows(match, match["players"])]
+    await stats_repository.increment(rows)
+    return matches
+
+
+async def record_player(match: dict, player: dict, stats_repository: StatsRepository):
+    """Add a player who joined a match that was already counted"""
+    await stats_repository.increment(rollup_rows(match, [player]))
+
+
+def empty_totals() -> Dict[str, int]:
+    return {counter: 0 for counter in COUNTERS}
+
+
+def sum_rollups(rollups: Iterable[dict]) -> Dict[str, Dict[str, int]]:
+    """Totals per user_id across years and formats"""
+    totals: Dict[str, Dict[str, int]] = {}
+    for rollup in rollups:
+        user_totals = totals.setdefault(rollup["user_id"], empty_totals())
+        for counter in COUNTERS:
+            user_totals[counter] += rollup.get(counter, 0)
+    return totals
+
+
+def counter_accumulators() -> dict:
+    """$group accumulators over unwound `$players`, mirroring player_counters"""
+    won = {"$eq": ["$winning_team", "$players.team"]}
+    drew = {"$and": [{"$not": [won]}, {"$eq": ["$winning_team", "draw"]}]}
+    goals = {"$ifNull": ["$players.goals", 0]}
+    goal_points = {"$cond": [
+        {"$in": ["$format", GOAL_POINT_FORMATS]},
+        goals,
+        {"$toInt": {"$floor": {"$divide": [goals, 2]}}}
+    ]}
+    return {
+        "matches_played": {"$sum": 1},
+        "wins": {"$sum": {"$cond": [won, 1, 0]}},
+        "draws": {"$sum": {"$cond": [drew, 1, 0]}},
+        "losses": {"$sum": {"$cond": [{"$or": [won, drew]}, 0, 1]}},
+        "goals": {"$sum": goals},
+        "assists": {"$sum": {"$ifNull": ["$players.assists", 0]}},
+        "points": {"$sum": {"$add": [{"$cond": [won, 3, 0]}, goal_points]}}
+    }
+
+
+def rollup_stages() -> List[dict]:
+    """Aggregation stages computing rollups from validated matches"""
+    return [
+        {"$match": {"is_validated": True}},
+        {"$unwind": "$players"},
+        {"$group": {
+            "_id": {
+                "user_id": "$players.user_id",
+                "year": {"$ifNull": [
+                    {"$toString": {"$year": "$played_at"}},
+                    {"$substrCP": ["$date", 0, 4]}
+                ]},
+                "format": "$format"
+            },
+            **counter_accumulators()
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "year": "$_id.year",
+            "format": "$_id.format",
+            **{counter: 1 for counter in COUNTERS}
+        }}
+    ]
+
+
+async def rebuild(db):
+    """Recompute every rollup from the raw matches.
+
+    Run it once after deploying rollups and whenever `check` reports drift,
+    preferably outside peak hours: matches validated while it runs may be
+    counted by both the rebuild and the live path.
+    """
+    rebuilt_at = datetime.utcnow()
+    await db.matches.update_many(
+        {"is_validated": True, "stats_applied": {"$ne": True}},
+        {"$set": {"stats_applied": True}}
+    )
+    pipeline = rollup_stages() + [
+        {"$set": {"rebuilt_at": rebuilt_at}},
+        {"$merge": {
+            "into": "user_stats",
+            "on": ["user_id", "year", "format"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+    await (await db.matches.aggregate(pipeline)).to_list(None)
+    # Rollups that no longer have any validated match behind them
+    result = await db.user_stats.delete_many({"rebuilt_at": {"$ne": rebuilt_at}})
+    logger.info(f"Rollups rebuilt, {result.deleted_count} stale rollups removed")
+
+
+def _rollup_key(rollup: dict) -> tuple:
+    return rollup["user_id"], rollup["year"], rollup["format"]
+
+
+async def check(db, limit: Optional[int] = 20) -> List[dict]:
+    """Differences between the stored rollups and the ones computed from raw matches"""
+    expected = {}
+    async for rollup in await db.matches.aggregate(rollup_stages(), allowDiskUse=True):
+        expected[_rollup_key(rollup)] = rollup
+
+    differences = []
+    async for stored in db.user_stats.find({}, {"_id": 0}):
+        key = _rollup_key(stored)
+        computed = expected.pop(key, None) or {}
+        diff = {
+            counter: (stored.get(counter, 0), computed.get(counter, 0))
+            for counter in COUNTERS
+            if stored.get(counter, 0) != computed.get(counter, 0)
+        }
+        if diff:
+            differences.append({"key": key, "stored_vs_computed": diff})
+    for key, computed in expected.items():
+        differences.append({"key": key, "stored_vs_computed": {c: (0, computed[c]) for c in COUNTERS}})
+
+    for difference in differences[:limit]:
+        logger.warning(f"Rollup mismatch {difference['key']}: {difference['stored_vs_computed']}")
+    return differences
+
+
+async def main(command: str) -> int:
+    await database.connect()
+    db = database.get_database()
+    try:
+        if command == "rebuild":
+            await rebuild(db)
+        elif command == "check":
+            differences = await check(db)
+            if differences:
+                logger.error(f"{len(differences)} rollups differ from the raw matches")
+                return 1
+            logger.info("Rollups match the raw matches")
+        else:
+            logger.error(f"Unknown command '{command}', expected rebuild or check")
+            return 2
+    finally:
+        await database.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "check")))
@@ -0,0 +1,204 @@
+"""Slow MongoDB command recorder.
+
+Commands slower than SLOW_QUERY_THRESHOLD_MS are logged with their query
+shape and the route that issued them, and kept in a ring buffer of the last
+SLOW_QUERY_BUFFER_SIZE entries. The first slow occurrence of each shape in
+every SLOW_QUERY_EXPLAIN_INTERVAL is explained with executionStats in the
+background, so the entry shows whether it ran as a COLLSCAN.
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import monitoring
+
+from metrics import current_request, route_path
+from utils.logging import logger
+from utils.plans import plan_stages
+
+# Slow query recorder configuration, a threshold of 0 disables it
+SLOW_QUERY_THRESHOLD_MS = float(os.environ.get("SLOW_QUERY_THRESHOLD_MS", 100))
+SLOW_QUERY_BUFFER_SIZE = int(os.environ.get("SLOW_QUERY_BUFFER_SIZE", 200))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.environ.get("SLOW_QUERY_EXPLAIN_INTERVAL", 300))
+
+# Commands that can be explained, and where their query lives
+QUERY_FIELDS = {
+    "find": ("filter", "sort"),
+    "aggregate": ("pipeline",),
+    "count": ("query",),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort"),
+    "update": ("updates",),
+    "delete": ("deletes",),
+}
+
+# Fields of the sent command that explain doesn't accept
+NOT_EXPLAINABLE_FIELDS = {"lsid", "txnNumber", "writeConcern", "readConcern", "cursor", "maxTimeMS"}
+
+
+def shape(value: Any) -> Any:
+    """`value` with every literal replaced by "?", keeping field names and operators"""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        shapes = []
+        for item in value:
+            item_shape = shape(item)
+            if item_shape not in shapes:
+                shapes.append(item_shape)
+        return shapes
+    return "?"
+
+
+def query_shape(command_name: str, command: dict) -> dict:
+    shapes = {}
+    for field in QUERY_FIELDS.get(command_name, ()):
+        if field not in command:
+            continue
+        if field == "sort":
+            shapes[field] = dict(command[field])
+        elif field == "key":
+            shapes[field] = command[field]
+        elif field in ("updates", "deletes"):
+            # Only the filters, not the update documents
+            shapes[field] = shape([{"q": statement.get("q")} for statement in command[field]])
+        else:
+            shapes[field] = shape(command[field])
+    return shapes
+
+
+def summarize_explain(explain: dict) -> dict:
+    stages = list(plan_stages(explain))
+    summary = {"collscan": "COLLSCAN" in stages, "stages": sorted(set(stages))}
+    execution_stats = _find(explain, "executionStats")
+    if execution_stats:
+        for field in ("nReturned", "totalKeysExamined", "totalDocsExamined", "executionTimeMillis"):
+            if field in execution_stats:
+                summary[field] = execution_stats[field]
+    return summary
+
+
+def _find(value: Any, key: str) -> Optional[dict]:
+    if isinstance(value, dict):
+        if isinstance(value.get(key), dict):
+            return value[key]
+        children = value.values()
+    elif isinstance(value, list):
+        children = value
+    else:
+        return None
+    for child in children:
+        found = _find(child, key)
+        if found is not None:
+            return found
+    return None
+
+
+class SlowQueryRecorder(monitoring.CommandListener):
+    """Command listener keeping the last slow commands, with a sampled explain"""
+
+    def __init__(
+        self,
+        threshold_ms: float = SLOW_QUERY_THRESHOLD_MS,
+        buffer_size: int = SLOW_QUERY_BUFFER_SIZE,
+        explain_interval: float = SLOW_QUERY_EXPLAIN_INTERVAL,
+    ):
+        self.threshold_ms = threshold_ms
+        self.explain_interval = explain_interval
+        self.entries: deque = deque(maxlen=buffer_size)
+        self.recorded = 0
+        # (connection, request id) -> (database, command) of the explainable commands in flight
+        self._in_flight: Dict[Tuple[Any, int], Tuple[str, dict]] = {}
+        # query shape -> last time it was explained
+        self._explained_at: Dict[str, float] = {}
+        self._explaining = False
+        self._client = None
+
+    def start(self, client):
+        """Explain with this client; slow commands are still recorded before it is set"""
+        self._client = client
+
+    def started(self, event):
+        if self.threshold_ms and event.command_name in QUERY_FIELDS:
+            self._in_flight[(event.connection_id, event.request_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+
+    def _finish(self, event):
+        sent = self._in_flight.pop((event.connection_id, event.request_id), None)
+        if sent is None or event.duration_micros < self.threshold_ms * 1000:
+            return
+        database_name, command = sent
+        stats = current_request.get()
+        entry = {
+            "at": datetime.utcnow().isoformat(),
+            "command": event.command_name,
+            "collection": command.get(event.command_name),
+            "duration_ms": round(event.duration_micros / 1000, 1),
+            "route": route_path(stats.scope) if stats is not None else None,
+            "shape": query_shape(event.command_name, command),
+            "explain": None
+        }
+        self.entries.append(entry)
+        self.recorded += 1
+        logger.warning(
+            f"Slow {entry['command']} on {entry['collection']} took {entry['duration_ms']}ms"
+            f" from {entry['route'] or 'background'}: {entry['shape']}"
+        )
+        self._maybe_explain(entry, database_name, command)
+
+    def _maybe_explain(self, entry: dict, database_name: str, command: dict):
+        if self._client is None or self._explaining:
+            return
+        key = f"{entry['command']} {entry['collection']} {entry['shape']}"
+        now = time.monotonic()
+        if now - self._explained_at.get(key, float("-inf")) < self.explain_interval:
+            return
+        self._explained_at[key] = now
+        self._explaining = True
+        try:
+            asyncio.get_running_loop().create_task(self._explain(entry, database_name, command))
+        except RuntimeError:
+            # Not on the event loop, e.g. a command from a script's sync code
+            self._explaining = False
+
+    async def _explain(self, entry: dict, database_name: str, command: dict):
+        explainable = {
+            key: value for key, value in command.items()
+            if not key.startswith("$") and key not in NOT_EXPLAINABLE_FIELDS
+        }
+        if entry["command"] == "aggregate":
+            explainable["cursor"] = {}
+        try:
+            explain = await self._client[database_name].command(
+                {"explain": explainable, "verbosity": "executionStats"}
+            )
+            entry["explain"] = summarize_explain(explain)
+            if entry["explain"]["collscan"]:
+                logger.warning(f"Slow {entry['command']} on {entry['collection']} is a COLLSCAN: {entry['shape']}")
+        except Exception as e:
+            entry["explain"] = {"error": str(e)}
+        finally:
+            self._explaining = False
+
+    def recent(self, limit: Optional[int] = None) -> List[dict]:
+        """Slow commands, most recent first"""
+        entries = list(reversed(self.entries))
+        return entries[:limit] if limit else entries
+
+    def stats(self) -> dict:
+        return {
+            "threshold_ms": self.threshold_ms,
+            "recorded": self.recorded,
+            "buffered": len(self.entries)
+        }
+
+
+slow_query_recorder = SlowQueryRecorder()
@@ -0,0 +1,147 @@
+"""Precomputed friend-of-friend suggestions.
+
+Every user has one document per candidate with the friends they have in
+common and their number. Mutual friends are added when a friendship is
+created and removed with it, so /friends/suggestions is a single indexed read.
+
+Usage: python suggestions.py [rebuild|check]
+"""
+import asyncio
+import sys
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import database
+from repository import FriendshipsRepository, SuggestionsRepository
+from utils.logging import logger
+
+
+def _path_rows(user_id: str, other_id: str, user_friends: List[str], other_friends: List[str]) -> List[dict]:
+    """Mutual friendships created when user_id and other_id become friends.
+
+    Each friend of one side gains the other side as a candidate through
+    that side, in both directions.
+    """
+    rows = []
+    for left, right, friends in ((other_id, user_id, user_friends), (user_id, other_id, other_friends)):
+        for friend_id in friends:
+            if friend_id == left:
+                continue
+            rows.append({"user_id": left, "candidate_id": friend_id, "via": right})
+            rows.append({"user_id": friend_id, "candidate_id": left, "via": right})
+    return rows
+
+
+async def record_friendship(user_id: str, other_id: str, friendships_repository: FriendshipsRepository, suggestions_repository: SuggestionsRepository):
+    """Update the candidates after user_id and other_id became friends.
+
+    Read after the edges were written, so of two friendships accepted at
+    the same time through a common friend at least one sees the other, and
+    adding the same mutual friend twice is a no-op.
+    """
+    user_friends, other_friends = await asyncio.gather(
+        friendships_repository.ids(user_id, "friends"),
+        friendships_repository.ids(other_id, "friends")
+    )
+    await suggestions_repository.add_paths(_path_rows(user_id, other_id, user_friends, other_friends))
+
+
+async def record_unfriending(user_id: str, other_id: str, suggestions_repository: SuggestionsRepository):
+    """Update the candidates after the friendship of user_id and other_id was removed"""
+    await suggestions_repository.remove_paths(user_id, other_id)
+
+
+def suggestion_stages() -> List[dict]:
+    """Aggregation stages computing every candidate's mutual friends from the friendship edges"""
+    return [
+        {"$match": {"state": "friends"}},
+        {"$lookup": {
+            "from": "friendships",
+            "localField": "other_id",
+            "foreignField": "user_id",
+            "pipeline": [
+                {"$match": {"state": "friends"}},
+                {"$project": {"_id": 0, "other_id": 1}}
+            ],
+            "as": "friends_of_friend"
+        }},
+        {"$unwind": "$friends_of_friend"},
+        {"$match": {"$expr": {"$ne": ["$friends_of_friend.other_id", "$user_id"]}}},
+        {"$group": {
+            "_id": {"user_id": "$user_id", "candidate_id": "$friends_of_friend.other_id"},
+            "via": {"$addToSet": "$other_id"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "user_id": "$_id.user_id",
+            "candidate_id": "$_id.candidate_id",
+            "via": 1,
+            "mutual_friends": {"$size": "$via"}
+        }}
+    ]
+
+
+async def rebuild(db):
+    """Recompute every suggestion from the friendship edges.
+
+    Run it once after deploying suggestions and whenever `check` reports
+    drift, e.g. from a friendship accepted while one of the common friends
+    was being removed.
+    """
+    rebuilt_at = datetime.utcnow()
+    pipeline = suggestion_stages() + [
+        {"$set": {"rebuilt_at": rebuilt_at}},
+        {"$merge": {
+            "into": "friend_suggestions",
+            "on": ["user_id", "candidate_id"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+    await (await db.friendships.aggregate(pipeline, allowDiskUse=True)).to_list(None)
+    result = await db.friend_suggestions.delete_many({"rebuilt_at": {"$ne": rebuilt_at}})
+    logger.info(f"Suggestions rebuilt, {result.deleted_count} stale suggestions removed")
+
+
+async def check(db, limit: Optional[int] = 20) -> List[dict]:
+    """Differences between the stored mutual friends and the ones computed from the edges"""
+    expected: Dict[tuple, set] = {}
+    async for row in await db.friendships.aggregate(suggestion_stages(), allowDiskUse=True):
+        expected[(row["user_id"], row["candidate_id"])] = set(row["via"])
+
+    differences = []
+    async for stored in db.friend_suggestions.find({}, {"_id": 0}):
+        key = (stored["user_id"], stored["candidate_id"])
+        via, computed = set(stored.get("via") or []), expected.pop(key, set())
+        if via != computed or stored.get("mutual_friends", 0) != len(computed):
+            differences.append({"key": key, "stored_vs_computed": (stored.get("mutual_friends", 0), len(computed))})
+    for key, computed in expected.items():
+        differences.append({"key": key, "stored_vs_computed": (0, len(computed))})
+
+    for difference in differences[:limit]:
+        logger.warning(f"Suggestion mismatch {difference['key']}: {difference['stored_vs_computed']}")
+    return differences
+
+
+async def main(command: str) -> int:
+    await database.connect()
+    db = database.get_database()
+    try:
+        if command == "rebuild":
+            await rebuild(db)
+        elif command == "check":
+            differences = await check(db)
+            if differences:
+                logger.error(f"{len(differences)} suggestions differ from the friendship edges")
+                return 1
+            logger.info("Suggestions match the friendship edges")
+        else:
+            logger.error(f"Unknown command '{command}', expected rebuild or check")
+            return 2
+    finally:
+        await database.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1] if len(sys.argv) > 1 else "check")))
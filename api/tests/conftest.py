@@ -0,0 +1,71 @@
+"""Shared fixtures. Run from api/ with `python -m pytest`.
+
+Tests that need MongoDB use a throwaway database on MONGODB_TEST_URI
+(default mongodb://localhost:27017) and are skipped when it isn't reachable.
+"""
+import functools
+import os
+import uuid
+
+# Never point the app modules at the configured database, they read these on import
+MONGODB_TEST_URI = os.environ.get("MONGODB_TEST_URI", "mongodb://localhost:27017")
+os.environ["MONGODB_URI"] = MONGODB_TEST_URI
+os.environ["MONGODB_DB_NAME"] = f"scorer_test_{uuid.uuid4().hex[:8]}"
+os.environ["MONGODB_SERVER_SELECTION_TIMEOUT_MS"] = "1000"
+os.environ.setdefault("AUTH0_DOMAIN", "scorer-test.auth0.com")
+os.environ.setdefault("AUTH0_AUDIENCE", "https://scorer.test/api")
+
+import httpx
+import pytest
+from fastapi import Request
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+import database
+from auth import get_current_user
+from indexes import ensure_indexes
+from models import UserInDB
+from tests.support import TEST_USER_HEADER
+
+
+@functools.lru_cache(maxsize=None)
+def mongodb_available() -> bool:
+    """Whether MONGODB_TEST_URI answers, checked once per test run"""
+    client = MongoClient(MONGODB_TEST_URI, serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+        return True
+    except PyMongoError:
+        return False
+    finally:
+        client.close()
+
+
+@pytest.fixture
+async def db():
+    """A connected, indexed and empty test database, dropped afterwards"""
+    if not mongodb_available():
+        pytest.skip(f"MongoDB not reachable at {MONGODB_TEST_URI}")
+    await database.connect()
+    test_db = database.get_database()
+    await ensure_indexes(test_db)
+    yield test_db
+    await database.Database.client.drop_database(test_db.name)
+    await database.close()
+
+
+async def _header_user(request: Request) -> UserInDB:
+    auth_id = request.headers[TEST_USER_HEADER]
+    return UserInDB(auth_id=auth_id, username=auth_id, email=f"{auth_id}@scorer.test")
+
+
+@pytest.fixture
+async def client(db):
+    """An HTTP client for the app, authenticated as the user named in X-Test-User"""
+    from main import app
+
+    app.dependency_overrides[get_current_user] = _header_user
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as http_client:
+        yield http_client
+    app.dependency_overrides.clear()
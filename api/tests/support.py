@@ -0,0 +1,121 @@
+"""Helpers shared by the tests"""
+import random
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from rollups import COUNTERS, GOAL_POINT_FORMATS
+from utils.dates import parse_played_at
+
+TEST_USER_HEADER = "X-Test-User"
+
+FORMATS = ["F5", "F6", "F7", "F8", "F9", "F10", "F11"]
+
+
+def as_user(auth_id: str) -> dict:
+    """Headers authenticating a test client request as `auth_id`"""
+    return {TEST_USER_HEADER: auth_id}
+
+
+def match_payload(players: List[str], winning_team: str = "A", match_format: str = "F10", date: str = "2025-03-01") -> dict:
+    """POST /matches/ body with the first half of `players` on team A"""
+    half = (len(players) + 1) // 2
+    return {
+        "date": date,
+        "time": "20:00",
+        "location": "Test pitch",
+        "format": match_format,
+        "winning_team": winning_team,
+        "players": [
+            {"user_id": user_id, "team": "A" if i < half else "B", "goals": i % 3, "assists": i % 2}
+            for i, user_id in enumerate(players)
+        ]
+    }
+
+
+def generate_matches(count: int, users: List[str], seed: int = 7, validated_share: float = 0.8,
+                     start: Optional[datetime] = None) -> List[dict]:
+    """Random match documents as the API stores them, reproducible from `seed`"""
+    rng = random.Random(seed)
+    start = start or datetime(2023, 1, 1)
+    matches = []
+    for _ in range(count):
+        match_format = rng.choice(FORMATS)
+        size = rng.randint(2, min(len(users), 2 * int(match_format[1:])))
+        players = rng.sample(users, size)
+        played = start + timedelta(days=rng.randint(0, 3 * 365), minutes=rng.randint(0, 1439))
+        date, time = played.strftime("%Y-%m-%d"), played.strftime("%H:%M")
+        matches.append({
+            "match_id": str(uuid.UUID(int=rng.getrandbits(128))),
+            "date": date,
+            "time": time,
+            "played_at": parse_played_at(date, time),
+            "location": "Generated",
+            "format": match_format,
+            "winning_team": rng.choice(["A", "B", "draw"]),
+            "created_by": players[0],
+            "players": [
+                {
+                    "user_id": user_id,
+                    "team": "A" if i % 2 == 0 else "B",
+                    "goals": rng.choice([0, 0, 0, 1, 1, 2, 3, 5]),
+                    "assists": rng.choice([0, 0, 1, 2])
+                }
+                for i, user_id in enumerate(players)
+            ],
+            "validations": [],
+            "is_validated": rng.random() < validated_share,
+            "created_at": played
+        })
+    return matches
+
+
+def enriched_matches(count: int) -> List[dict]:
+    """Generated matches with the usernames enrich_matches adds"""
+    matches = generate_matches(count, [f"user{i}" for i in range(200)])
+    for match in matches:
+        match["creator_username"] = f"name-{match['created_by']}"
+        for player in match["players"]:
+            player["username"] = f"name-{player['user_id']}"
+    return matches
+
+
+def generate_users(count: int) -> List[dict]:
+    """User documents as the API stores them, with a friend flag set like /friends/list"""
+    return [
+        {
+            "auth_id": f"user{i}",
+            "username": f"name-user{i}",
+            "username_key": f"name-user{i}",
+            "email": f"user{i}@scorer.test",
+            "is_friend": True,
+            "created_at": datetime(2023, 1, 1) + timedelta(hours=i)
+        }
+        for i in range(count)
+    ]
+
+
+def per_document_leaderboard(matches: List[dict], user_ids: List[str], year: Optional[int] = None) -> Dict[str, dict]:
+    """Leaderboard rows per user_id, walking every validated match like the old /leaderboard loop"""
+    user_ids = set(user_ids)
+    rows = {}
+    for match in matches:
+        if not match["is_validated"] or (year and not match["date"].startswith(str(year))):
+            continue
+        for player in match["players"]:
+            if player["user_id"] not in user_ids:
+                continue
+            row = rows.setdefault(player["user_id"], {counter: 0 for counter in COUNTERS})
+            won = match["winning_team"] == player["team"]
+            row["matches_played"] += 1
+            row["goals"] += player["goals"]
+            row["assists"] += player["assists"]
+            if won:
+                row["wins"] += 1
+            elif match["winning_team"] == "draw":
+                row["draws"] += 1
+            else:
+                row["losses"] += 1
+            goal_points = player["goals"] if match["format"] in GOAL_POINT_FORMATS else player["goals"] // 2
+            row["points"] += 3 * int(won) + goal_points
+    return rows
@@ -0,0 +1,72 @@
+import asyncio
+
+from migrations.friendships import backfill_friendships
+from suggestions import check, rebuild
+from tests.support import as_user
+
+
+async def befriend(client, user_id: str, other_id: str):
+    response = await client.post("/api/friends/request", json={"user_id": other_id}, headers=as_user(user_id))
+    assert response.status_code == 200, response.text
+    response = await client.post("/api/friends/accept", json={"user_id": user_id}, headers=as_user(other_id))
+    assert response.status_code == 200, response.text
+
+
+async def test_concurrent_unfriending_updates_suggestions_once(client, db):
+    friends = [f"friend{i}" for i in range(5)]
+    await db.users.insert_many([
+        {"auth_id": auth_id, "username": auth_id, "username_key": auth_id, "email": f"{auth_id}@scorer.test"}
+        for auth_id in ["me", "candidate", *friends]
+    ])
+    for friend_id in friends:
+        await befriend(client, "me", friend_id)
+        await befriend(client, friend_id, "candidate")
+
+    responses = await asyncio.gather(*(
+        client.delete(f"/api/friends/remove/{friends[0]}", headers=as_user("me"))
+        for _ in range(5)
+    ))
+
+    assert sorted(response.status_code for response in responses) == [200] + [400] * 4
+    suggestions = (await client.get("/api/friends/suggestions", headers=as_user("me"))).json()
+    assert {row["auth_id"]: row["mutual_friends"] for row in suggestions}["candidate"] == len(friends) - 1
+    assert await check(db) == []
+
+
+
+async def test_concurrent_accepts_through_a_common_friend_count_it_once(client, db):
+    await db.users.insert_many([
+        {"auth_id": auth_id, "username": auth_id, "username_key": auth_id, "email": f"{auth_id}@scorer.test"}
+        for auth_id in ["common", "left", "right"]
+    ])
+    for requester in ("left", "right"):
+        response = await client.post("/api/friends/request", json={"user_id": "common"}, headers=as_user(requester))
+        assert response.status_code == 200, response.text
+
+    responses = await asyncio.gather(*(
+        client.post("/api/friends/accept", json={"user_id": requester}, headers=as_user("common"))
+        for requester in ("left", "right")
+    ))
+
+    assert [response.status_code for response in responses] == [200, 200]
+    for user_id, candidate_id in (("left", "right"), ("right", "left")):
+        suggestions = (await client.get("/api/friends/suggestions", headers=as_user(user_id))).json()
+        assert suggestions == [{"auth_id": candidate_id, "username": candidate_id, "mutual_friends": 1}]
+    assert await check(db) == []
+
+async def test_rerunning_the_backfill_keeps_removed_friendships_removed(client, db):
+    await db.users.insert_many([
+        {"auth_id": "me", "username": "me", "username_key": "me", "friends": ["old", "kept"]},
+        {"auth_id": "old", "username": "old", "username_key": "old", "friends": ["me", "kept"]},
+        {"auth_id": "kept", "username": "kept", "username_key": "kept", "friends": ["me", "old"]}
+    ])
+    await backfill_friendships(db, pause=0)
+    await rebuild(db)
+
+    response = await client.delete("/api/friends/remove/old", headers=as_user("me"))
+    assert response.status_code == 200, response.text
+    assert await backfill_friendships(db, pause=0, restart=True) == 0
+
+    assert await db.friendships.count_documents({"user_id": {"$in": ["me", "old"]}, "other_id": {"$in": ["me", "old"]}}) == 0
+    assert await db.friendships.count_documents({}) == 4
+    assert await check(db) == []
@@ -0,0 +1,103 @@
+"""The aggregation and rollup paths against the per-document Python path they replaced.
+
+`per_document_leaderboard` and `per_document_stats` are the loops /leaderboard
+and /stats used to run over whole match documents, with the points fix: every
+match adds its own win and goal points.
+"""
+from typing import Dict, List
+
+import pytest
+
+from leaderboard import leaderboard_pipeline
+from repository import MatchesRepository, StatsRepository
+from rollups import COUNTERS, check, rebuild, record_validated_matches, rollup_rows, sum_rollups
+from tests.support import FORMATS, as_user, generate_matches, per_document_leaderboard
+
+USERS = [f"user{i}" for i in range(30)]
+FRIENDS = USERS[:12]
+
+
+def per_document_stats(matches: List[dict], user_id: str) -> dict:
+    row = per_document_leaderboard(matches, [user_id]).get(user_id, {counter: 0 for counter in COUNTERS})
+    by_format = {match_format: 0 for match_format in FORMATS}
+    for match in matches:
+        if match["is_validated"] and any(player["user_id"] == user_id for player in match["players"]):
+            by_format[match["format"]] += 1
+    return {
+        "total_matches": row["matches_played"],
+        "wins": row["wins"],
+        "losses": row["losses"],
+        "draws": row["draws"],
+        "goals": row["goals"],
+        "assists": row["assists"],
+        "by_format": by_format
+    }
+
+
+def by_user(rows: List[dict]) -> Dict[str, dict]:
+    return {row["user_id"]: {counter: row[counter] for counter in COUNTERS} for row in rows}
+
+
+def assert_ranked(rows: List[dict]):
+    ranks = [(row["points"], row["wins"], row["goals"]) for row in rows]
+    assert ranks == sorted(ranks, reverse=True)
+
+
+@pytest.fixture
+async def matches(db):
+    generated = generate_matches(400, USERS)
+    await db.matches.insert_many([dict(match) for match in generated])
+    return generated
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_rollup_rows_add_up_to_the_per_document_path(seed):
+    generated = generate_matches(300, USERS, seed=seed)
+    rows = []
+    for match in generated:
+        if match["is_validated"]:
+            rows += [{"user_id": row["user_id"], **row["counters"]} for row in rollup_rows(match, match["players"])]
+
+    assert sum_rollups(rows) == per_document_leaderboard(generated, USERS)
+
+
+@pytest.mark.parametrize("year", [None, 2024])
+async def test_pipeline_matches_the_per_document_path(db, matches, year):
+    rows = await MatchesRepository(db).aggregate(leaderboard_pipeline(FRIENDS, year))
+
+    assert by_user(rows) == per_document_leaderboard(matches, FRIENDS, year)
+    assert_ranked(rows)
+
+
+@pytest.mark.parametrize("year", [None, 2025])
+async def test_rebuilt_rollups_match_the_per_document_path(db, matches, year):
+    await rebuild(db)
+
+    rollups = await StatsRepository(db).find_for_users(FRIENDS, year)
+
+    assert sum_rollups(rollups) == per_document_leaderboard(matches, FRIENDS, year)
+    assert await check(db) == []
+
+
+async def test_incremental_rollups_match_the_per_document_path(db):
+    generated = generate_matches(400, USERS, seed=11)
+    await db.matches.insert_many([{**match, "is_validated": False} for match in generated])
+    validated = [match["match_id"] for match in generated if match["is_validated"]]
+    await db.matches.update_many({"match_id": {"$in": validated}}, {"$set": {"is_validated": True}})
+
+    # Counted in several overlapping batches, every match must land once
+    matches_repository, stats_repository = MatchesRepository(db), StatsRepository(db)
+    for start in range(0, len(validated), 50):
+        await record_validated_matches(validated[start:start + 100], matches_repository, stats_repository)
+
+    rollups = await stats_repository.find_for_users(USERS)
+    assert sum_rollups(rollups) == per_document_leaderboard(generated, USERS)
+    assert await check(db) == []
+
+
+async def test_stats_endpoint_matches_the_per_document_path(client, db, matches):
+    await rebuild(db)
+
+    for user_id in USERS[:5]:
+        response = await client.get("/api/matches/stats", headers=as_user(user_id))
+        assert response.json() == per_document_stats(matches, user_id)
@@ -0,0 +1,53 @@
+import auth
+from auth import issue_stream_ticket, verify_stream_ticket
+from events import event_hub
+from matches import match_events
+
+
+class DisconnectingRequest:
+    """Stands in for the Starlette request, disconnecting after `polls` checks"""
+
+    def __init__(self, polls: int = 0):
+        self.polls = polls
+
+    async def is_disconnected(self) -> bool:
+        self.polls -= 1
+        return self.polls < 0
+
+
+def test_stream_ticket_round_trip():
+    assert verify_stream_ticket(issue_stream_ticket("auth0|123")) == "auth0|123"
+
+
+def test_tampered_and_expired_tickets_are_rejected(monkeypatch):
+    ticket = issue_stream_ticket("auth0|123")
+    assert verify_stream_ticket(ticket[:-4] + "AAAA") is None
+    assert verify_stream_ticket("not a ticket") is None
+
+    monkeypatch.setattr(auth, "EVENTS_TICKET_SECRET", "another-secret")
+    assert verify_stream_ticket(ticket) is None
+
+    monkeypatch.setattr(auth, "EVENTS_TICKET_TTL", -1)
+    assert verify_stream_ticket(issue_stream_ticket("auth0|123")) is None
+
+
+async def test_stream_subscribes_only_while_streaming():
+    response = await match_events(DisconnectingRequest(), "listener")
+    # A response that is never streamed holds no subscription
+    assert event_hub.stats()["connections"] == 0
+
+    chunks = [chunk async for chunk in response.body_iterator]
+
+    assert chunks == [": connected\n\n"]
+    assert event_hub.stats()["connections"] == 0
+
+
+async def test_stream_releases_the_subscription_when_closed_early():
+    response = await match_events(DisconnectingRequest(polls=10), "listener")
+    stream = response.body_iterator
+    assert await stream.__anext__() == ": connected\n\n"
+    assert event_hub.stats()["connections"] == 1
+
+    await stream.aclose()
+
+    assert event_hub.stats()["connections"] == 0
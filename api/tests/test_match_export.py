@@ -0,0 +1,24 @@
+import csv
+import io
+import json
+
+from match_export import CSV_COLUMNS, _csv, _ndjson
+from tests.support import enriched_matches
+
+
+def test_csv_rows_hold_the_same_values_as_ndjson_lines():
+    matches = enriched_matches(20)
+    for match in matches:
+        match["validations"] = [{"user_id": player["user_id"], "timestamp": match["created_at"]} for player in match["players"]]
+
+    rows = list(csv.DictReader(io.StringIO(_csv(matches, header=True).decode())))
+    lines = [json.loads(line) for line in _ndjson(matches).splitlines()]
+
+    assert len(rows) == len(lines) == len(matches)
+    for row, line in zip(rows, lines):
+        assert list(row) == CSV_COLUMNS
+        for field in ("players", "validations"):
+            assert json.loads(row[field]) == line[field]
+        for field in ("played_at", "created_at"):
+            assert row[field] == line[field]
+        assert "T" in json.loads(row["validations"])[0]["timestamp"]
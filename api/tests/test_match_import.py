@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from match_import import read_lines, read_rows
+from tests.support import as_user, match_payload
+
+
+async def stream(*chunks: bytes):
+    for chunk in chunks:
+        yield chunk
+
+
+async def parse(chunks, file_format: str = "ndjson", max_line_bytes: int = 1000):
+    return [row async for row in read_rows(read_lines(stream(*chunks), max_line_bytes), file_format)]
+
+
+async def test_lines_split_across_chunks():
+    rows = await parse([b'{"a": 1}\n{"b"', b': 2}\r\n\n', b'{"c": 3}'])
+    assert rows == [(1, {"a": 1}), (2, {"b": 2}), (4, {"c": 3})]
+
+
+async def test_undecodable_line_is_a_row_error():
+    rows = await parse([b'\xff\xfe\n{"a": 1}\n'])
+    assert isinstance(rows[0][1], UnicodeDecodeError)
+    assert rows[1] == (2, {"a": 1})
+
+
+async def test_overlong_line_is_rejected_without_buffering_it():
+    rows = await parse([b'{"a": 1}\n', b"x" * 30, b"y" * 30, b'z\n{"b": 2}\n'], max_line_bytes=20)
+    assert rows[0] == (1, {"a": 1})
+    assert isinstance(rows[1][1], ValueError) and rows[1][0] == 2
+    assert rows[2] == (3, {"b": 2})
+
+
+@pytest.mark.parametrize("line", [b"[1, 2]", b"not json", b'{"a": '])
+async def test_invalid_json_rows(line):
+    [(line_number, row)] = await parse([line])
+    assert line_number == 1 and isinstance(row, ValueError)
+
+
+async def test_csv_rows():
+    players = json.dumps([{"user_id": "u1", "team": "A"}]).replace('"', '""')
+    rows = await parse([f'date,location,players\n2025-03-01,"Pitch, north","{players}"\n"unterminated,x\n'.encode()], "csv")
+    assert rows[0] == (2, {"date": "2025-03-01", "location": "Pitch, north", "players": [{"user_id": "u1", "team": "A"}]})
+    assert rows[1][0] == 3 and isinstance(rows[1][1], Exception)
+
+
+async def test_import_reports_row_errors(client, db):
+    valid = match_payload(["organizer", "u1", "u2"])
+    body = b"\n".join([
+        json.dumps(valid).encode(),
+        json.dumps({**valid, "winning_team": "C"}).encode(),
+        b"\xff",
+        json.dumps(valid).encode()
+    ])
+
+    response = await client.post("/api/matches/import", content=body, headers=as_user("organizer"))
+
+    assert response.status_code == 200, response.text
+    report = response.json()
+    assert (report["received"], report["imported"], report["failed"]) == (4, 2, 2)
+    assert [error["line"] for error in report["errors"]] == [2, 3]
+    assert await db.matches.count_documents({"created_by": "organizer"}) == 2
@@ -0,0 +1,113 @@
+import asyncio
+import random
+from collections import Counter
+
+from tests.support import as_user, match_payload
+
+PLAYERS = [f"player{i}" for i in range(20)]
+ATTEMPTS_PER_PLAYER = 3
+
+
+async def create_match(client, players, **kwargs) -> str:
+    response = await client.post("/api/matches/", json=match_payload(players, **kwargs), headers=as_user(players[0]))
+    assert response.status_code == 200, response.text
+    return response.json()["match_id"]
+
+
+async def test_concurrent_validations_apply_once_per_player(client, db):
+    match_id = await create_match(client, PLAYERS)
+
+    # Every player validates several times at once, in random order
+    attempts = [player for player in PLAYERS for _ in range(ATTEMPTS_PER_PLAYER)]
+    random.Random(1).shuffle(attempts)
+    responses = await asyncio.gather(*(
+        client.post(f"/api/matches/{match_id}/validate", headers=as_user(player))
+        for player in attempts
+    ))
+
+    succeeded = Counter(player for player, response in zip(attempts, responses) if response.status_code == 200)
+    assert succeeded == Counter(PLAYERS)
+    assert all(response.status_code in (200, 400) for response in responses)
+
+    match = await db.matches.find_one({"match_id": match_id})
+    assert Counter(validation["user_id"] for validation in match["validations"]) == Counter(PLAYERS)
+    assert match["is_validated"] is True
+    assert match["stats_applied"] is True
+
+    # The match was counted in the rollups exactly once for every player
+    rollups = await db.user_stats.find({}, {"_id": 0}).to_list(None)
+    assert sorted(rollup["user_id"] for rollup in rollups) == sorted(PLAYERS)
+    assert all(rollup["matches_played"] == 1 for rollup in rollups)
+    assert await db.validation_inbox.count_documents({}) == 0
+
+
+async def test_outsiders_cannot_validate(client, db):
+    match_id = await create_match(client, PLAYERS[:4])
+
+    response = await client.post(f"/api/matches/{match_id}/validate", headers=as_user("outsider"))
+    assert response.status_code == 403
+
+    response = await client.post("/api/matches/missing/validate", headers=as_user(PLAYERS[0]))
+    assert response.status_code == 404
+
+
+async def test_concurrent_joins_add_the_player_once(client, db):
+    match_id = await create_match(client, PLAYERS[:4])
+
+    responses = await asyncio.gather(*(
+        client.post(f"/api/matches/{match_id}/players", json={"team": "B", "goals": 1}, headers=as_user("newcomer"))
+        for _ in range(10)
+    ))
+
+    assert sorted(response.status_code for response in responses) == [200] + [400] * 9
+    match = await db.matches.find_one({"match_id": match_id})
+    assert [player["user_id"] for player in match["players"]].count("newcomer") == 1
+    assert [validation["user_id"] for validation in match["validations"]] == ["newcomer"]
+
+
+async def test_join_rejects_invalid_player_stats(client, db):
+    match_id = await create_match(client, PLAYERS[:4])
+
+    for player_data in ({"goals": -1}, {"goals": "two"}, {"team": "C"}, {"assists": 1.5}):
+        response = await client.post(f"/api/matches/{match_id}/players", json=player_data, headers=as_user("newcomer"))
+        assert response.status_code == 422, player_data
+
+    match = await db.matches.find_one({"match_id": match_id})
+    assert "newcomer" not in [player["user_id"] for player in match["players"]]
+
+
+async def test_batch_validation_statuses_come_from_the_update(client, db):
+    validated_before = await create_match(client, PLAYERS[:4])
+    await client.post(f"/api/matches/{validated_before}/validate", headers=as_user(PLAYERS[1]))
+    pending = [await create_match(client, PLAYERS[:4]) for _ in range(3)]
+    not_played = await create_match(client, PLAYERS[2:6])
+    match_ids = [validated_before, *pending, not_played, "missing"]
+
+    response = await client.post("/api/matches/validate-batch", json={"match_ids": match_ids}, headers=as_user(PLAYERS[1]))
+
+    assert response.status_code == 200, response.text
+    statuses = {result["match_id"]: result["status"] for result in response.json()["results"]}
+    assert statuses == {
+        validated_before: "already_validated",
+        **{match_id: "validated" for match_id in pending},
+        not_played: "not_a_participant",
+        "missing": "not_found"
+    }
+    assert response.json()["validated"] == len(pending)
+
+
+async def test_concurrent_batches_count_each_match_once(client, db):
+    match_ids = [await create_match(client, PLAYERS[:4]) for _ in range(5)]
+
+    # Two validations validate a 4 player match, every player sends its batch at once
+    responses = await asyncio.gather(*(
+        client.post("/api/matches/validate-batch", json={"match_ids": match_ids}, headers=as_user(player))
+        for player in PLAYERS[:4]
+    ))
+
+    assert all(response.json()["validated"] == len(match_ids) for response in responses)
+    matches = await db.matches.find({"match_id": {"$in": match_ids}}).to_list(None)
+    assert all(match["is_validated"] and match["stats_applied"] for match in matches)
+    rollups = await db.user_stats.find({}, {"_id": 0}).to_list(None)
+    assert sorted(rollup["user_id"] for rollup in rollups) == sorted(PLAYERS[:4])
+    assert all(rollup["matches_played"] == len(match_ids) for rollup in rollups)
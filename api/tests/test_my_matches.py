@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from repository import MatchesRepository
+from utils.plans import plan_stages
+
+USER = "player"
+SORT = [("played_at", -1), ("match_id", -1)]
+
+
+def leaf_scans(plan):
+    """The IXSCAN/COLLSCAN stages of a winning plan"""
+    if isinstance(plan, dict):
+        if plan.get("stage") in ("IXSCAN", "COLLSCAN"):
+            yield plan
+        for value in plan.values():
+            yield from leaf_scans(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from leaf_scans(item)
+
+
+@pytest.mark.parametrize("after", [None, (datetime(2025, 3, 1), "m5"), (None, "m5")])
+@pytest.mark.parametrize("played_from", [None, datetime(2025, 1, 1)])
+@pytest.mark.parametrize("match_format", [None, "F5"])
+def test_query_is_a_single_or_of_user_conjunctions(after, played_from, match_format):
+    query = MatchesRepository._for_user_query(USER, after, played_from, None, match_format)
+
+    if after == (None, "m5") and played_from:
+        assert query == {"match_id": {"$in": []}}
+        return
+    assert list(query) == ["$or"]
+    for branch in query["$or"]:
+        assert not {"$or", "$and"} & set(branch)
+        assert branch.get("created_by") == USER or branch.get("players.user_id") == USER
+
+
+def user_matches():
+    """Matches of USER with played_at ties and undated ones, plus one of someone else"""
+    start = datetime(2025, 1, 1, 20)
+    matches = []
+    for i in range(40):
+        played_at = None if i % 9 == 0 else start + timedelta(days=i // 3)
+        mine = {"players": [{"user_id": USER, "team": "A"}], "created_by": "organizer"} if i % 2 else {"players": [], "created_by": USER}
+        matches.append({"match_id": f"m{i:02d}", "played_at": played_at, "format": "F5", **mine})
+    matches.append({"match_id": "other", "played_at": start, "format": "F5", "players": [], "created_by": "someone"})
+    return matches
+
+
+def expected_order(matches):
+    mine = [match for match in matches if match["match_id"] != "other"]
+    dated = sorted((m for m in mine if m["played_at"]), key=lambda m: (m["played_at"], m["match_id"]), reverse=True)
+    undated = sorted((m for m in mine if not m["played_at"]), key=lambda m: m["match_id"], reverse=True)
+    return [match["match_id"] for match in dated + undated]
+
+
+async def test_pages_walk_the_whole_history_once(db):
+    matches = user_matches()
+    await db.matches.insert_many([dict(match) for match in matches])
+    repository = MatchesRepository(db)
+
+    seen, after = [], None
+    while True:
+        page = await repository.find_for_user(USER, limit=7, after=after)
+        seen += [match["match_id"] for match in page]
+        if len(page) < 7:
+            break
+        after = (page[-1].get("played_at"), page[-1]["match_id"])
+
+    assert seen == expected_order(matches)
+
+
+async def test_next_page_is_a_bounded_index_scan(db):
+    await db.matches.insert_many(user_matches())
+    query = MatchesRepository._for_user_query(USER, after=(datetime(2025, 1, 5, 20), "m12"))
+
+    explain = await db.matches.find(query).sort(SORT).limit(8).explain()
+    winning_plan = explain["queryPlanner"]["winningPlan"]
+
+    stages = set(plan_stages(winning_plan))
+    assert "COLLSCAN" not in stages
+    for scan in leaf_scans(winning_plan):
+        assert scan["stage"] == "IXSCAN"
+        bounds = scan["indexBounds"]
+        user_field = "created_by" if "created_by" in bounds else "players.user_id"
+        assert bounds[user_field] == [f'["{USER}", "{USER}"]']
+        assert bounds["played_at"] != ["[MaxKey, MinKey]"]
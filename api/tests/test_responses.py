@@ -0,0 +1,17 @@
+import json
+
+from benchmarks.serialization import orjson_path, pydantic_path
+from tests.support import enriched_matches, generate_users
+from models import MatchResponse, UserResponse
+
+
+def test_orjson_path_encodes_the_same_json_as_response_model_validation():
+    for model, documents in ((MatchResponse, enriched_matches(50)), (UserResponse, generate_users(50))):
+        assert json.loads(orjson_path(model, documents)) == json.loads(pydantic_path(model, documents))
+
+
+def test_shaped_rows_fill_missing_optional_fields_with_defaults():
+    documents = generate_users(1)
+    del documents[0]["email"]
+    (row,) = json.loads(orjson_path(UserResponse, documents))
+    assert row["email"] is None and "username_key" not in row
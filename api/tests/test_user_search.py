@@ -0,0 +1,28 @@
+from repository import UsersRepository
+from utils.search import prefix_range, username_key
+
+
+def test_prefix_range_bounds_every_string_with_the_prefix():
+    lower, upper = prefix_range("ab")
+    assert lower <= "ab" < upper and lower <= "abzzz" < upper
+    assert not lower <= "ac" < upper and not lower <= "aa" < upper
+    assert prefix_range("") == ("", None)
+
+
+async def test_search_matches_the_case_insensitive_prefix(db):
+    usernames = ["Martin", "martina", "MARTINEZ", "mart.in", "Mar", "tinmar", "a(b", "a.b*"]
+    await db.users.insert_many([
+        {"auth_id": f"user{index}", "username": name, "username_key": username_key(name)}
+        for index, name in enumerate(usernames)
+    ])
+    repository = UsersRepository(db)
+
+    found = await repository.search_by_username("marti", "nobody")
+    assert sorted(user["username"] for user in found) == ["MARTINEZ", "Martin", "martina"]
+
+    # Regex metacharacters are plain characters of the prefix
+    assert [user["username"] for user in await repository.search_by_username("a(", "nobody")] == ["a(b"]
+    assert [user["username"] for user in await repository.search_by_username("a.", "nobody")] == ["a.b*"]
+
+    # The caller is never one of the results
+    assert [user["username"] for user in await repository.search_by_username("martin", "user0")] == ["martina", "MARTINEZ"]
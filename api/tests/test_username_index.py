@@ -0,0 +1,125 @@
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import time
+
+import pytest
+
+from username_index import UsernameIndex, bigram_signature
+
+SYLLABLES = ["jo", "hn", "ma", "ri", "a", "el", "la", "lu", "ca", "s", "pe", "dro", "an", "to", "ni", "fe", "gon", "za", "lez", "mar", "tin", "ez"]
+
+
+def build_index(size: int, **options) -> UsernameIndex:
+    rng = random.Random(size)
+    index = UsernameIndex(**options)
+    for i in range(size):
+        index.add(f"user{i}", "".join(rng.choices(SYLLABLES, k=rng.randint(2, 5))) + str(rng.randint(0, 99)))
+    index.loaded = True
+    return index
+
+
+@pytest.fixture(scope="module")
+def large_index():
+    return build_index(100_000, budget_ms=10_000, chunk_size=5000)
+
+
+async def loop_gaps_during(coroutine):
+    """Run `coroutine` while a ticker measures how long the event loop goes without running it"""
+    gaps = []
+
+    async def ticker():
+        last = time.perf_counter()
+        while True:
+            await asyncio.sleep(0.001)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    gaps.clear()
+    started = time.perf_counter()
+    result = await coroutine
+    elapsed = time.perf_counter() - started
+    task.cancel()
+    return result, gaps, elapsed
+
+
+async def test_search_tolerates_typos():
+    index = build_index(1000)
+    index.add("target", "Johnny_Walker")
+
+    results = await index.search("jonny walker", limit=3)
+
+    assert results[0][0] == "target"
+    assert all(auth_id != "target" for auth_id, _ in await index.search("jonny walker", limit=3, exclude=["target"]))
+
+
+
+async def test_search_tolerates_transpositions():
+    index = build_index(1000)
+    index.add("target", "Johnny_Walker")
+
+    results = await index.search("jonhny walker", limit=3)
+
+    assert results[0][0] == "target"
+
+
+async def test_search_tolerates_typos_in_short_names():
+    index, unfiltered = build_index(1000), build_index(1000, min_shared_bigrams=0)
+    for names in (index, unfiltered):
+        names.add("john", "John")
+        names.add("maria", "Maria")
+
+    for query, auth_id in (("jhon", "john"), ("mraia", "maria")):
+        results = await index.search(query, limit=5)
+        assert auth_id in dict(results)
+        # The prefilter only skips names that could not have made the top results
+        assert results == await unfiltered.search(query, limit=5)
+
+
+def test_bigram_signatures_do_not_depend_on_the_string_hash_seed():
+    code = "from username_index import bigram_signature; print(bigram_signature('maria'))"
+    outputs = {
+        subprocess.run(
+            [sys.executable, "-c", code], capture_output=True, text=True, check=True,
+            env={**os.environ, "PYTHONHASHSEED": seed}
+        ).stdout.strip()
+        for seed in ("1", "3")
+    }
+    assert outputs == {str(bigram_signature("maria"))}
+
+
+async def test_event_loop_keeps_running_during_a_search(large_index):
+    results, gaps, elapsed = await loop_gaps_during(large_index.search("martinez", limit=10))
+
+    assert results
+    # A scan holding the GIL for its whole duration would leave no ticks at all
+    assert len(gaps) >= 5
+    assert max(gaps) < max(0.05, elapsed / 2)
+
+
+async def test_searches_never_queue_behind_a_running_scan(large_index):
+    running = asyncio.create_task(large_index.search("martinez", limit=10))
+    await asyncio.sleep(0)
+
+    assert await large_index.search("lucas", limit=10) is None
+    assert large_index.stats()["busy"] >= 1
+    assert await running
+
+
+async def test_scan_over_budget_stops_and_frees_the_thread():
+    index = build_index(100_000, budget_ms=10_000, chunk_size=100)
+    started = time.perf_counter()
+    assert await index.search("martinez", limit=10)
+    full_scan = time.perf_counter() - started
+
+    index.budget = 0.000001
+    started = time.perf_counter()
+    assert await index.search("martinez", limit=10) is None
+    # The scan gave up at its first chunk instead of running to the end
+    assert time.perf_counter() - started < full_scan / 2
+    assert index.stats()["fallbacks"] == 1
@@ -0,0 +1,120 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Set
+
+# Verified-token cache configuration
+TOKEN_CACHE_SIZE = int(os.environ.get("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_USER_TTL = float(os.environ.get("TOKEN_CACHE_USER_TTL", 30))
+
+
+class TokenCacheEntry:
+    __slots__ = ("claims", "exp", "auth_id", "user", "user_expires_at")
+
+    def __init__(self, claims: dict):
+        self.claims = claims
+        self.exp = claims.get("exp", 0)
+        self.auth_id = claims.get("sub")
+        self.user = None
+        self.user_expires_at = 0.0
+
+
+class TokenCache:
+    """Bounded LRU of verified bearer tokens, keyed by a hash of the token.
+
+    Each entry keeps the decoded claims until the token's `exp` and the
+    resolved user for `user_ttl` seconds, so repeated requests with the same
+    token skip both the RS256 verification and the user lookup.
+    """
+
+    def __init__(self, max_size: int = TOKEN_CACHE_SIZE, user_ttl: float = TOKEN_CACHE_USER_TTL):
+        self.max_size = max_size
+        self.user_ttl = user_ttl
+        self._entries: "OrderedDict[str, TokenCacheEntry]" = OrderedDict()
+        self._keys_by_user: Dict[str, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.user_hits = 0
+        self.user_misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key_for(token: str) -> str:
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def _entry(self, key: str) -> Optional[TokenCacheEntry]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry.exp <= time.time():
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _remove(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_user.get(entry.auth_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry.auth_id]
+
+    def get_claims(self, key: str) -> Optional[dict]:
+        entry = self._entry(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.claims
+
+    def put_claims(self, key: str, claims: dict):
+        if key in self._entries:
+            self._remove(key)
+        entry = TokenCacheEntry(claims)
+        self._entries[key] = entry
+        self._keys_by_user.setdefault(entry.auth_id, set()).add(key)
+        while len(self._entries) > self.max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self.evictions += 1
+
+    def get_user(self, key: str) -> Optional[Any]:
+        entry = self._entry(key)
+        if entry is None or entry.user is None or entry.user_expires_at <= time.monotonic():
+            self.user_misses += 1
+            return None
+        self.user_hits += 1
+        return entry.user
+
+    def put_user(self, key: str, user: Any):
+        entry = self._entries.get(key)
+        if entry is None:
+            return
+        entry.user = user
+        entry.user_expires_at = time.monotonic() + self.user_ttl
+
+    def invalidate_user(self, auth_id: str):
+        """Drop the cached user for every token belonging to `auth_id`"""
+        for key in self._keys_by_user.get(auth_id, ()):
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.user = None
+                entry.user_expires_at = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "user_hits": self.user_hits,
+            "user_misses": self.user_misses,
+            "evictions": self.evictions
+        }
+
+
+token_cache = TokenCache()
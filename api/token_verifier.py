@@ -0,0 +1,88 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from jose import jwk, jwt
+from jose.backends import RSAKey
+
+from utils.logging import logger
+
+# Token verification configuration
+AUTH_VERIFY_MODE = os.environ.get("AUTH_VERIFY_MODE", "inline")
+AUTH_VERIFY_WORKERS = int(os.environ.get("AUTH_VERIFY_WORKERS", min(4, os.cpu_count() or 1)))
+
+VERIFY_MODES = ("inline", "thread", "process")
+
+# Parsed public keys, kept per process so each worker only builds them once
+_constructed_keys: Dict[Tuple[str, str], object] = {}
+
+
+def _construct_key(rsa_key: dict):
+    cache_key = (rsa_key["kid"], rsa_key["n"])
+    key = _constructed_keys.get(cache_key)
+    if key is None:
+        key = jwk.construct(rsa_key, algorithm="RS256")
+        _constructed_keys[cache_key] = key
+    return key
+
+
+def decode_token(token: str, rsa_key: dict, algorithms: List[str], audience: str, issuer: str) -> dict:
+    """Verify the signature and claims of `token`. Runs inline or inside a worker."""
+    return jwt.decode(
+        token,
+        _construct_key(rsa_key),
+        algorithms=algorithms,
+        audience=audience,
+        issuer=issuer
+    )
+
+
+class TokenVerifier:
+    """Runs RS256 verification inline or on a bounded worker pool.
+
+    `inline` is the default: an RS256 verify with the OpenSSL backend takes
+    about 100us, less than handing it to a pool and back costs. `thread` and
+    `process` are opt-in for deployments that measure a benefit, see
+    benchmarks/token_verify.py.
+    """
+
+    def __init__(self, mode: str = AUTH_VERIFY_MODE, workers: int = AUTH_VERIFY_WORKERS):
+        if mode not in VERIFY_MODES:
+            raise ValueError(f"AUTH_VERIFY_MODE must be one of {', '.join(VERIFY_MODES)}, got '{mode}'")
+        self.mode = mode
+        self.workers = max(1, workers)
+        self._executor: Optional[Executor] = None
+
+    def start(self):
+        if self._executor is not None:
+            return
+        # python-jose picks the cryptography (OpenSSL) backend when it is installed
+        if RSAKey.__name__ != "CryptographyRSAKey":
+            logger.warning(f"Slow RSA backend in use ({RSAKey.__name__}), install cryptography")
+        if self.mode == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="jwt-verify")
+        elif self.mode == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        logger.info(f"Token verification: mode={self.mode}, workers={self.workers}, backend={RSAKey.__name__}")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    async def decode(self, token: str, rsa_key: dict, algorithms: List[str], audience: str, issuer: str) -> dict:
+        if self.mode == "inline":
+            return decode_token(token, rsa_key, algorithms, audience, issuer)
+
+        if self._executor is None:
+            self.start()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor,
+            functools.partial(decode_token, token, rsa_key, algorithms, audience, issuer)
+        )
+
+
+token_verifier = TokenVerifier()
@@ -0,0 +1,226 @@
+import asyncio
+import os
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from rapidfuzz import fuzz, process
+
+from repository import UsersRepository
+from utils.logging import logger
+from utils.search import username_key
+
+# Fuzzy username search configuration
+USERNAME_INDEX_REFRESH_INTERVAL = float(os.environ.get("USERNAME_INDEX_REFRESH_INTERVAL", 60))
+USERNAME_FUZZY_BUDGET_MS = float(os.environ.get("USERNAME_FUZZY_BUDGET_MS", 50))
+USERNAME_FUZZY_SCORE_CUTOFF = float(os.environ.get("USERNAME_FUZZY_SCORE_CUTOFF", 60))
+USERNAME_FUZZY_CHUNK_SIZE = int(os.environ.get("USERNAME_FUZZY_CHUNK_SIZE", 20000))
+USERNAME_FUZZY_WORKERS = int(os.environ.get("USERNAME_FUZZY_WORKERS", 1))
+# Share of the character pairs of the shorter of query and username they must have in common to be scored
+USERNAME_FUZZY_MIN_SHARED_BIGRAMS = float(os.environ.get("USERNAME_FUZZY_MIN_SHARED_BIGRAMS", 0.25))
+
+
+def bigram_signature(key: str) -> int:
+    """64-bit set of the character pairs of `key`, hashed one bit each.
+
+    The bit comes from crc32, not the salted string hash, so every worker and
+    restart keeps the same usernames for a query.
+    """
+    padded = f" {key} "
+    signature = 0
+    for i in range(len(padded) - 1):
+        signature |= 1 << (zlib.crc32(padded[i:i + 2].encode()) & 63)
+    return signature
+
+
+class UsernameIndex:
+    """In-process fuzzy index of every registered username.
+
+    Normalized usernames live in one list aligned with a list of auth_ids and
+    an array of bigram signatures, in memory shared by every request of the
+    worker. The lists only grow, so positions returned by a scan stay valid
+    while users are added.
+
+    A search runs on a single dedicated thread and never on the event loop.
+    It first keeps the usernames whose signature shares enough bigrams with
+    the query, a vectorized numpy pass, then scores those with RapidFuzz
+    `cdist`, which releases the GIL, one chunk at a time. The scan stops at
+    the first chunk boundary past its latency budget. Only one scan runs at
+    a time: a search arriving while one is running, a scan that runs out of
+    budget, or an index still loading all return None and the caller falls
+    back to the prefix search.
+    """
+
+    def __init__(
+        self,
+        refresh_interval: float = USERNAME_INDEX_REFRESH_INTERVAL,
+        budget_ms: float = USERNAME_FUZZY_BUDGET_MS,
+        score_cutoff: float = USERNAME_FUZZY_SCORE_CUTOFF,
+        chunk_size: int = USERNAME_FUZZY_CHUNK_SIZE,
+        workers: int = USERNAME_FUZZY_WORKERS,
+        min_shared_bigrams: float = USERNAME_FUZZY_MIN_SHARED_BIGRAMS,
+    ):
+        self.refresh_interval = refresh_interval
+        self.budget = budget_ms / 1000
+        self.score_cutoff = score_cutoff
+        self.chunk_size = max(1, chunk_size)
+        self.workers = workers
+        self.min_shared_bigrams = min_shared_bigrams
+        self.keys: List[str] = []
+        self.auth_ids: List[str] = []
+        # Grown by doubling into a new array, so a running scan keeps a consistent one
+        self._signatures = np.zeros(1024, dtype=np.uint64)
+        self._positions: Dict[str, int] = {}
+        self.loaded = False
+        self.loaded_until: Optional[datetime] = None
+        self.searches = 0
+        self.fallbacks = 0
+        self.busy = 0
+        self._scanning = False
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, auth_id: str, username: str):
+        key = username_key(username)
+        position = self._positions.get(auth_id)
+        if position is None:
+            position = len(self.keys)
+            if position == len(self._signatures):
+                signatures = np.zeros(2 * len(self._signatures), dtype=np.uint64)
+                signatures[:position] = self._signatures
+                self._signatures = signatures
+            self._positions[auth_id] = position
+            self.keys.append(key)
+            self.auth_ids.append(auth_id)
+        else:
+            self.keys[position] = key
+        self._signatures[position] = bigram_signature(key)
+
+    async def load(self, users_repository: UsersRepository):
+        """Add the users registered since the last load, or all of them the first time"""
+        started_at = datetime.utcnow()
+        # Users registered on other workers may carry a slightly older created_at
+        since = self.loaded_until - timedelta(seconds=self.refresh_interval) if self.loaded_until else None
+        count = 0
+        async for user in users_repository.iter_registered(since):
+            self.add(user["auth_id"], user["username"])
+            count += 1
+        self.loaded_until = started_at
+        if not self.loaded:
+            self.loaded = True
+            logger.info(f"Username index loaded with {len(self.keys)} users")
+        elif count:
+            logger.debug(f"Username index refreshed, {count} users added or updated")
+
+    def _candidates(self, key: str, size: int) -> np.ndarray:
+        """Positions of the usernames sharing enough bigrams with `key`.
+
+        Measured against the shorter of the two, so names contained in the
+        query and queries contained in a name, which WRatio scores high,
+        both get through. The required count is rounded down: swapping two
+        letters changes up to three pairs, so with the default share a
+        single transposition still leaves enough for names of three or
+        more characters.
+        """
+        query_signature = bigram_signature(key)
+        signatures = self._signatures[:size]
+        shared = np.bitwise_count(signatures & np.uint64(query_signature))
+        smaller = np.minimum(np.bitwise_count(signatures), bin(query_signature).count("1"))
+        return np.flatnonzero(shared >= np.maximum(1, np.floor(smaller * self.min_shared_bigrams)))
+
+    def _scan(self, key: str, limit: int, deadline: float) -> Optional[List[Tuple[float, int]]]:
+        """Best (score, position) pairs, None if the deadline passed first. Runs on the search thread."""
+        candidates = self._candidates(key, len(self.keys))
+        scored: List[Tuple[float, int]] = []
+        for start in range(0, len(candidates), self.chunk_size):
+            positions = candidates[start:start + self.chunk_size].tolist()
+            scores = process.cdist(
+                [key],
+                [self.keys[position] for position in positions],
+                scorer=fuzz.WRatio,
+                score_cutoff=self.score_cutoff,
+                dtype=np.float32,
+                workers=self.workers
+            )[0]
+            for hit in np.flatnonzero(scores):
+                scored.append((float(scores[hit]), positions[hit]))
+            if time.monotonic() > deadline:
+                return None
+        scored.sort(key=lambda match: (-match[0], match[1]))
+        return scored[:limit]
+
+    async def search(self, query: str, limit: int = 10, exclude: Iterable[str] = ()) -> Optional[List[Tuple[str, float]]]:
+        """Top `limit` (auth_id, score) for a typo-tolerant query, None if the index can't answer"""
+        key = username_key(query)
+        if not self.loaded or not key:
+            return None
+        if self._scanning:
+            # Never queue scans behind each other, the prefix search answers this one
+            self.busy += 1
+            return None
+
+        exclude = set(exclude)
+        self.searches += 1
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="username-search")
+        self._scanning = True
+        try:
+            matches = await asyncio.get_running_loop().run_in_executor(
+                self._executor, self._scan, key, limit + len(exclude), time.monotonic() + self.budget
+            )
+        finally:
+            self._scanning = False
+        if matches is None:
+            self.fallbacks += 1
+            logger.warning(f"Fuzzy username search over {len(self.keys)} users exceeded {self.budget * 1000:.0f}ms")
+            return None
+
+        results = []
+        for score, position in matches:
+            auth_id = self.auth_ids[position]
+            if auth_id in exclude:
+                continue
+            results.append((auth_id, score))
+            if len(results) == limit:
+                break
+        return results
+
+    async def _run(self, users_repository: UsersRepository):
+        while True:
+            try:
+                await self.load(users_repository)
+            except Exception as e:
+                logger.error(f"Username index load failed: {str(e)}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self, users_repository: UsersRepository):
+        """Load the index in the background and keep pulling newly registered users"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(users_repository))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def stats(self) -> dict:
+        return {
+            "loaded": self.loaded,
+            "size": len(self.keys),
+            "searches": self.searches,
+            "fallbacks": self.fallbacks,
+            "busy": self.busy
+        }
+
+
+username_index = UsernameIndex()
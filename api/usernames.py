@@ -0,0 +1,85 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Tuple
+
+from repository import UsersRepository
+
+# Username cache configuration
+USERNAME_CACHE_SIZE = int(os.environ.get("USERNAME_CACHE_SIZE", 50000))
+USERNAME_CACHE_TTL = float(os.environ.get("USERNAME_CACHE_TTL", 600))
+
+
+class UsernameCache:
+    """Bounded LRU of auth_id -> username with a TTL per entry"""
+
+    def __init__(self, max_size: int = USERNAME_CACHE_SIZE, ttl: float = USERNAME_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, auth_ids: Iterable[str]) -> Tuple[Dict[str, str], List[str]]:
+        """Split `auth_ids` into cached usernames and ids that must be looked up"""
+        found = {}
+        missing = []
+        now = time.monotonic()
+        for auth_id in auth_ids:
+            entry = self._entries.get(auth_id)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(auth_id)
+                found[auth_id] = entry[0]
+            else:
+                missing.append(auth_id)
+        self.hits += len(found)
+        self.misses += len(missing)
+        return found, missing
+
+    def put(self, auth_id: str, username: str):
+        self._entries[auth_id] = (username, time.monotonic() + self.ttl)
+        self._entries.move_to_end(auth_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, auth_id: str):
+        self._entries.pop(auth_id, None)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+username_cache = UsernameCache()
+
+
+async def resolve_usernames(auth_ids: Iterable[str], users_repository: UsersRepository) -> Dict[str, str]:
+    """Usernames for `auth_ids`, with a single query for the ones not cached"""
+    usernames, missing = username_cache.get_many(set(auth_ids))
+    if missing:
+        users = await users_repository.get_many(missing, {"_id": 0, "auth_id": 1, "username": 1})
+        for user in users:
+            if user.get("username"):
+                usernames[user["auth_id"]] = user["username"]
+                username_cache.put(user["auth_id"], user["username"])
+    return usernames
+
+
+async def enrich_matches(matches: List[dict], users_repository: UsersRepository) -> List[dict]:
+    """Add creator_username and each player's username across the whole result set"""
+    user_ids = set()
+    for match in matches:
+        user_ids.add(match["created_by"])
+        user_ids.update(player["user_id"] for player in match["players"])
+
+    usernames = await resolve_usernames(user_ids, users_repository)
+
+    for match in matches:
+        match["creator_username"] = usernames.get(match["created_by"], "Unknown")
+        for player in match["players"]:
+            player["username"] = usernames.get(player["user_id"], "Unknown")
+    return matches
@@ -0,0 +1,44 @@
+from datetime import datetime, time
+from typing import Optional, Tuple
+
+DATE_FORMATS = ["%Y-%m-%d", "%Y/%m/%d", "%d/%m/%Y", "%d-%m-%Y"]
+TIME_FORMATS = ["%H:%M", "%H:%M:%S", "%I:%M %p"]
+
+
+def parse_date(value: str) -> Optional[datetime]:
+    value = (value or "").strip()
+    for date_format in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format)
+        except ValueError:
+            continue
+    try:
+        # Full ISO timestamps, e.g. 2025-03-01T18:30:00
+        return datetime.fromisoformat(value).replace(tzinfo=None)
+    except ValueError:
+        return None
+
+
+def parse_time(value: str) -> Optional[time]:
+    value = (value or "").strip()
+    for time_format in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, time_format).time()
+        except ValueError:
+            continue
+    return None
+
+
+def parse_played_at(date: str, time_of_day: Optional[str] = None) -> Optional[datetime]:
+    """Normalize the free-form match date and time into a datetime, None if unparseable"""
+    played_on = parse_date(date)
+    if played_on is None:
+        return None
+    parsed_time = parse_time(time_of_day) if time_of_day else None
+    if parsed_time is not None:
+        played_on = datetime.combine(played_on.date(), parsed_time)
+    return played_on
+
+
+def year_range(year: int) -> Tuple[datetime, datetime]:
+    return datetime(year, 1, 1), datetime(year + 1, 1, 1)
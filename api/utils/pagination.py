@@ -0,0 +1,22 @@
+import base64
+import json
+from datetime import datetime
+from typing import Optional, Tuple
+
+
+def encode_cursor(played_at: Optional[datetime], match_id: str) -> str:
+    """Opaque keyset cursor pointing just after (played_at, match_id)"""
+    raw = json.dumps([played_at.isoformat() if played_at else None, match_id], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[Tuple[Optional[datetime], str]]:
+    """Inverse of encode_cursor, None if the cursor is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        played_at, match_id = json.loads(base64.urlsafe_b64decode(padded))
+        if not isinstance(match_id, str):
+            return None
+        return (datetime.fromisoformat(played_at) if played_at else None), match_id
+    except Exception:
+        return None
@@ -0,0 +1,10 @@
+def plan_stages(plan):
+    """Every stage name of a query plan or explain output, depth first"""
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
@@ -0,0 +1,16 @@
+from typing import Optional, Tuple
+
+
+def username_key(username: str) -> str:
+    """Normalized form of a username used for case-insensitive lookups"""
+    return (username or "").strip().casefold()
+
+
+def prefix_range(prefix: str) -> Tuple[str, Optional[str]]:
+    """Bounds [lower, upper) of every string starting with `prefix`, None if unbounded"""
+    if not prefix:
+        return "", None
+    last = ord(prefix[-1])
+    if last >= 0x10FFFF:
+        return prefix, None
+    return prefix, prefix[:-1] + chr(last + 1)